@@ -1 +1,2 @@
-from richinput import get_char, get_rich_char, RichLine, RichPassword
\ No newline at end of file
+from richinput import get_char, get_rich_char, RichLine, RichPassword, MultiLine, \
+                      InputTimeout
\ No newline at end of file
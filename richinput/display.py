@@ -0,0 +1,166 @@
+"""Show the text of an IndexedLine differently from how it's stored.
+
+A DisplayTransform turns each edit of the text into an edit of what is
+shown, so the terminal is updated only where the shown text changed (see
+richinput.TransformRenderer). Edits are tuples (position, removed,
+inserted), with the number of characters removed and inserted at position.
+"""
+
+from __future__ import print_function
+
+def merge_edits(first, second):
+    """Return the edit covering `first` followed by `second` (either may be
+    None)."""
+    if first is None or second is None:
+        return first or second
+
+    pos1, removed1, inserted1 = first
+    pos2, removed2, inserted2 = second
+    start = min(pos1, pos2)
+    # the end of both edits, on the text between them
+    end = max(pos1 + inserted1, pos2 + removed2)
+    return (start, end - inserted1 + removed1 - start,
+            end - removed2 + inserted2 - start)
+
+class DisplayTransform(object):
+    """Base class of the transforms used by RichLine.
+
+    `source` is the text of the IndexedLine, `text` what is shown.
+    Subclasses implement `update`, and `to_display`/`to_buffer` if they
+    change the length of the text. The changes not caused by an edit
+    (e.g. revealing a masked character) are reported with `_changed`.
+    """
+
+    def __init__(self, text=u''):
+        self.reset(text)
+
+    def reset(self, text):
+        """Show `text` from scratch."""
+        self.source = u''
+        self.text = u''
+        self.changes = None
+        self.update(text, 0, 0, len(text))
+        self.changes = None
+
+    def update(self, text, pos, removed, inserted):
+        """The source became `text`, with an edit at `pos`. Update `text`
+        and return the edit of the shown text."""
+        raise NotImplementedError
+
+    def to_display(self, idx):
+        """Return the index in the shown text of the source index `idx`."""
+        return idx
+
+    def to_buffer(self, idx):
+        """Return the index in the source of the shown index `idx`."""
+        return min(idx, len(self.source))
+
+    def _changed(self, edit):
+        self.changes = merge_edits(self.changes, edit)
+
+    def take_changes(self):
+        """Return and forget the edit of the shown text made outside of
+        `update`, or None."""
+        changes, self.changes = self.changes, None
+        return changes
+
+class Mask(DisplayTransform):
+    """Show every character as `char`, e.g. for passwords.
+
+    With `reveal_inserted` the latest typed character is shown in clear
+    until the next edit or `hide`; `set_clear` shows the whole text.
+    """
+
+    def __init__(self, text=u'', char=u'*', reveal_inserted=False):
+        self.char = char
+        self.reveal_inserted = False
+        self.clear = False
+        self.revealed = None # (start, end) of the source shown in clear
+        super(Mask, self).__init__(text)
+        self.reveal_inserted = reveal_inserted
+
+    def update(self, text, pos, removed, inserted):
+        hidden = self._set_revealed(None)
+        self.source = text
+        if self.reveal_inserted and inserted:
+            self.revealed = (pos + inserted - 1, pos + inserted)
+        self.text = self.text[:pos] + self._show(pos, pos + inserted) + \
+                    self.text[pos + removed:]
+        return merge_edits(hidden, (pos, removed, inserted))
+
+    def _show(self, start, end):
+        """Return how source[start:end] is shown."""
+        if self.clear:
+            return self.source[start:end]
+
+        shown = self.char * (end - start)
+        if self.revealed:
+            first, last = max(start, self.revealed[0]), min(end, self.revealed[1])
+            if first < last:
+                shown = shown[:first - start] + self.source[first:last] + \
+                        shown[last - start:]
+        return shown
+
+    def _set_revealed(self, revealed):
+        spans = [span for span in (self.revealed, revealed) if span]
+        self.revealed = revealed
+        if not spans or self.clear:
+            return None
+
+        start = min(span[0] for span in spans)
+        end = min(len(self.source), max(span[1] for span in spans))
+        if start >= end:
+            return None
+        self.text = self.text[:start] + self._show(start, end) + self.text[end:]
+        return (start, end - start, end - start)
+
+    def reveal(self, start, end):
+        """Show source[start:end] in clear, masking what was revealed
+        before."""
+        self._changed(self._set_revealed((start, end)))
+
+    def hide(self):
+        """Mask what was revealed."""
+        self._changed(self._set_revealed(None))
+
+    def set_clear(self, clear):
+        """Show the whole text in clear, or masked."""
+        if clear != self.clear:
+            self.clear = clear
+            self.text = self._show(0, len(self.source))
+            self._changed((0, len(self.text), len(self.text)))
+
+class Grouping(DisplayTransform):
+    """Show the text in groups of `size` characters divided by `separator`,
+    e.g. u'1234 5678 9012 3456' for a credit card number."""
+
+    def __init__(self, text=u'', size=4, separator=u' '):
+        self.size = size
+        self.separator = separator
+        super(Grouping, self).__init__(text)
+
+    def update(self, text, pos, removed, inserted):
+        self.source = text
+        # the groups before the edited one don't move
+        start = pos - pos % self.size
+        shown_start = self.to_display(start) if start else 0
+        rest = text[start:]
+        groups = [rest[i:i + self.size] for i in range(0, len(rest), self.size)]
+        shown = self.separator.join(groups)
+        if start and rest:
+            shown = self.separator + shown
+
+        # what comes before `pos` is still the same
+        shown_pos = self.to_display(pos)
+        removed = len(self.text) - shown_pos
+        self.text = self.text[:shown_start] + shown
+        return (shown_pos, removed, len(self.text) - shown_pos)
+
+    def to_display(self, idx):
+        # the cursor after the last character of a group stays before
+        # the separator
+        return idx + (idx - 1) // self.size * len(self.separator) if idx else 0
+
+    def to_buffer(self, idx):
+        group, col = divmod(idx, self.size + len(self.separator))
+        return min(group * self.size + min(col, self.size), len(self.source))
@@ -0,0 +1,308 @@
+"""Grapheme cluster segmentation (Unicode Standard Annex #29), used to move
+the cursor and delete whole user perceived characters, e.g. a letter with
+its combining marks, a flag or an emoji ZWJ sequence.
+
+The Grapheme_Cluster_Break property isn't available in `unicodedata`, so
+it is derived from the general category plus the ranges below, and cached
+per character.
+"""
+
+from __future__ import print_function
+
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+# Grapheme_Cluster_Break values
+OTHER, CR, LF, CONTROL, EXTEND, ZWJ, REGIONAL_INDICATOR, PREPEND, \
+    SPACING_MARK, L, V, T, LV, LVT = range(14)
+
+# flag added to the property of the Extended_Pictographic characters
+EXTENDED_PICTOGRAPHIC = 32
+
+PREPEND_RANGES = [
+    (0x0600, 0x0605), (0x06DD, 0x06DD), (0x070F, 0x070F), (0x0890, 0x0891),
+    (0x08E2, 0x08E2), (0x0D4E, 0x0D4E), (0x110BD, 0x110BD),
+    (0x110CD, 0x110CD), (0x111C2, 0x111C3), (0x1193F, 0x1193F),
+    (0x11941, 0x11941), (0x11A3A, 0x11A3A), (0x11A84, 0x11A89),
+    (0x11D46, 0x11D46),
+]
+
+EXTENDED_PICTOGRAPHIC_RANGES = [
+    (0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x203C, 0x203C), (0x2049, 0x2049),
+    (0x2122, 0x2122), (0x2139, 0x2139), (0x2194, 0x2199), (0x21A9, 0x21AA),
+    (0x231A, 0x231B), (0x2328, 0x2328), (0x2388, 0x2388), (0x23CF, 0x23CF),
+    (0x23E9, 0x23F3), (0x23F8, 0x23FA), (0x24C2, 0x24C2), (0x25AA, 0x25AB),
+    (0x25B6, 0x25B6), (0x25C0, 0x25C0), (0x25FB, 0x25FE), (0x2600, 0x2605),
+    (0x2607, 0x2612), (0x2614, 0x2685), (0x2690, 0x2705), (0x2708, 0x2712),
+    (0x2714, 0x2714), (0x2716, 0x2716), (0x271D, 0x271D), (0x2721, 0x2721),
+    (0x2728, 0x2728), (0x2733, 0x2734), (0x2744, 0x2744), (0x2747, 0x2747),
+    (0x274C, 0x274C), (0x274E, 0x274E), (0x2753, 0x2755), (0x2757, 0x2757),
+    (0x2763, 0x2767), (0x2795, 0x2797), (0x27A1, 0x27A1), (0x27B0, 0x27B0),
+    (0x27BF, 0x27BF), (0x2934, 0x2935), (0x2B05, 0x2B07), (0x2B1B, 0x2B1C),
+    (0x2B50, 0x2B50), (0x2B55, 0x2B55), (0x3030, 0x3030), (0x303D, 0x303D),
+    (0x3297, 0x3297), (0x3299, 0x3299), (0x1F000, 0x1F0FF),
+    (0x1F10D, 0x1F10F), (0x1F12F, 0x1F12F), (0x1F16C, 0x1F171),
+    (0x1F17E, 0x1F17F), (0x1F18E, 0x1F18E), (0x1F191, 0x1F19A),
+    (0x1F1AD, 0x1F1E5), (0x1F201, 0x1F20F), (0x1F21A, 0x1F21A),
+    (0x1F22F, 0x1F22F), (0x1F232, 0x1F23A), (0x1F23C, 0x1F23F),
+    (0x1F249, 0x1F3FA), (0x1F400, 0x1F53D), (0x1F546, 0x1F64F),
+    (0x1F680, 0x1F6FF), (0x1F774, 0x1F77F), (0x1F7D5, 0x1F7FF),
+    (0x1F80C, 0x1F80F), (0x1F848, 0x1F84F), (0x1F85A, 0x1F85F),
+    (0x1F888, 0x1F88F), (0x1F8AE, 0x1F8FF), (0x1F90C, 0x1F93A),
+    (0x1F93C, 0x1F945), (0x1F947, 0x1FAFF), (0x1FC00, 0x1FFFD),
+]
+
+def _in_ranges(cp, ranges, starts):
+    i = bisect_right(starts, cp) - 1
+    return i >= 0 and cp <= ranges[i][1]
+
+_PREPEND_STARTS = [start for start, end in PREPEND_RANGES]
+_EXTENDED_PICTOGRAPHIC_STARTS = [start for start, end in EXTENDED_PICTOGRAPHIC_RANGES]
+
+def _compute_property(c):
+    cp = ord(c)
+    flag = EXTENDED_PICTOGRAPHIC if _in_ranges(
+        cp, EXTENDED_PICTOGRAPHIC_RANGES, _EXTENDED_PICTOGRAPHIC_STARTS) else 0
+
+    if c == u'\r':
+        return CR
+    if c == u'\n':
+        return LF
+    if cp == 0x200D:
+        return ZWJ
+    if 0x1F1E6 <= cp <= 0x1F1FF:
+        return REGIONAL_INDICATOR
+    if 0x1F3FB <= cp <= 0x1F3FF or cp == 0x200C or 0xE0020 <= cp <= 0xE007F \
+       or 0xFF9E <= cp <= 0xFF9F:
+        # emoji modifiers, ZWNJ, tags, halfwidth katakana sound marks
+        return EXTEND
+
+    # Hangul
+    if 0x1100 <= cp <= 0x115F or 0xA960 <= cp <= 0xA97C:
+        return L
+    if 0x1160 <= cp <= 0x11A7 or 0xD7B0 <= cp <= 0xD7C6:
+        return V
+    if 0x11A8 <= cp <= 0x11FF or 0xD7CB <= cp <= 0xD7FB:
+        return T
+    if 0xAC00 <= cp <= 0xD7A3:
+        return LV if (cp - 0xAC00) % 28 == 0 else LVT
+
+    if _in_ranges(cp, PREPEND_RANGES, _PREPEND_STARTS):
+        return PREPEND
+
+    category = unicodedata.category(c)
+    if category in ('Mn', 'Me'):
+        return EXTEND | flag
+    if category in ('Cc', 'Cf', 'Zl', 'Zp'):
+        return CONTROL
+    if category == 'Mc' or cp in (0x0E33, 0x0EB3):
+        return SPACING_MARK
+
+    return OTHER | flag
+
+_properties = {}
+
+def get_property(c):
+    """Return the Grapheme_Cluster_Break property of `c`, possibly with
+    the EXTENDED_PICTOGRAPHIC flag."""
+    try:
+        return _properties[c]
+    except KeyError:
+        prop = _properties[c] = _compute_property(c)
+        return prop
+
+def is_boundary(text, i):
+    """Check whether there is a grapheme cluster boundary before `text[i]`."""
+    if i <= 0 or i >= len(text):
+        return True
+
+    before = get_property(text[i - 1])
+    after = get_property(text[i])
+    b = before & ~EXTENDED_PICTOGRAPHIC
+    a = after & ~EXTENDED_PICTOGRAPHIC
+
+    if b == CR and a == LF:                                     # GB3
+        return False
+    if b in (CR, LF, CONTROL) or a in (CR, LF, CONTROL):        # GB4, GB5
+        return True
+    if b == L and a in (L, V, LV, LVT):                         # GB6
+        return False
+    if b in (LV, V) and a in (V, T):                            # GB7
+        return False
+    if b in (LVT, T) and a == T:                                # GB8
+        return False
+    if a in (EXTEND, ZWJ, SPACING_MARK) or b == PREPEND:        # GB9, 9a, 9b
+        return False
+
+    if b == ZWJ and after & EXTENDED_PICTOGRAPHIC:              # GB11
+        j = i - 2
+        while j >= 0 and get_property(text[j]) & ~EXTENDED_PICTOGRAPHIC == EXTEND:
+            j -= 1
+        return not (j >= 0 and get_property(text[j]) & EXTENDED_PICTOGRAPHIC)
+
+    if b == REGIONAL_INDICATOR and a == REGIONAL_INDICATOR:     # GB12, GB13
+        j = i - 1
+        while j >= 0 and get_property(text[j]) == REGIONAL_INDICATOR:
+            j -= 1
+        return (i - 1 - j) % 2 == 0
+
+    return True                                                 # GB999
+
+def iter_boundaries(text, pos=0):
+    """Yield the boundaries of `text` after `pos`, that must be a boundary."""
+    i = pos + 1
+    while i < len(text):
+        if is_boundary(text, i):
+            yield i
+        i += 1
+    if pos < len(text):
+        yield len(text)
+
+def split(text):
+    """Return the grapheme clusters of `text`."""
+    clusters = []
+    start = 0
+    for end in iter_boundaries(text):
+        clusters.append(text[start:end])
+        start = end
+    return clusters
+
+_widths = {}
+
+def get_width(text):
+    """Return the number of columns taken by `text` on the terminal."""
+    width = 0
+    for c in text:
+        try:
+            width += _widths[c]
+        except KeyError:
+            if unicodedata.category(c) in ('Mn', 'Me', 'Cf') or \
+               0x1160 <= ord(c) <= 0x11FF:
+                w = 0
+            elif unicodedata.east_asian_width(c) in ('W', 'F'):
+                w = 2
+            else:
+                w = 1
+            _widths[c] = w
+            width += w
+    return width
+
+def get_column_index(text, pos, columns):
+    """Return the start of the cluster of `text` shown `columns` columns
+    after `pos` (before it if negative), that must be a boundary. Zero-width
+    clusters take no column, wide ones two; the index is clamped to the
+    text."""
+    if columns < 0:
+        while columns < 0 and pos > 0:
+            start = pos - 1
+            while start > 0 and not is_boundary(text, start):
+                start -= 1
+            columns += get_width(text[start:pos])
+            pos = start
+        return pos
+
+    for end in iter_boundaries(text, pos):
+        width = get_width(text[pos:end])
+        if columns <= 0 or columns < width:
+            break
+        columns -= width
+        pos = end
+    return pos
+
+class ClusterIndex(object):
+    """The grapheme cluster boundaries of a text, updated around each edit.
+
+    The boundaries are split at a gap, moved to each edit: those before it
+    are kept as indexes, those after it as distances from the end of the
+    text, that an edit before them doesn't change. Editing where the
+    previous edit was (e.g. typing) is O(1) amortized, moving the gap costs
+    the clusters it crosses."""
+
+    def __init__(self, text=u''):
+        self.size = len(text)
+        self._before = [0] + list(iter_boundaries(text))
+        # distances from the end, the nearest boundary to the gap last
+        self._after = []
+        # index of the latest boundary looked up
+        self._hint = 0
+
+    def __len__(self):
+        return len(self._before) + len(self._after)
+
+    def __getitem__(self, i):
+        """Return the `i`-th boundary."""
+        before = self._before
+        if i < len(before):
+            return before[i]
+        return self.size - self._after[len(before) + len(self._after) - 1 - i]
+
+    def _find(self, idx):
+        """Return the index of the last boundary <= idx."""
+        hint = self._hint
+        count = len(self)
+        # cursor movements usually look up a boundary next to the previous one
+        for i in (hint, hint + 1, hint - 1):
+            if 0 <= i < count and self[i] <= idx and \
+               (i + 1 == count or self[i + 1] > idx):
+                self._hint = i
+                return i
+
+        before, after = self._before, self._after
+        if not after or self.size - after[-1] > idx:
+            self._hint = max(0, bisect_right(before, idx) - 1)
+        else:
+            # the distances >= size - idx are the boundaries <= idx
+            self._hint = len(before) - 1 + len(after) - \
+                bisect_left(after, self.size - idx)
+        return self._hint
+
+    def floor(self, idx):
+        """Return the start of the cluster containing `idx`."""
+        return self[self._find(idx)]
+
+    def previous(self, idx, steps=1):
+        """Return the boundary `steps` clusters before `idx`."""
+        i = self._find(idx)
+        if self[i] < idx:
+            # `idx` is in the middle of a cluster
+            steps -= 1
+        return self[max(0, i - steps)]
+
+    def next(self, idx, steps=1):
+        """Return the boundary `steps` clusters after `idx`."""
+        i = self._find(idx)
+        return self[min(len(self) - 1, i + steps)]
+
+    def _move_gap(self, pos):
+        """Leave before the gap the boundaries < pos (and 0)."""
+        before, after, size = self._before, self._after, self.size
+        while len(before) > 1 and before[-1] >= pos:
+            after.append(size - before.pop())
+        while after and size - after[-1] < pos:
+            before.append(size - after.pop())
+
+    def update(self, text, pos, removed, inserted):
+        """Update the boundaries after the edit that produced `text` replacing
+        `removed` characters at `pos` with `inserted` characters."""
+        self._move_gap(pos)
+        before, after = self._before, self._after
+        old_size, size = self.size, len(text)
+
+        # the old boundaries in the removed text are gone
+        while after and old_size - after[-1] < pos + removed:
+            after.pop()
+
+        # the character before the edit may join the inserted ones
+        for boundary in iter_boundaries(text, before[-1]):
+            while after and size - after[-1] < boundary:
+                after.pop()
+            if boundary > pos + inserted and after and \
+               size - after[-1] == boundary:
+                # back in sync
+                break
+            before.append(boundary)
+        else:
+            del after[:]
+
+        self.size = size
+        self._hint = len(before) - 1
@@ -0,0 +1,198 @@
+from __future__ import print_function
+
+import re
+from itertools import islice
+from bisect import bisect_left, bisect_right
+
+class Highlighter(object):
+    """Base class of the highlighters used by RichLine.
+
+    Subclasses implement `lex`, that must be able to restart lexing from
+    the start of any token it produced before, with the same result.
+    """
+
+    # how many tokens before the edited one may be affected by an edit
+    # (e.g. a pattern matching quoted strings may span several tokens
+    # before the closing quote is typed, so it needs a bigger value)
+    backtrack = 1
+
+    def lex(self, text, pos):
+        """Yield the tokens of `text` starting at `pos`, as tuples
+        (start, end, style). `style` is a style.Style, an escape
+        sequence or None."""
+        raise NotImplementedError
+
+class RegexHighlighter(Highlighter):
+    """Highlighter for a list of rules (style, pattern). The text not matched
+    by any pattern has no style."""
+
+    def __init__(self, rules, flags=0):
+        self.styles = {}
+        patterns = []
+        group = 1
+        for style, pattern in rules:
+            self.styles[group] = style
+            patterns.append(u'(%s)' % pattern)
+            group += 1 + re.compile(pattern).groups
+
+        self.regex = re.compile(u'|'.join(patterns), flags)
+
+    def lex(self, text, pos):
+        search = self.regex.search
+        while pos < len(text):
+            match = search(text, pos)
+            if not match:
+                yield (pos, len(text), None)
+                return
+
+            start, end = match.span()
+            if start > pos:
+                yield (pos, start, None)
+            if end == start:
+                # empty match, skip a character
+                end = start + 1
+                yield (start, end, None)
+            else:
+                yield (start, end, self.styles[match.lastindex])
+            pos = end
+
+class Tokenization(object):
+    """The tokens of `text` according to `highlighter`, kept up to date
+    re-lexing only the part of the text touched by each edit.
+
+    As in grapheme.ClusterIndex the tokens are split at a gap, moved to
+    each edit: those after it are kept as distances from the end of the
+    text, that the edits before them don't change, so an edit costs what
+    is re-lexed plus the tokens the gap crosses."""
+
+    def __init__(self, highlighter, text=u''):
+        self.highlighter = highlighter
+        self.text = text
+        self._before = list(highlighter.lex(text, 0))
+        self._starts = [token[0] for token in self._before]
+        # (size - start, size - end, style), the nearest to the gap last
+        self._after = []
+        self._distances = [] # of the starts in `_after`
+
+    def __len__(self):
+        return len(self._before) + len(self._after)
+
+    def __getitem__(self, i):
+        """Return the `i`-th token."""
+        before = self._before
+        if i < len(before):
+            return before[i]
+        start, end, style = self._after[len(self) - 1 - i]
+        size = len(self.text)
+        return size - start, size - end, style
+
+    @property
+    def tokens(self):
+        """All the tokens, as a list."""
+        return [self[i] for i in range(len(self))]
+
+    def _count(self, pos):
+        """Return how many tokens start at or before `pos`."""
+        distances = self._distances
+        size = len(self.text)
+        if not distances or size - distances[-1] > pos:
+            return bisect_right(self._starts, pos)
+        return len(self._before) + len(distances) - bisect_left(distances, size - pos)
+
+    def _move_gap(self, i):
+        """Leave the first `i` tokens before the gap."""
+        before, starts = self._before, self._starts
+        after, distances = self._after, self._distances
+        size = len(self.text)
+        while len(before) > i:
+            start, end, style = before.pop()
+            starts.pop()
+            after.append((size - start, size - end, style))
+            distances.append(size - start)
+        while len(before) < i and after:
+            start, end, style = after.pop()
+            distances.pop()
+            before.append((size - start, size - end, style))
+            starts.append(size - start)
+
+    def _pop_after(self, size):
+        """Remove the first token after the gap and return it, with its
+        positions in a text `size` long."""
+        start, end, style = self._after.pop()
+        self._distances.pop()
+        return size - start, size - end, style
+
+    def update(self, text, pos, removed, inserted):
+        """Update the tokens after the edit that produced `text` replacing
+        `removed` characters at `pos` with `inserted` characters.
+        Return the range (start, end) of `text` whose contents or styles
+        changed. The rest of the text only moved by inserted - removed."""
+        old_size, size = len(self.text), len(text)
+
+        # restart from the token containing the character before the edit
+        # (the edit may extend it), backtracking a bit more if needed
+        first = max(0, self._count(pos - 1) - 1 - self.highlighter.backtrack)
+        self._move_gap(first)
+        after, distances = self._after, self._distances
+        restart = old_size - distances[-1] if distances else 0
+
+        # the old tokens before the edit, to find what is restyled
+        head = []
+        while distances and old_size - distances[-1] < pos:
+            head.append(self._pop_after(old_size))
+        # those inside the removed text are gone
+        while distances and old_size - distances[-1] < pos + removed:
+            self._pop_after(old_size)
+
+        relexed = []
+        for token in self.highlighter.lex(text, restart):
+            start = token[0]
+            while distances and size - distances[-1] < start:
+                self._pop_after(size)
+
+            if start >= pos + inserted and distances:
+                d_start, d_end, style = after[-1]
+                if (size - d_start, size - d_end, style) == token:
+                    # back in sync, the remaining tokens are the same
+                    break
+
+            relexed.append(token)
+        else:
+            del after[:]
+            del distances[:]
+
+        self._before += relexed
+        self._starts += [token[0] for token in relexed]
+        self.text = text
+
+        damage_start = self._first_difference(head, relexed, pos)
+        damage_end = max(relexed[-1][1] if relexed else 0, pos + inserted)
+        return damage_start, damage_end
+
+    @staticmethod
+    def _first_difference(old, relexed, pos):
+        """Return the first position before `pos` whose style differs
+        between the `old` tokens and `relexed`, or `pos` if there is none."""
+        idx = 0
+        for start, end, style in relexed:
+            if start >= pos:
+                break
+            while idx < len(old) and old[idx][1] <= start:
+                idx += 1
+            for old_start, old_end, old_style in islice(old, idx, None):
+                if old_start >= min(end, pos):
+                    break
+                if old_style != style:
+                    return max(start, old_start)
+        return pos
+
+    def iter_tokens(self, start, end):
+        """Yield the tokens overlapping the range (start, end), clipped to it."""
+        i = max(0, self._count(start) - 1)
+        while i < len(self):
+            token_start, token_end, style = self[i]
+            if token_start >= end:
+                break
+            if token_end > start:
+                yield max(start, token_start), min(end, token_end), style
+            i += 1
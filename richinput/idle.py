@@ -0,0 +1,65 @@
+"""Work done while the user isn't typing (see RichLine's `idle`)."""
+
+from __future__ import print_function
+
+from collections import deque
+
+class IdleQueue(object):
+    """Jobs run by the input loop when no input is pending, once `delay`
+    seconds have passed since the latest key.
+
+    A job is a callable, run in one go, or an iterator (e.g. a generator),
+    advanced one step at a time: input is checked between the steps, so a
+    long job gives way to the next key press and resumes at the next pause.
+    Jobs run in the order they were added. A job added with the `key` of a
+    job still waiting takes its place (e.g. only the latest validation of
+    the input matters).
+
+    >>> def validate():
+    ...     for i, line in enumerate(lines):
+    ...         check(line)
+    ...         yield
+    >>> richline.idle.add(validate(), key='validate')
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.jobs = deque() # [key, job]
+        self.error = None # the latest exception raised by a job
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, job, key=None):
+        if key is not None:
+            for entry in self.jobs:
+                if entry[0] == key:
+                    entry[1] = job
+                    return
+        self.jobs.append([key, job])
+
+    def discard(self, key):
+        """Forget the job added with `key`, if it's waiting."""
+        self.jobs = deque(entry for entry in self.jobs if entry[0] != key)
+
+    def clear(self):
+        self.jobs.clear()
+
+    def run(self, is_stale=lambda: False):
+        """Run the jobs until they are done or `is_stale()` (e.g. some input
+        is pending) is True. Return True if no job is left."""
+        jobs = self.jobs
+        while jobs and not is_stale():
+            job = jobs[0][1]
+            try:
+                if hasattr(job, '__next__') or hasattr(job, 'next'):
+                    next(job)
+                    continue
+                job()
+            except StopIteration:
+                pass
+            except Exception as e:
+                self.error = e
+            if jobs and jobs[0][1] is job:
+                jobs.popleft()
+        return not jobs
@@ -0,0 +1,213 @@
+"""Key bindings of RichLine.
+
+A Keymap maps the name of a key (see `get_key`) to an action, a function
+called as action(richline, key_event) that edits `richline.iline`, or to
+another Keymap for multi-key chords (e.g. C-x followed by Backspace).
+"""
+
+from __future__ import print_function
+
+import re
+
+from grapheme import get_column_index
+
+# names of the keys pressed with modifiers, by mask of terminfo.MOD_*,
+# e.g. 'C-kcuf1' is Ctrl+Right
+MODIFIER_PREFIXES = tuple(
+    u''.join(prefix for bit, prefix in ((4, u'C-'), (2, u'M-'), (8, u's-'), (1, u'S-'))
+             if mask & bit)
+    for mask in range(16))
+
+# the name of every mouse report
+MOUSE = u'mouse'
+
+def get_key(key_event):
+    """Return the name of the key of `key_event`: the capname for escape
+    sequences (with a prefix for the modifiers, e.g. 'C-kcuf1'), the
+    sequence itself if it isn't a known capability (e.g. u'\\x1bf' for
+    Alt+f), MOUSE for mouse reports, the character otherwise."""
+    capability = getattr(key_event, 'capability', None)
+    if capability is not None:
+        if not capability.capname:
+            return key_event.value
+        return MODIFIER_PREFIXES[capability.modifiers] + capability.capname
+    if hasattr(key_event, 'is_click'):
+        return MOUSE
+    return key_event.value
+
+class Keymap(dict):
+    """Dict from key names to actions or to other Keymaps (chords)."""
+
+    def bind(self, keys, action):
+        """Bind `keys`, a key name or a sequence of key names (a chord), to
+        `action`."""
+        if not isinstance(keys, (list, tuple)):
+            keys = (keys,)
+
+        table = self
+        for key in keys[:-1]:
+            if not isinstance(table.get(key), Keymap):
+                table[key] = Keymap()
+            table = table[key]
+        table[keys[-1]] = action
+
+    def copy(self):
+        """Return a copy, that can be changed without affecting this one."""
+        return Keymap((key, action.copy() if isinstance(action, Keymap) else action)
+                      for key, action in self.items())
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+def find_word_end(text, idx, count=1):
+    """Return the end of the `count`-th word after `idx`."""
+    for i in range(count):
+        match = WORD.search(text, idx)
+        if not match:
+            return len(text)
+        idx = match.end()
+    return idx
+
+def find_word_start(text, idx, count=1):
+    """Return the start of the `count`-th word before `idx`."""
+    starts = [match.start() for match in WORD.finditer(text, 0, idx)]
+    return starts[-count] if len(starts) >= count else 0
+
+# actions
+
+def insert(richline, key_event):
+    richline.iline.insert(key_event.value)
+
+def backward_char(richline, key_event):
+    richline.iline.move_cursor_backward(key_event.count)
+
+def forward_char(richline, key_event):
+    richline.iline.move_cursor_forward(key_event.count)
+
+def previous_line(richline, key_event):
+    richline.iline.move_cursor_up(key_event.count)
+
+def next_line(richline, key_event):
+    richline.iline.move_cursor_down(key_event.count)
+
+def beginning_of_line(richline, key_event):
+    richline.iline.move_cursor_home()
+
+def end_of_line(richline, key_event):
+    richline.iline.move_cursor_end()
+
+def backward_word(richline, key_event):
+    iline = richline.iline
+    iline.move_cursor_to(find_word_start(iline.text, iline.idx, key_event.count))
+
+def forward_word(richline, key_event):
+    iline = richline.iline
+    iline.move_cursor_to(find_word_end(iline.text, iline.idx, key_event.count))
+
+def backward_delete_char(richline, key_event):
+    richline.iline.delete_backward(key_event.count)
+
+def delete_char(richline, key_event):
+    richline.iline.delete_forward(key_event.count)
+
+def kill(richline, start, end):
+    """Delete the text between `start` and `end`, keeping it for `yank`."""
+    if start < end:
+        richline.killed = richline.iline.delete(start, end)
+
+def kill_line(richline, key_event):
+    iline = richline.iline
+    start = iline.idx
+    iline.move_cursor_end()
+    end, iline.idx = iline.idx, start
+    kill(richline, start, end)
+
+def backward_kill_line(richline, key_event):
+    iline = richline.iline
+    end = iline.idx
+    iline.move_cursor_home()
+    kill(richline, iline.idx, end)
+
+def kill_word(richline, key_event):
+    iline = richline.iline
+    kill(richline, iline.idx, find_word_end(iline.text, iline.idx, key_event.count))
+
+def backward_kill_word(richline, key_event):
+    iline = richline.iline
+    kill(richline, find_word_start(iline.text, iline.idx, key_event.count), iline.idx)
+
+def yank(richline, key_event):
+    if richline.killed:
+        for i in range(key_event.count):
+            richline.iline.insert(richline.killed)
+
+def undo(richline, key_event):
+    for i in range(key_event.count):
+        richline.iline.undo()
+
+def redo(richline, key_event):
+    for i in range(key_event.count):
+        richline.iline.redo()
+
+def newline(richline, key_event):
+    """Insert a newline, if the input may have many lines (otherwise the
+    newline usually ends the input, see RichLine.read)."""
+    if richline.iline.multiline:
+        richline.iline.insert(u'\n' * key_event.count)
+
+def mouse_click(richline, key_event):
+    """Move the cursor where the user clicked, if it's inside the text."""
+    if key_event.is_click():
+        iline = richline.iline
+        if iline.multiline:
+            iline.move_cursor_to(iline.get_screen_index(key_event.x, key_event.y))
+        else:
+            # the offset is in cells of the shown text
+            transform = richline.transform
+            offset = richline.vterm.get_offset(key_event.x, key_event.y)
+            if transform:
+                idx = get_column_index(transform.text,
+                                       transform.to_display(iline.idx), offset)
+                iline.move_cursor_to(transform.to_buffer(idx))
+            else:
+                iline.move_cursor_to(get_column_index(iline.text, iline.idx, offset))
+
+def interrupt(richline, key_event):
+    """End the input (RichLine stops iterating)."""
+
+def get_emacs_keymap():
+    """Return a new Keymap with the default, Emacs-like, bindings."""
+    keymap = Keymap({
+        u'kcub1': backward_char,
+        u'kcuf1': forward_char,
+        u'kcuu1': previous_line,
+        u'kcud1': next_line,
+        u'khome': beginning_of_line,
+        u'kend': end_of_line,
+        u'kdch1': delete_char,
+        u'C-kcub1': backward_word,
+        u'C-kcuf1': forward_word,
+        u'\x01': beginning_of_line,     # C-a
+        u'\x02': backward_char,         # C-b
+        u'\x04': interrupt,             # C-d
+        u'\x05': end_of_line,           # C-e
+        u'\x06': forward_char,          # C-f
+        u'\x08': backward_delete_char,  # C-h
+        u'\x7f': backward_delete_char,  # Backspace
+        u'\x0b': kill_line,             # C-k
+        u'\x0e': next_line,             # C-n
+        u'\x10': previous_line,         # C-p
+        u'\x15': backward_kill_line,    # C-u
+        u'\x17': backward_kill_word,    # C-w
+        u'\x19': yank,                  # C-y
+        u'\x1f': undo,                  # C-_
+        u'\x1b_': redo,                 # M-_
+        u'\x1bb': backward_word,        # M-b
+        u'\x1bf': forward_word,         # M-f
+        u'\x1bd': kill_word,            # M-d
+        u'\x1b\x7f': backward_kill_word, # M-Backspace
+        u'\n': newline,
+        MOUSE: mouse_click,
+    })
+    keymap.bind((u'\x18', u'\x7f'), backward_kill_line) # C-x Backspace
+    keymap.bind((u'\x18', u'\x15'), undo)               # C-x C-u
+    return keymap
@@ -0,0 +1,152 @@
+from __future__ import print_function
+
+class FenwickTree(object):
+    """Prefix sums over a list of non negative integers, with O(log n)
+    updates and lookups."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.tree = [0] + self.values
+        size = len(self.tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.values)
+
+    def set(self, i, value):
+        delta = value - self.values[i]
+        self.values[i] = value
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """Return the sum of the first `i` values."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, total):
+        """Return the index of the value containing the position `total`,
+        i.e. the greatest `i` such that prefix(i) <= total, and prefix(i).
+        If `total` is past the end, the index returned is len(self)."""
+        i = 0
+        step = 1
+        while step * 2 < len(self.tree):
+            step *= 2
+
+        while step:
+            if i + step < len(self.tree) and self.tree[i + step] <= total:
+                i += step
+                total -= self.tree[i]
+            step //= 2
+
+        return i, self.prefix(i)
+
+class LineIndex(object):
+    """Index of the lines of a text, and of the rows they take on a
+    terminal `width` columns wide. The first line starts at column
+    `offset` (e.g. after a prompt).
+
+    Positions are (row, col), 0-based and relative to the start of the text,
+    following the same wrapping rules as VTerm: the cursor moves to the
+    next row as soon as a row is full. The newline ending a line that fills
+    its last row doesn't add a row (it moves out of the pending wrap), so
+    the end of such a line is shown at the start of the next one; only the
+    last line takes the extra row, where the cursor goes after it.
+    """
+
+    def __init__(self, text=u'', width=80, offset=0):
+        self.width = max(1, width)
+        self.offset = offset
+        self.lengths = [len(line) for line in text.split(u'\n')]
+        self._rebuild()
+
+    def _rebuild(self):
+        # each line takes its length plus the newline
+        self.chars = FenwickTree(length + 1 for length in self.lengths)
+        self.rows = FenwickTree(self._count_rows(i, length)
+                                for i, length in enumerate(self.lengths))
+
+    def _count_rows(self, line, length):
+        cells = length + (self.offset if line == 0 else 0)
+        if line < len(self.lengths) - 1:
+            return max(1, -(-cells // self.width))
+        return cells // self.width + 1
+
+    def set_width(self, width, offset=None):
+        """Update the index after the terminal has been resized."""
+        self.width = max(1, width)
+        if offset is not None:
+            self.offset = offset
+        self.rows = FenwickTree(self._count_rows(i, length)
+                                for i, length in enumerate(self.lengths))
+
+    def update(self, text, pos, removed, inserted):
+        """Update the index after the edit that produced `text` replacing
+        `removed` characters at `pos` with `inserted` characters.
+        Editing inside a line costs O(log n), adding or removing lines
+        O(n)."""
+        first, first_start = self.chars.find(pos)
+        last, last_start = self.chars.find(pos + removed)
+        first = min(first, len(self.lengths) - 1)
+        last = min(last, len(self.lengths) - 1)
+
+        if first == last and u'\n' not in text[pos:pos + inserted]:
+            self._set_length(first, self.lengths[first] + inserted - removed)
+            return
+
+        end = last_start + self.lengths[last] + inserted - removed
+        lines = [len(line) for line in text[first_start:end].split(u'\n')]
+
+        if len(lines) == last - first + 1:
+            for i, length in enumerate(lines):
+                self._set_length(first + i, length)
+        else:
+            self.lengths[first:last + 1] = lines
+            self._rebuild()
+
+    def _set_length(self, line, length):
+        self.lengths[line] = length
+        self.chars.set(line, length + 1)
+        self.rows.set(line, self._count_rows(line, length))
+
+    def get_line(self, idx):
+        """Return the line containing the index `idx` and its start."""
+        line, start = self.chars.find(idx)
+        if line >= len(self.lengths):
+            line = len(self.lengths) - 1
+            start = self.chars.prefix(line)
+        return line, start
+
+    def get_position(self, idx, end_of_row=False):
+        """Return the (row, col) where the character at `idx` is shown.
+        If `end_of_row` is True, the end of a line that fills its last row
+        is past the end of that row instead of at the start of the next."""
+        line, start = self.get_line(idx)
+        col = idx - start + (self.offset if line == 0 else 0)
+        if end_of_row and idx > start and col % self.width == 0:
+            return self.rows.prefix(line) + col // self.width - 1, self.width
+        return self.rows.prefix(line) + col // self.width, col % self.width
+
+    def get_index(self, row, col):
+        """Return the index closest to the position (row, col)."""
+        line, first_row = self.rows.find(max(0, row))
+        if line >= len(self.lengths):
+            # past the end of the text
+            return self.chars.prefix(len(self.lengths)) - 1
+
+        col = (row - first_row) * self.width + col
+        if line == 0:
+            col -= self.offset
+
+        return self.chars.prefix(line) + max(0, min(col, self.lengths[line]))
+
+    def get_row_count(self):
+        return self.rows.prefix(len(self.lengths))
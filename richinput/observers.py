@@ -0,0 +1,97 @@
+from __future__ import print_function
+
+import threading
+from collections import deque
+
+class AsyncObserver(object):
+    """Run `observer` on a separate thread, so that a slow observer (e.g.
+    one logging to a remote service) doesn't delay the echo of the keys.
+
+    `observer` is called as
+        observer(key_events, previous, current, prev_idx, next_idx)
+    where `key_events` is a list of key events (more than one when they
+    have been merged, see below). Observers can't modify the input: use a
+    callback for that.
+
+    At most `maxsize` notifications wait for the observer. When they are
+    too many, `policy` decides what happens to a new one:
+    - BLOCK: the input thread waits for the observer to catch up
+    - DROP: the new notification is discarded (see `dropped`)
+    - MERGE: the new notification is merged with the latest one waiting
+    """
+
+    BLOCK = 'block'
+    DROP = 'drop'
+    MERGE = 'merge'
+
+    def __init__(self, observer, maxsize=64, policy=BLOCK):
+        if policy not in (self.BLOCK, self.DROP, self.MERGE):
+            raise ValueError('Unknown policy %r' % policy)
+
+        self.observer = observer
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.error = None # the latest exception raised by the observer
+
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._busy = False
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, key_event, previous, current, prev_idx, next_idx):
+        """Queue a notification for the observer."""
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                if self.policy == self.DROP:
+                    self.dropped += 1
+                    return
+                elif self.policy == self.MERGE:
+                    key_events, previous, _, prev_idx, _ = self._items[-1]
+                    self._items[-1] = (key_events + [key_event], previous,
+                                       current, prev_idx, next_idx)
+                    return
+
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._condition.wait()
+
+            self._items.append(([key_event], previous, current, prev_idx, next_idx))
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._items and not self._closed:
+                    self._condition.wait()
+                if not self._items:
+                    return
+                item = self._items.popleft()
+                self._busy = True
+                self._condition.notify_all()
+
+            try:
+                self.observer(*item)
+            except Exception as e:
+                self.error = e
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def join(self):
+        """Wait until every queued notification has been observed."""
+        with self._condition:
+            while self._items or self._busy:
+                self._condition.wait()
+
+    def close(self, wait=True):
+        """Stop the observer thread once the queue is empty."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            self._thread.join()
@@ -0,0 +1,147 @@
+from __future__ import print_function
+
+import os, sys, errno, select
+
+import terminfo, style
+
+class TermWriter(object):
+    """Collect the output for the terminal in a reusable buffer of bytes and
+    write it on the file descriptor `fd` (stdout by default) with os.write,
+    bypassing the text layer of sys.stdout.
+
+    The escape codes of the capabilities are encoded once and cached.
+
+    The attributes of the text are set with `set_style`, that writes only
+    what changes from the current ones.
+
+    If `synchronized` is True each flush is wrapped in the begin/end
+    synchronized update sequences (DEC private mode 2026), so that the
+    terminal shows the whole frame at once.
+
+    `truecolor` tells whether the terminal takes (r, g, b) colours (see
+    probe.Features); if None it is guessed from $COLORTERM. The colours
+    are otherwise mapped to the `colors` of the terminfo entry.
+    """
+
+    BEGIN_SYNCHRONIZED_UPDATE = b'\x1b[?2026h'
+    END_SYNCHRONIZED_UPDATE = b'\x1b[?2026l'
+
+    # the capabilities used by VTerm and update_vterm, encoded in advance
+    PRELOAD = ('cub1', 'cuf1', 'clr_eos')
+
+    def __init__(self, term, fd=None, encoding=None, synchronized=False,
+                 truecolor=None):
+        self.term = term
+        self.synchronized = synchronized
+        if truecolor is None:
+            truecolor = os.environ.get('COLORTERM') in ('truecolor', '24bit')
+        self.truecolor = truecolor
+        self._colors = None
+        self.fd = sys.stdout.fileno() if fd is None else fd
+        self.encoding = encoding or sys.stdout.encoding or 'utf-8'
+        self.buffer = bytearray()
+        self.caps = {}
+        self.params = {}
+        self.style = style.DEFAULT
+        self.transitions = {} # (from style, to style) -> escape codes
+
+        for name in self.PRELOAD:
+            try:
+                self.get(name)
+            except terminfo.TerminfoError:
+                pass
+
+    def get(self, name):
+        """Return the escape code of the capability `name`, as bytes."""
+        try:
+            return self.caps[name]
+        except KeyError:
+            # terminfo strings are decoded as iso-8859-1, so we get back
+            # the original bytes
+            value = self.term.get(name).value.encode('iso-8859-1')
+            self.caps[name] = value
+            return value
+
+    def has(self, name):
+        """Check whether the terminal has the capability `name`."""
+        try:
+            return bool(self.get(name))
+        except terminfo.TerminfoError:
+            return False
+
+    def cap(self, name, times=1):
+        """Append the escape code of the capability `name`, `times` times."""
+        self.buffer += self.get(name) * times
+
+    def param(self, name, *params):
+        """Append the escape code of the capability `name` with `params`."""
+        key = (name,) + params
+        try:
+            value = self.params[key]
+        except KeyError:
+            value = terminfo.tparm(self.term.get(name).value, *params)
+            value = self.params[key] = value.encode('iso-8859-1')
+        self.buffer += value
+
+    @property
+    def colors(self):
+        """The number of colours of the palette of the terminal."""
+        if self._colors is None:
+            try:
+                self._colors = max(0, self.term.get('colors').value or 0)
+            except terminfo.TerminfoError:
+                self._colors = 0
+        return self._colors
+
+    def set_style(self, new_style):
+        """Append what changes the attributes of the text to `new_style`
+        (a style.Style)."""
+        if new_style == self.style:
+            return
+        key = (self.style, new_style)
+        try:
+            value = self.transitions[key]
+        except KeyError:
+            value = self.transitions[key] = style.get_transition(self, *key)
+        self.buffer += value
+        self.style = new_style
+
+    def forget_style(self):
+        """The attributes have been changed bypassing `set_style`: the next
+        style is set from scratch."""
+        self.style = None
+
+    def write(self, text):
+        """Append `text`, unicode or bytes."""
+        if not isinstance(text, (bytes, bytearray)):
+            text = text.encode(self.encoding)
+        self.buffer += text
+
+    def flush(self):
+        """Write on the terminal whatever has been collected."""
+        if not self.buffer:
+            return
+
+        # whatever has been written on sys.stdout comes first
+        sys.stdout.flush()
+
+        if self.synchronized:
+            self.buffer[0:0] = self.BEGIN_SYNCHRONIZED_UPDATE
+            self.buffer += self.END_SYNCHRONIZED_UPDATE
+
+        view = memoryview(self.buffer)
+        written = 0
+        try:
+            while written < len(view):
+                try:
+                    written += os.write(self.fd, view[written:])
+                except OSError as e:
+                    # stdout may share the nonblocking file description
+                    # of stdin (see nonblocking_input)
+                    if e.errno == errno.EAGAIN:
+                        select.select([], [self.fd], [])
+                    elif e.errno != errno.EINTR:
+                        raise
+        finally:
+            view.release()
+            del self.buffer[:written]
@@ -0,0 +1,258 @@
+"""Pick one of many candidates typing a part of it, like fzf.
+
+The candidates matching a query are kept: typing one more character only
+filters them, deleting one restores the results of the shorter query.
+Big result sets are scanned in chunks by a pool of processes, and the scan
+stops as soon as another key is pressed.
+"""
+
+from __future__ import print_function
+
+import re, heapq, multiprocessing
+from collections import deque
+
+from richinput import RichLine
+from keymap import get_emacs_keymap
+from style import Style, StyledText, DEFAULT
+
+SELECTED = Style(reverse=True)
+
+def compile_query(query):
+    """Return the regex matching the candidates that contain the characters
+    of `query` in order. The match is case sensitive only if `query` has
+    uppercase letters."""
+    flags = re.UNICODE
+    if query == query.lower():
+        flags |= re.IGNORECASE
+    # each character is followed by the shortest possible gap
+    pattern = u''.join(re.escape(c) + u'.*?' for c in query[:-1]) + re.escape(query[-1:])
+    return re.compile(pattern, flags)
+
+def score(match, candidate):
+    """Lower is better: short matches first, then early ones, then short
+    candidates."""
+    return (match.end() - match.start(), match.start(), len(candidate))
+
+def match_chunk(regex, candidates, indices):
+    """Return the indices of the candidates matching `regex`, and their
+    scores."""
+    search = regex.search
+    matched = []
+    scores = []
+    for i in indices:
+        match = search(candidates[i])
+        if match:
+            matched.append(i)
+            scores.append(score(match, candidates[i]))
+    return matched, scores
+
+# the candidates of the worker processes, received once when they start
+_worker_candidates = None
+
+def _init_worker(candidates):
+    global _worker_candidates
+    _worker_candidates = candidates
+
+def _match_in_worker(pattern, flags, indices):
+    return match_chunk(re.compile(pattern, flags), _worker_candidates, indices)
+
+class Result(object):
+    """The candidates matching `query` among the `source` indices, scanned
+    up to `pos`."""
+
+    def __init__(self, query, source):
+        self.query = query
+        self.source = source
+        self.pos = 0
+        self.indices = []
+        self.scores = []
+
+    @property
+    def done(self):
+        return self.pos >= len(self.source)
+
+    def top(self, k):
+        """Return the indices of the best `k` candidates."""
+        if not self.query:
+            return self.indices[:k]
+        return [i for s, i in heapq.nsmallest(k, zip(self.scores, self.indices))]
+
+class FuzzyMatcher(object):
+    """Incremental fuzzy matcher over a list of strings.
+
+    Sets of more than `parallel_threshold` candidates are scanned by
+    `processes` worker processes (one per CPU by default), in chunks of
+    `chunk_size`.
+    """
+
+    def __init__(self, candidates, processes=None, chunk_size=20000,
+                 parallel_threshold=100000):
+        self.candidates = candidates
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.parallel_threshold = parallel_threshold
+        self.pool = None
+
+        everything = Result(u'', range(len(candidates)))
+        everything.indices = everything.source
+        everything.pos = len(candidates)
+        # the results of the query being typed and of its prefixes
+        self.stack = [everything]
+
+    def update(self, query, is_stale=lambda: False):
+        """Return the Result of `query`. The scan is interrupted when
+        `is_stale()` becomes True, the Result is then incomplete and the
+        scan resumes at the next update with the same query."""
+        stack = self.stack
+        # characters have been deleted (the results of the shorter query
+        # are ready), or the scan of a query was interrupted
+        while len(stack) > 1 and (not query.startswith(stack[-1].query) or
+                                  (not stack[-1].done and stack[-1].query != query)):
+            stack.pop()
+
+        if stack[-1].query != query:
+            # only the candidates matching the shorter query may match
+            stack.append(Result(query, stack[-1].indices))
+
+        result = stack[-1]
+        if not result.done:
+            self._scan(result, is_stale)
+        return result
+
+    def _scan(self, result, is_stale):
+        regex = compile_query(result.query)
+        source = result.source
+        chunk = self.chunk_size
+
+        if self.processes < 2 or len(source) - result.pos < self.parallel_threshold:
+            while not result.done and not is_stale():
+                matched, scores = match_chunk(regex, self.candidates,
+                                              source[result.pos:result.pos + chunk])
+                result.indices += matched
+                result.scores += scores
+                result.pos += chunk
+            return
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes, _init_worker,
+                                             (self.candidates,))
+
+        # a few chunks at a time, so that little work is wasted when the
+        # query changes
+        jobs = deque()
+        start = result.pos
+        while start < len(source) or jobs:
+            while start < len(source) and len(jobs) < self.processes * 2:
+                jobs.append(self.pool.apply_async(
+                    _match_in_worker,
+                    (regex.pattern, regex.flags, source[start:start + chunk])))
+                start += chunk
+
+            matched, scores = jobs.popleft().get()
+            result.indices += matched
+            result.scores += scores
+            result.pos += chunk
+            if is_stale():
+                return
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+class Picker(object):
+    """Let the user pick one of `candidates`, showing the best `height`
+    matches below the prompt. The up and down arrows move the selection,
+    <Return> picks it.
+
+    >>> Picker(open('/usr/share/dict/words').read().split()).pick(u'word: ')
+    """
+
+    def __init__(self, candidates, height=10, matcher=None, richline=None):
+        self.candidates = candidates
+        self.height = height
+        # a matcher made here is closed after each pick
+        self.own_matcher = matcher is None
+        self.matcher = matcher or FuzzyMatcher(candidates)
+        self.selected = 0
+        self.shown = []
+
+        keymap = get_emacs_keymap()
+        for key in (u'kcuu1', u'\x10'):
+            keymap[key] = self.select_previous
+        for key in (u'kcud1', u'\x0e'):
+            keymap[key] = self.select_next
+        self.richline = richline or RichLine(keymap=keymap)
+        self.richline.keymap = keymap
+
+    def select_previous(self, richline, key_event):
+        self.selected = max(0, self.selected - key_event.count)
+
+    def select_next(self, richline, key_event):
+        self.selected = min(max(0, len(self.shown) - 1), self.selected + key_event.count)
+
+    def pick(self, prompt=u''):
+        """Return the picked candidate, None if there are none or the input
+        was interrupted."""
+        vterm = self.richline.vterm
+        self.selected = 0
+        text = None
+        try:
+            for event in self._iter(prompt):
+                if event.value == u'\n':
+                    text = self.richline.iline.text
+                    break
+        finally:
+            self._clear(vterm)
+            if self.own_matcher:
+                self.matcher.close()
+
+        if text is None or not self.shown:
+            return None
+        return self.candidates[self.shown[self.selected]]
+
+    def _iter(self, prompt):
+        first = [True]
+
+        def on_key(render, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+            if first[0]:
+                # make room for the list, scrolling the terminal if needed
+                x, y = vterm.cursor
+                vterm.write(u'\n' * self.height)
+                vterm.move_cursor_to(x, y)
+                first[0] = False
+
+            result = render(None, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+            if previous != current or not self.shown:
+                self.selected = 0
+            # the scan stops for the keys already read too (e.g. a paste)
+            shown = self.matcher.update(current, self.richline.is_input_pending).top(self.height)
+            self.shown = shown
+            self.selected = min(self.selected, max(0, len(shown) - 1))
+            self._draw(vterm)
+            return result
+
+        for event, previous, current, prev_idx, idx in self.richline.__iter__(on_key, prompt):
+            yield event
+
+    def _draw(self, vterm):
+        """Show the candidates below the input, O(height * width)."""
+        x, y = vterm.cursor
+        output = vterm.output
+        width = vterm.size[0] or 80
+        for row in range(self.height):
+            vterm.move_cursor_to(1, y + 1 + row)
+            output.cap('el')
+            if row < len(self.shown):
+                line = self.candidates[self.shown[row]][:width - 1]
+                vterm.write_styled(StyledText([
+                    (line, SELECTED if row == self.selected else DEFAULT)]))
+        vterm.move_cursor_to(x, y)
+        vterm.flush()
+
+    def _clear(self, vterm):
+        x, y = vterm.cursor
+        vterm.move_cursor_to(1, y + 1)
+        vterm.output.cap('clr_eos')
+        vterm.move_cursor_to(x, y)
+        vterm.flush()
@@ -0,0 +1,202 @@
+"""Ask the terminal about the features it supports.
+
+All the queries are sent in one write and the replies are collected in one
+pass, with a single deadline: the primary device attributes (DA1) are
+asked last, and since every terminal answers them, their reply means that
+there is nothing else to wait for. The results are cached per terminal
+session (see `get_features`).
+"""
+
+from __future__ import print_function
+
+import os, re, sys, tty, termios, select, codecs, time
+
+# DEC private modes asked by default with DECRQM:
+# 2026 synchronized output, 2004 bracketed paste
+MODES = (2026, 2004)
+
+CURSOR_POSITION = u'\x1b[6n'                  # CPR
+DEVICE_ATTRIBUTES = u'\x1b[c'                 # DA1, always the last one
+VERSION = u'\x1b[>0q'                         # XTVERSION
+KEYBOARD_PROTOCOL = u'\x1b[?u'                # kitty keyboard protocol flags
+# set a direct colour and ask it back (DECRQSS), then reset the attributes
+TRUECOLOR = u'\x1b[48;2;1;2;3m\x1bP$qm\x1b\\\x1b[m'
+
+def query_mode(mode):
+    """DECRQM for the DEC private mode `mode`."""
+    return u'\x1b[?%d$p' % mode
+
+REPLY = re.compile(
+    u'\x1b\\[(?P<row>\\d+);(?P<col>\\d+)R'
+    u'|\x1b\\[\\?(?P<attributes>[\\d;]*)c'
+    u'|\x1b\\[\\?(?P<mode>\\d+);(?P<state>\\d+)\\$y'
+    u'|\x1bP>\\|(?P<version>[^\x1b]*)\x1b\\\\'
+    u'|\x1b\\[\\?(?P<keyboard>\\d+)u'
+    u'|\x1bP(?P<valid>[01])\\$r(?P<setting>[^\x1b]*)\x1b\\\\'
+)
+
+# DECRPM states
+MODE_NOT_RECOGNIZED = 0
+MODE_SET = 1
+MODE_RESET = 2
+MODE_PERMANENTLY_SET = 3
+MODE_PERMANENTLY_RESET = 4
+
+class TerminalFeatures(object):
+    """What the terminal answered. Anything it didn't answer is None (for
+    `modes`, missing)."""
+
+    def __init__(self):
+        self.cursor = None      # (row, col), 1-based
+        self.attributes = None  # the parameters of the DA1 reply
+        self.version = None     # e.g. u'XTerm(372)'
+        self.modes = {}         # mode -> DECRPM state
+        self.keyboard = None    # the kitty keyboard protocol flags
+        self.truecolor = None
+        self.typeahead = u''    # the input read together with the replies
+
+    def supports_mode(self, mode):
+        """Check whether the terminal recognizes the DEC private mode `mode`
+        and allows to change it."""
+        return self.modes.get(mode) in (MODE_SET, MODE_RESET)
+
+    @property
+    def synchronized_output(self):
+        return self.supports_mode(2026)
+
+    @property
+    def answered(self):
+        """True if the terminal replied to DA1 before the deadline."""
+        return self.attributes is not None
+
+    def __repr__(self):
+        return '<TerminalFeatures %r>' % dict(
+            (k, v) for k, v in self.__dict__.items() if v not in (None, {}, u''))
+
+def parse_replies(text, features):
+    """Update `features` with the replies found in `text`, and return the
+    rest of `text`."""
+    rest = []
+    pos = 0
+    for match in REPLY.finditer(text):
+        rest.append(text[pos:match.start()])
+        pos = match.end()
+
+        reply = match.groupdict()
+        if reply['row']:
+            features.cursor = (int(reply['row']), int(reply['col']))
+        elif reply['attributes'] is not None:
+            features.attributes = [int(i) for i in reply['attributes'].split(u';') if i]
+        elif reply['mode']:
+            features.modes[int(reply['mode'])] = int(reply['state'])
+        elif reply['version'] is not None:
+            features.version = reply['version']
+        elif reply['keyboard']:
+            features.keyboard = int(reply['keyboard'])
+        elif reply['valid']:
+            # the colour may be reported as 48:2::1:2:3 too
+            setting = u';'.join(re.split(u'[;:]+', reply['setting']))
+            features.truecolor = reply['valid'] == u'1' and u'2;1;2;3' in setting
+
+    rest.append(text[pos:])
+    return u''.join(rest)
+
+def probe(fd=None, modes=MODES, cursor=True, extended=True, timeout=1.0):
+    """Send the queries to the terminal on `fd` (stdin by default) in one
+    write and return a TerminalFeatures with the replies received within
+    `timeout` seconds.
+
+    The cursor position is asked if `cursor` is True, the version, the
+    keyboard protocol, the truecolor support and `modes` if `extended` is
+    True."""
+    if fd is None:
+        fd = sys.stdin.fileno()
+
+    queries = [CURSOR_POSITION] if cursor else []
+    if extended:
+        queries += [VERSION, KEYBOARD_PROTOCOL, TRUECOLOR]
+        queries += [query_mode(mode) for mode in modes]
+    queries.append(DEVICE_ATTRIBUTES)
+
+    features = TerminalFeatures()
+    decoder = codecs.getincrementaldecoder(
+        getattr(sys.stdin, 'encoding', None) or 'utf-8')('replace')
+    received = u''
+
+    old_tcattrs = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+
+        sys.stdout.flush()
+        data = u''.join(queries).encode('ascii')
+        out = sys.stdout.fileno()
+        while data:
+            data = data[os.write(out, data):]
+
+        deadline = time.time() + timeout
+        while features.attributes is None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                if not select.select([fd], [], [], remaining)[0]:
+                    break
+            except select.error as e:
+                if e.args[0] == 4: # Interrupted system call
+                    continue
+                raise
+
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            received += decoder.decode(chunk)
+            if u'c' in received:
+                # cheap check before looking for the DA1 reply
+                received = parse_replies(received, features)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_tcattrs)
+
+    features.typeahead = parse_replies(received, features)
+    if features.answered:
+        # the terminal ignored the queries it doesn't understand
+        for mode in modes if extended else ():
+            features.modes.setdefault(mode, MODE_NOT_RECOGNIZED)
+    return features
+
+_sessions = {}
+
+def get_session(fd=None):
+    """Return a key identifying the terminal session on `fd`."""
+    if fd is None:
+        fd = sys.stdin.fileno()
+    try:
+        name = os.ttyname(fd)
+    except OSError:
+        name = fd
+    return (name, os.getenv('TERM'), os.getsid(0))
+
+def get_features(fd=None, modes=MODES, cursor=False, timeout=1.0):
+    """Return the TerminalFeatures of the terminal on `fd`, probing it only
+    the first time in the session. If `cursor` is True the cursor position
+    is asked anyway, and stored in the `cursor` attribute."""
+    key = get_session(fd)
+    features = _sessions.get(key)
+
+    if features is None or \
+       (features.answered and not set(modes) <= set(features.modes)):
+        # a terminal that didn't answer isn't probed again either
+        features = _sessions[key] = probe(fd, modes, cursor, timeout=timeout)
+    elif cursor:
+        current = probe(fd, cursor=True, extended=False, timeout=timeout)
+        features.cursor = current.cursor
+        features.typeahead += current.typeahead
+
+    return features
+
+def take_typeahead(fd=None):
+    """Return and forget the input read while probing the terminal."""
+    features = _sessions.get(get_session(fd))
+    if not features or not features.typeahead:
+        return u''
+    typeahead, features.typeahead = features.typeahead, u''
+    return typeahead
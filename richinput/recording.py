@@ -0,0 +1,242 @@
+"""Record the input given to a RichLine, and replay it later to measure
+how long each key press takes to be processed.
+
+A recording is a sequence of records, each one made of a header
+(kind, seconds since the start) followed by
+- for INPUT records the length and the UTF-8 bytes of the chunk read
+- for RESIZE records the new width and height of the terminal
+"""
+
+from __future__ import print_function
+
+import os, sys, time, struct, signal, select, termios, fcntl
+
+from richinput import get_chunk
+
+MAGIC = b'RIREC1\n'
+
+INPUT = b'i'
+RESIZE = b'r'
+
+HEADER = struct.Struct('<cd')
+LENGTH = struct.Struct('<I')
+SIZE = struct.Struct('<HH')
+
+if hasattr(time, 'perf_counter'):
+    clock = time.perf_counter
+else: # Python 2
+    clock = time.time
+
+def get_terminal_size(fd=None):
+    rows, cols, height, width = struct.unpack('HHHH',
+        fcntl.ioctl(sys.stdin.fileno() if fd is None else fd,
+              termios.TIOCGWINSZ,
+              struct.pack('HHHH', 0, 0, 0, 0)))
+    return cols, rows
+
+class Recorder(object):
+    """Reader (see get_rich_char) that writes on the binary file `fileobj`
+    every chunk read by `reader`, plus the size of the terminal at the
+    start and after each resize.
+
+    >>> with open('session.rec', 'wb') as f:
+    ...     RichLine(reader=Recorder(f)).read()
+    """
+
+    def __init__(self, fileobj, reader=get_chunk):
+        self.fileobj = fileobj
+        self.reader = reader
+        self.start = None
+
+    def __call__(self, prompt=u'', **kwargs):
+        # the deadline and the idle queue of RichLine go to `reader`
+        if self.start is None:
+            self.start = clock()
+            self.fileobj.write(MAGIC)
+            self.write_size()
+
+        previous_handler = signal.getsignal(signal.SIGWINCH)
+
+        def on_resize(*args):
+            self.write_size()
+            if callable(previous_handler):
+                previous_handler(*args)
+
+        signal.signal(signal.SIGWINCH, on_resize)
+        try:
+            for chunk in self.reader(prompt, **kwargs):
+                data = chunk.encode('utf-8')
+                self.fileobj.write(HEADER.pack(INPUT, clock() - self.start))
+                self.fileobj.write(LENGTH.pack(len(data)))
+                self.fileobj.write(data)
+                self.fileobj.flush()
+                yield chunk
+        finally:
+            signal.signal(signal.SIGWINCH, previous_handler)
+
+    def write_size(self):
+        self.fileobj.write(HEADER.pack(RESIZE, clock() - self.start))
+        self.fileobj.write(SIZE.pack(*get_terminal_size()))
+        self.fileobj.flush()
+
+def load_recording(fileobj):
+    """Return the list of records (kind, seconds, value) in `fileobj`.
+    `value` is the chunk read for INPUT records, (width, height) for
+    RESIZE records."""
+    if fileobj.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a recording')
+
+    records = []
+    while True:
+        header = fileobj.read(HEADER.size)
+        if len(header) < HEADER.size:
+            break
+
+        kind, seconds = HEADER.unpack(header)
+        if kind == INPUT:
+            length, = LENGTH.unpack(fileobj.read(LENGTH.size))
+            value = fileobj.read(length).decode('utf-8')
+        elif kind == RESIZE:
+            value = SIZE.unpack(fileobj.read(SIZE.size))
+        else:
+            raise ValueError('Unknown record %r' % kind)
+        records.append((kind, seconds, value))
+
+    return records
+
+class ReplayReport(object):
+    """Total time of a replay and time spent on each event."""
+
+    def __init__(self):
+        self.total = 0.0
+        self.timings = [] # (event, seconds)
+
+    def summary(self):
+        if not self.timings:
+            return u'no events, %.3fs' % self.total
+
+        seconds = sorted(t for e, t in self.timings)
+        percentile = lambda p: seconds[min(len(seconds) - 1, int(len(seconds) * p))]
+        return (u'%d events in %.3fs: mean %.3fms, p50 %.3fms, p95 %.3fms, '
+                u'max %.3fms' % (
+                    len(seconds), self.total,
+                    sum(seconds) / len(seconds) * 1000,
+                    percentile(0.5) * 1000, percentile(0.95) * 1000,
+                    seconds[-1] * 1000))
+
+class Replayer(object):
+    """Feed a recording (see `load_recording`) back.
+    If `realtime` is True the original timing is respected, otherwise the
+    input is given as fast as possible."""
+
+    def __init__(self, records, realtime=False):
+        self.records = records
+        self.realtime = realtime
+        self.waited = 0.0
+        self.on_resize = None
+
+    def _wait_until(self, start, seconds):
+        if not self.realtime:
+            return
+        delay = start + seconds - clock()
+        if delay > 0:
+            time.sleep(delay)
+            self.waited += delay
+
+    def reader(self, prompt=u'', deadline=None, idle=None):
+        """Reader to give to RichLine, yielding the recorded chunks. The
+        `deadline` and the `idle` jobs of RichLine are ignored: the input
+        is the recorded one, with its timing."""
+        start = clock()
+        for kind, seconds, value in self.records:
+            self._wait_until(start, seconds)
+            if kind == INPUT:
+                yield value
+            elif self.on_resize:
+                self.on_resize(*value)
+
+    def replay(self, richline, cb=None, prompt=u''):
+        """Replay the recording in process, through `richline`, and return
+        a ReplayReport. Each event is timed from when it is yielded up to
+        when the next one is ready, which includes running its callbacks
+        (the realtime waits are excluded)."""
+
+        def on_resize(width, height):
+            richline.vterm.size = (width, height)
+
+        self.on_resize = on_resize
+        richline.reader = self.reader
+        report = ReplayReport()
+
+        iterator = richline.__iter__(cb, prompt)
+        start = clock()
+        event = None
+        while True:
+            # the callbacks of the previous event run inside next()
+            self.waited = 0.0
+            before = clock()
+            item = next(iterator, None)
+            elapsed = clock() - before - self.waited
+            if event is not None:
+                report.timings[-1] = (event, report.timings[-1][1] + elapsed)
+            if item is None:
+                break
+
+            event = item[0]
+            report.timings.append((event, 0.0))
+
+        report.total = clock() - start
+        return report
+
+    def replay_pty(self, argv, quiet=0.05):
+        """Replay the recording running `argv` in a new pseudo terminal, and
+        return a ReplayReport. Each input chunk is timed from when it is
+        written up to when the program becomes quiet for `quiet` seconds
+        after answering (it's the latency perceived by the user plus
+        `quiet`, that is subtracted)."""
+        import pty
+
+        pid, master = pty.fork()
+        if pid == 0:
+            try:
+                os.execvp(argv[0], argv)
+            finally:
+                os._exit(127)
+
+        def drain(timeout):
+            """Read the output until there's none for `timeout` seconds."""
+            while select.select([master], [], [], timeout)[0]:
+                try:
+                    if not os.read(master, 65536):
+                        return
+                except OSError: # the child exited
+                    return
+
+        report = ReplayReport()
+        start = clock()
+        try:
+            drain(quiet) # the prompt
+            for kind, seconds, value in self.records:
+                self._wait_until(start, seconds)
+                if kind == RESIZE:
+                    fcntl.ioctl(master, termios.TIOCSWINSZ,
+                                struct.pack('HHHH', value[1], value[0], 0, 0))
+                    os.kill(pid, signal.SIGWINCH)
+                    continue
+
+                data = value.encode('utf-8')
+                before = clock()
+                while data:
+                    data = data[os.write(master, data):]
+                drain(quiet)
+                report.timings.append((value, max(0.0, clock() - before - quiet)))
+        finally:
+            report.total = clock() - start
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            os.waitpid(pid, 0)
+            os.close(master)
+
+        return report
@@ -1,10 +1,23 @@
 from __future__ import print_function
 
-import os, sys, tty, termios, codecs, unicodedata
-import threading
+import os, re, sys, tty, termios, codecs, unicodedata, time
+import threading, functools
+from collections import deque
 from contextlib import contextmanager
 
 import select, terminfo, struct, signal, fcntl
+import probe
+from output import TermWriter
+from highlight import Tokenization
+from lineindex import LineIndex
+from undo import UndoLog, Edit
+from display import Mask, merge_edits
+from style import Style, DEFAULT
+from grapheme import ClusterIndex, get_width, get_column_index, is_boundary
+from keymap import Keymap, get_key, get_emacs_keymap, insert, interrupt
+
+if sys.version_info[0] >= 3: # Python 3
+    unichr = chr
 
 class UnicodeMixin(object):
   """Mixin class to handle defining the proper __str__/__unicode__
@@ -26,33 +39,145 @@ def encode_string_decorator(func):
         return func
 
 class Key(UnicodeMixin):
-    def __init__(self, value):
+    def __init__(self, value, count=1):
         self.value = value
+        self.count = count
     
     @encode_string_decorator
     def __repr__(self):
+        if self.count != 1:
+            return u'<%s %r x%d>' % (self.__class__.__name__, self.value, self.count)
         return u'<%s %r>' % (self.__class__.__name__, self.value)
 
+    def merge(self, other):
+        """Try to absorb the event `other` that followed this one.
+        Return True on success."""
+        return False
+
 class ControlKey(Key):
     def __unicode__(self):
         return u''
 
+    def merge(self, other):
+        # never merge the keys that end the input
+        if type(other) is not type(self) or other.value != self.value or \
+           self.value in (u'\n', u'\r', u'\x04'):
+            return False
+
+        self.count += other.count
+        return True
+
 class PrintableChar(Key):
     def __unicode__(self):
         return self.value
 
+class TextRun(PrintableChar):
+    """A run of consecutive printable characters read together."""
+
 class EscapeSequence(UnicodeMixin):
-    def __init__(self, capability):
+    def __init__(self, capability, count=1):
         self.capability = capability
         self.value = self.capability.value
+        self.modifiers = self.capability.modifiers
+        self.count = count
     
     def __unicode__(self):
         return u''
 
     @encode_string_decorator
     def __repr__(self):
+        if self.count != 1:
+            return u'%r x%d' % (self.capability, self.count)
         return repr(self.capability)
 
+    def merge(self, other):
+        if not isinstance(other, EscapeSequence) or other.value != self.value:
+            return False
+
+        self.count += other.count
+        return True
+
+class MouseEvent(UnicodeMixin):
+    """A mouse report. `x` and `y` are the (1-based) column and row of the
+    pointer, `code` is the button code sent by the terminal.
+    `count` is the number of reports merged in this event."""
+
+    BUTTON_LEFT = 0
+    BUTTON_MIDDLE = 1
+    BUTTON_RIGHT = 2
+    BUTTON_NONE = 3
+
+    MOD_SHIFT = 4
+    MOD_META = 8
+    MOD_CTRL = 16
+
+    def __init__(self, value, code, x, y, released=False):
+        self.value = value
+        self.code = code
+        self.x = x
+        self.y = y
+        self.released = released or (code & 3 == self.BUTTON_NONE and
+                                     not code & (32 | 64))
+        self.count = 1
+
+    @property
+    def button(self):
+        return self.code & 3
+
+    @property
+    def modifiers(self):
+        return self.code & (self.MOD_SHIFT | self.MOD_META | self.MOD_CTRL)
+
+    @property
+    def is_motion(self):
+        return bool(self.code & 32)
+
+    @property
+    def is_wheel(self):
+        return bool(self.code & 64)
+
+    @property
+    def is_wheel_up(self):
+        return self.is_wheel and self.button == 0
+
+    @property
+    def is_wheel_down(self):
+        return self.is_wheel and self.button == 1
+
+    def is_click(self, button=BUTTON_LEFT):
+        """Check whether this is the press of `button`."""
+        return (not self.released and not self.is_motion and
+                not self.is_wheel and self.button == button)
+
+    def merge(self, other):
+        # only motion and wheel events come in bursts
+        if not isinstance(other, MouseEvent) or other.code != self.code or \
+           other.released != self.released or \
+           not (self.is_motion or self.is_wheel):
+            return False
+
+        self.value = other.value
+        self.x, self.y = other.x, other.y
+        self.count += other.count
+        return True
+
+    def __unicode__(self):
+        return u''
+
+    @encode_string_decorator
+    def __repr__(self):
+        return u'<%s code=%d x=%d y=%d%s count=%d>' % (
+            self.__class__.__name__, self.code, self.x, self.y,
+            u' released' if self.released else u'', self.count)
+
+class InputTimeout(Exception):
+    """Raised when the input isn't over within the time given to
+    RichLine.read. `text` is what had been typed."""
+
+    def __init__(self, text=u''):
+        super(InputTimeout, self).__init__('the input timed out')
+        self.text = text
+
 class StartEscapeSequenceException(Exception):
     def __init__(self, value):
         self.value = ControlKey(value)
@@ -71,45 +196,250 @@ def nonblocking_input():
         termios.tcsetattr(fd, termios.TCSADRAIN, old_tcattrs)
         fcntl.fcntl(fd, fcntl.F_SETFL, old_fl)
 
-def get_char(prompt=''):
+@contextmanager
+def mouse_tracking(motion=False):
+    """Ask the terminal to report mouse clicks (mode 1000), and if `motion`
+    is True also the pointer movements while a button is pressed (mode 1002),
+    using the SGR extended format (mode 1006)."""
+    modes = [u'1000'] + ([u'1002'] if motion else []) + [u'1006']
+
+    sys.stdout.write(u''.join(u'\x1b[?%sh' % mode for mode in modes))
+    sys.stdout.flush()
+    try:
+        yield
+    finally:
+        sys.stdout.write(u''.join(u'\x1b[?%sl' % mode for mode in reversed(modes)))
+        sys.stdout.flush()
+
+# flags of the kitty keyboard protocol: report the keys that are ambiguous
+# in the legacy encoding (Esc, Alt+key, Ctrl+key, ...) as CSI code ; mods u
+KEYBOARD_DISAMBIGUATE = 1
+
+@contextmanager
+def keyboard_protocol(flags=KEYBOARD_DISAMBIGUATE):
+    """Push `flags` on the stack of the kitty keyboard protocol, and restore
+    the previous flags when done. The terminal must support it (see
+    probe.TerminalFeatures.keyboard), the others may show garbage."""
+    sys.stdout.write(u'\x1b[>%du' % flags)
+    sys.stdout.flush()
+    try:
+        yield
+    finally:
+        sys.stdout.write(u'\x1b[<u')
+        sys.stdout.flush()
+
+@contextmanager
+def no_mode():
+    yield
+
+def get_chunk(prompt='', deadline=None, idle=None):
+    """Iterator that yields, nonblocking and encoding aware, whatever has
+    been read from the standard input each time some data is available.
+
+    InputTimeout is raised once the time.time() `deadline` has passed, and
+    the jobs of `idle` (an idle.IdleQueue) run while waiting for input."""
     with nonblocking_input():
+        for chunk in read_chunks(prompt, deadline, idle):
+            yield chunk
+
+def is_input_pending(fd=None):
+    """Check whether there is something to read on `fd` (stdin by default)."""
+    fd = sys.stdin.fileno() if fd is None else fd
+    return bool(select.select([fd], [], [], 0)[0])
+
+def wait_for_input(fd, deadline=None, idle=None, last_input=0):
+    """Wait until there is something to read on `fd`, running the jobs of
+    `idle` once its delay since `last_input` has passed. Raise
+    InputTimeout once `deadline` has passed."""
+    is_stale = lambda: is_input_pending(fd) or \
+                       (deadline is not None and time.time() >= deadline)
+    while True:
+        now = time.time()
+        timeout = None
+        if deadline is not None:
+            if now >= deadline:
+                raise InputTimeout()
+            timeout = deadline - now
+        if idle:
+            start = max(0, last_input + idle.delay - now)
+            timeout = start if timeout is None else min(timeout, start)
+
+        try:
+            if select.select([fd], [], [], timeout)[0]:
+                return
+        except select.error as e:
+            if e.args[0] == 4: # Interrupted system call
+                continue
+            raise
+
+        if idle and time.time() >= last_input + idle.delay:
+            idle.run(is_stale)
+
+def read_chunks(prompt='', deadline=None, idle=None):
+    """Like `get_chunk`, for when the terminal is already in the mode set
+    by `nonblocking_input` (e.g. see session.Session)."""
+    if prompt:
+        # This is needed for cases like escape sequences that write
+        # on stdin (e.g \x1b[6n write on stdin the cursor position)
+        # (otherwise once in a while you may loose the 'answer')
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+    
+    # encoding aware reader 
+    # XXX codecs.getreader raised IOError(11) on some machines
+    # (even if select said that there was data to read)
+    read = sys.stdin.read
+    if sys.version_info[0] < 3:
+        read = lambda *x: sys.stdin.read(*x).decode(sys.stdin.encoding)
+
+    # what was typed while the terminal was being probed
+    typeahead = probe.take_typeahead()
+    if typeahead:
+        yield typeahead
+
+    fd = sys.stdin.fileno()
+    last_input = time.time()
+    while True:
+        # wait for data on the file descriptor
+        wait_for_input(fd, deadline, idle, last_input)
+        chunk = read()
+        if chunk:
+            last_input = time.time()
+            yield chunk
+
+class StreamInput(object):
+    """Reader (see get_rich_char) for a file descriptor that isn't a terminal,
+    e.g. a pipe or a file. The input is read in big blocks and split in lines
+    in bulk, and every call yields the lines not consumed by the previous
+    ones, so use the same instance for every prompt (see get_stream_input).
+    """
+
+    block_size = 65536
+
+    def __init__(self, fd, encoding='utf-8'):
+        self.fd = fd
+        self.decoder = codecs.getincrementaldecoder(encoding)('replace')
+        self.lines = deque()
+        self.partial = u''
+        self.eof = False
+
+    def read_line(self, deadline=None, idle=None):
+        """Return the next line, newline included, u'' at the end of the input."""
+        while not self.lines and not self.eof:
+            if deadline is not None or idle:
+                wait_for_input(self.fd, deadline, idle)
+            data = os.read(self.fd, self.block_size)
+            self.eof = not data
+            lines = (self.partial + self.decoder.decode(data, self.eof)).split(u'\n')
+            self.partial = lines.pop()
+            self.lines.extend(line + u'\n' for line in lines)
+            if self.eof and self.partial:
+                self.lines.append(self.partial)
+                self.partial = u''
+
+        return self.lines.popleft() if self.lines else u''
+
+    def __call__(self, prompt=u'', deadline=None, idle=None):
         if prompt:
-            # This is needed for cases like escape sequences that write
-            # on stdin (e.g \x1b[6n write on stdin the cursor position)
-            # (otherwise once in a while you may loose the 'answer')
             sys.stdout.write(prompt)
             sys.stdout.flush()
-        
-        # encoding aware reader 
-        # XXX codecs.getreader raised IOError(11) on some machines
-        # (even if select said that there was data to read)
-        read = sys.stdin.read
-        if sys.version_info[0] < 3:
-            read = lambda *x: sys.stdin.read(*x).decode(sys.stdin.encoding)
 
-        fd = sys.stdin.fileno()
         while True:
-            # wait for data on the file descriptor
-            try:
-                select.select([fd],[],[])
-                for c in read():
-                    yield c
-            except select.error as e:
-                if e.args[0] == 4: # Interrupted system call
-                    pass
-                else:
-                    raise e
+            line = self.read_line(deadline, idle)
+            if not line:
+                return
+            yield line
 
-def get_rich_char(prompt=u'', term=None):
+_stream_inputs = {}
+
+def get_stream_input(fd=None):
+    """Return the StreamInput shared by every prompt reading from `fd`
+    (stdin by default)."""
+    if fd is None:
+        fd = sys.stdin.fileno()
+    if fd not in _stream_inputs:
+        encoding = getattr(sys.stdin, 'encoding', None) or 'utf-8'
+        _stream_inputs[fd] = StreamInput(fd, encoding)
+    return _stream_inputs[fd]
+
+def get_char(prompt=''):
+    for chunk in get_chunk(prompt):
+        for c in chunk:
+            yield c
+
+class InputBuffer(object):
+    """Iterator over the characters of the chunks yielded by `chunks`
+    (see `get_chunk`), that knows how many characters of the latest chunk
+    are still waiting to be consumed."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = u''
+        self.idx = 0
+        # where the escape sequence the buffer ends with starts, if more
+        # input is needed to complete it
+        self.complete = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self.idx >= len(self.buffer):
+            self.buffer = next(self.chunks)
+            self.idx = 0
+            self.complete = find_incomplete_sequence(self.buffer)
+
+        c = self.buffer[self.idx]
+        self.idx += 1
+        return c
+
+    next = __next__ # Python 2
+
+    def pending(self):
+        """Number of characters already read but not yet consumed."""
+        return len(self.buffer) - self.idx
+
+    def decodable(self):
+        """Number of characters already read that can be turned into key
+        events without waiting for more input."""
+        return max(0, self.complete - self.idx)
+
+    def take_printable_run(self):
+        """Consume and return the printable characters that follow in the
+        latest chunk."""
+        start = self.idx
+        self.idx = match_printable_run(self.buffer, start)
+        return self.buffer[start:self.idx]
+
+def get_rich_char(prompt=u'', term=None, mouse=False, merge_repeats=False,
+                  reader=get_chunk, text_runs=False, keyboard=False,
+                  buffer=None, mouse_motion=False):
     """Iterator that returns the next meaningful input given to a terminal,
     whenever a key is pressed.
     `term` is an instance of terminfo.Term, needed to understand what the
     escape sequences mean.
+    If `mouse` is True the mouse tracking is enabled (see `mouse_tracking`)
+    and bursts of motion or wheel events are merged together. The motions
+    while a button is pressed are reported only if `mouse_motion` is True.
+    If `merge_repeats` is True identical control keys and escape sequences
+    already waiting in the input buffer (e.g. a key kept pressed) are merged
+    into a single event, whose `count` attribute tells how many they were.
+    `reader` is called with `prompt` to obtain the iterator of the input
+    chunks (see `get_chunk`, and recording.Recorder).
+    If `text_runs` is True the printable characters read together (e.g.
+    pasted text) are yielded as a single TextRun.
+    If `keyboard` is True the kitty keyboard protocol is enabled (see
+    `keyboard_protocol`): Esc, Alt and Ctrl combinations are then reported
+    without ambiguity, and every key is yielded as soon as it's read.
+    `buffer` is an InputBuffer over the chunks of `reader`, to be given in
+    its place to know how much input is waiting (see InputBuffer.pending).
     
     The yielded value will be one of
     - PrintableChar
+    - TextRun
     - ControlKey
     - EscapeSequence
+    - MouseEvent
     
     Note that only PrintableChar has a non-empty string representation,
     so something like the following may come in handy
@@ -119,12 +449,37 @@ def get_rich_char(prompt=u'', term=None):
     if not term:
         term = terminfo.load_terminfo()
 
-    iterator = get_char(prompt)
+    iterator = buffer if buffer is not None else InputBuffer(reader(prompt))
+    events = read_events(iterator, term, mouse, text_runs)
+
+    kinds = ()
+    if merge_repeats:
+        kinds += (ControlKey, EscapeSequence)
+    if mouse:
+        kinds += (MouseEvent,)
+
+    if kinds:
+        events = coalesce_events(events, iterator, kinds)
+
+    if not (mouse or keyboard):
+        for event in events:
+            yield event
+        return
+
+    with mouse_tracking(mouse_motion) if mouse else no_mode():
+        with keyboard_protocol() if keyboard else no_mode():
+            for event in events:
+                yield event
+
+def read_events(iterator, term, mouse=False, text_runs=False):
+    """Turn the characters yielded by `iterator` into key events."""
     for c in iterator:
         try:
             raise_if_start_escape_sequence(c)
             
-            if is_char_printable(c):
+            if text_runs and is_char_printable(c):
+                yield TextRun(c + iterator.take_printable_run())
+            elif is_char_printable(c):
                 yield PrintableChar(c)
             else:
                 yield ControlKey(c)
@@ -134,19 +489,54 @@ def get_rich_char(prompt=u'', term=None):
             # ESC-ESC-* rest of the sequence
             while True:
                 try:
-                    sequence = consume_escape_sequence(iterator, c)
-                    yield EscapeSequence(term.detect(sequence))
+                    sequence = consume_escape_sequence(iterator, c, mouse)
+                    event = mouse and decode_mouse_event(sequence) or \
+                            decode_key_report(sequence, term)
+                    yield event or EscapeSequence(term.detect(sequence))
                     break
                 except StartEscapeSequenceException as e:
                     c = e.value
 
-    raise StopIteration
-        
+def coalesce_events(events, iterator, kinds=(MouseEvent,)):
+    """Merge each event yielded by `events`, if it is an instance of one of
+    `kinds`, with the following ones, as long as they are already waiting in
+    the buffer of `iterator` and they can be merged (see the `merge` method
+    of the events). An incomplete escape sequence at the end of the buffer
+    (e.g. a lone ESC) isn't waited for."""
+    events = iter(events)
+    for event in events:
+        while iterator.decodable():
+            following = next(events, None)
+            if following is None:
+                break
+            if not (isinstance(event, kinds) and event.merge(following)):
+                yield event
+                event = following
+        yield event
 
 def is_char_printable(c):
     """Check whether `c` is a printable char according to unicode."""
     return not unicodedata.category(c).startswith('C')
 
+# candidates for a run of printable characters: no C0 or C1 control codes
+PRINTABLE_RUN = re.compile(u'[^\x00-\x1f\x7f-\x9f]+')
+
+def match_printable_run(text, pos):
+    """Return where the run of printable characters starting at `pos` ends."""
+    match = PRINTABLE_RUN.match(text, pos)
+    if not match:
+        return pos
+
+    # str.isprintable is stricter than is_char_printable (spaces other than
+    # U+0020 aren't printable for it), so it can only confirm the whole run
+    if getattr(match.group(), 'isprintable', lambda: False)():
+        return match.end()
+
+    for i in range(pos, match.end()):
+        if not is_char_printable(text[i]):
+            return i
+    return match.end()
+
 def is_char_interrupt(c):
     """Check whether `c` is EOT (end of transmission, ^D)."""
     return c == u'\x04'
@@ -170,9 +560,39 @@ def raise_if_start_escape_sequence(c):
     if (is_char_single_character_csi(c) or is_char_esc(c)):
         raise StartEscapeSequenceException(c)
 
-def consume_escape_sequence(iterator, starter):
+def is_sequence_complete(sequence):
+    """Check whether consume_escape_sequence would read the escape sequence
+    starting `sequence` without reading past it. An X10 mouse report is
+    considered to be one."""
+    body = sequence[1:]
+    if is_char_single_character_csi(sequence[0]):
+        body = u'[' + body
+    if not body:
+        return False
+    if body[0] == u'[':
+        if body[1:2] == u'M':
+            return len(body) >= 5
+        return any(64 <= ord(c) <= 126 or c == u'$' for c in body[1:])
+    if body[0] == u'O':
+        return len(body) >= 2
+    return True
+
+def find_incomplete_sequence(text):
+    """Return where the escape sequence at the end of `text` starts, if it
+    needs more input to be complete (the sequences it interrupts included),
+    len(text) otherwise."""
+    limit = end = len(text)
+    while True:
+        start = max(text.rfind(u'\x1b', 0, end), text.rfind(u'\x9b', 0, end))
+        if start < 0 or is_sequence_complete(text[start:end]):
+            return limit
+        limit = end = start
+
+def consume_escape_sequence(iterator, starter, mouse=False):
     """Given an input `iterator` and the character that started an escape
     sequence, consume the whole escape sequence and return it.
+    If `mouse` is True the three bytes following an X10 mouse report
+    (ESC [ M) are considered part of the sequence.
     
     May raise StartEscapeSequenceException if a new escape sequence
     is started midway.
@@ -189,6 +609,10 @@ def consume_escape_sequence(iterator, starter):
         while not (64 <= ord(seq[-1]) <= 126 or seq[-1] == 36):
             seq.append(next(iterator))
             raise_if_start_escape_sequence(seq[-1])
+
+        if mouse and seq == [u'[', u'M']:
+            # button, column and row, as raw bytes
+            seq.extend(next(iterator) for i in range(3))
     elif seq[-1] == u'O': # read 1 more byte
         seq.append(next(iterator))
         raise_if_start_escape_sequence(seq[-1])
@@ -197,6 +621,84 @@ def consume_escape_sequence(iterator, starter):
 
     return u'\x1b' + u''.join(seq)
 
+SGR_MOUSE_REPORT = re.compile(u'^\x1b\\[<(\\d+);(\\d+);(\\d+)([Mm])$')
+
+def decode_mouse_event(sequence):
+    """Return a MouseEvent if `sequence` is a mouse report, in either the
+    SGR (ESC [ < b ; x ; y M/m) or the X10 (ESC [ M b x y) format,
+    None otherwise."""
+    match = SGR_MOUSE_REPORT.match(sequence)
+    if match:
+        code, x, y = (int(i) for i in match.group(1, 2, 3))
+        return MouseEvent(sequence, code, x, y, match.group(4) == u'm')
+
+    if len(sequence) == 6 and sequence.startswith(u'\x1b[M'):
+        code, x, y = (ord(c) - 32 for c in sequence[3:])
+        return MouseEvent(sequence, code, x, y)
+
+    return None
+
+# a key reported by the kitty keyboard protocol:
+# CSI code [: alternate keys] [; modifiers [: event type] [; text]] u
+KEY_REPORT = re.compile(u'^\x1b\\[(\\d+)(?::(\\d*))?[:\\d]*(?:;(\\d*)[:\\d]*)?(?:;[:\\d]*)?u$')
+
+# the codes of the kitty protocol that aren't characters, by their value
+# in the legacy encoding (in cbreak mode Enter is read as a newline)
+KEY_REPORT_VALUES = {27: u'\x1b', 13: u'\n', 9: u'\t', 127: u'\x7f', 8: u'\x08'}
+
+# the keys having a control character, Ctrl+A to Ctrl+_ and Ctrl+Space
+CONTROL_KEYS = u'abcdefghijklmnopqrstuvwxyz@[\\]^_ '
+
+def decode_key_report(sequence, term):
+    """Return the key event of `sequence` if it is a key reported by the
+    kitty keyboard protocol (e.g. CSI 97 ; 5 u for Ctrl+A), None otherwise.
+
+    Keys having a legacy encoding are returned as if they were sent that
+    way, e.g. a ControlKey u'\\x01' for Ctrl+A or an EscapeSequence u'\\x1bf'
+    for Alt+F, so that the keymaps work either way. The others are an
+    EscapeSequence of a capability named after the key (e.g. 'C-S-a', or
+    'C-\\n' for Ctrl+Enter) with the MOD_* mask in `modifiers`."""
+    if not sequence.endswith(u'u'):
+        return None
+    match = KEY_REPORT.match(sequence)
+    if not match:
+        return None
+
+    code, shifted, modifiers = match.groups()
+    code = int(code)
+    try:
+        key = KEY_REPORT_VALUES.get(code) or unichr(code)
+    except (ValueError, OverflowError):
+        # not a code point
+        return None
+    if 0xe000 <= code <= 0xf8ff:
+        # keypad, media and modifier keys, in the private use area
+        return None
+
+    # shift, alt, ctrl, and super, hyper or meta; the lock keys are ignored
+    mask = int(modifiers) - 1 if modifiers else 0
+    modifiers = mask & 0xf | (terminfo.MOD_META if mask & 0x30 else 0)
+    mods = modifiers & ~terminfo.MOD_ALT
+
+    if code not in KEY_REPORT_VALUES:
+        if mods == terminfo.MOD_SHIFT:
+            key = unichr(int(shifted)) if shifted else key.upper()
+            mods = 0
+        elif mods == terminfo.MOD_CTRL and key in CONTROL_KEYS:
+            key = unichr(ord(key) & 0x1f)
+            mods = 0
+
+    if mods:
+        cap = terminfo.Capability('key', key)
+        return EscapeSequence(cap.with_modifiers(sequence, modifiers))
+    if modifiers & terminfo.MOD_ALT:
+        # like the legacy ESC key, whose name is its value
+        cap = terminfo.Capability('key')
+        return EscapeSequence(cap.with_modifiers(u'\x1b' + key, modifiers))
+    if is_char_printable(key):
+        return PrintableChar(key)
+    return ControlKey(key)
+
 def is_capability_delete(capability):
     return capability.capname == 'kdch1'
 
@@ -213,7 +715,7 @@ def is_capability_arrow_right(capability):
     return capability.capname == 'kcuf1'
 
 def is_capability_arrow_up(capability):
-    return capability.capname == 'kcup1'
+    return capability.capname == 'kcuu1'
 
 def is_capability_arrow_down(capability):
     return capability.capname == 'kcud1'
@@ -234,32 +736,122 @@ def get_cursor_position():
 
 class IndexedLine(object):
     # index on `text` (not the column on terminal)
+    # Cursor movements and deletions act on whole grapheme clusters (see
+    # grapheme.py), whose boundaries are updated at each edit.
+
+    # whether the text may contain newlines
+    multiline = False
+
     def __init__(self, text=u'', idx=0):
+        self._text = text
+        self.clusters = ClusterIndex(text)
         self.idx = idx
-        self.text = text
+        self.history = UndoLog()
+        # whether the edits join the undo step of the latest one (e.g. those
+        # of the callbacks of a key)
+        self.fold_edits = False
+        # the edits not taken yet (see take_edits), None if nobody asked
+        self.edits = None
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        # the text may be replaced from outside (e.g. by a callback)
+        if text != self._text:
+            pos, removed, inserted = get_edit(self._text, text)
+            edit = Edit(pos, self._text[pos:pos + removed], text[pos:pos + inserted], self.idx)
+            self._record(edit)
+            if self.edits is not None:
+                self.edits.append(edit)
+            self._text = text
+            self._on_edit(pos, removed, inserted)
+
+    def _replace(self, pos, removed, text):
+        self._record(Edit(pos, self._text[pos:pos + removed], text, self.idx))
+        self._apply(pos, removed, text)
+
+    def _record(self, edit):
+        if self.fold_edits:
+            self.history.fold(self._text, edit.pos, edit.removed, edit.inserted, edit.idx)
+        else:
+            self.history.record(edit.pos, edit.removed, edit.inserted, edit.idx)
 
-    def insert(self, text):
-        self.text = self.text[:self.idx] + text + self.text[self.idx:]
-        self.move_cursor_forward(len(text))
+    def _apply(self, pos, removed, text):
+        if self.edits is not None:
+            self.edits.append(Edit(pos, self._text[pos:pos + removed], text, self.idx))
+        self._text = self._text[:pos] + text + self._text[pos + removed:]
+        self._on_edit(pos, removed, len(text))
 
-    def delete_backward(self):
-        if self.idx > 0:
-            self.text = self.text[:self.idx-1] + self.text[self.idx:]
-            self.move_cursor_backward()
+    def _on_edit(self, pos, removed, inserted):
+        self.clusters.update(self._text, pos, removed, inserted)
+
+    def insert(self, text):
+        self._replace(self.idx, 0, text)
+        self.idx += len(text)
+
+    def delete_backward(self, steps=1):
+        start = self.clusters.previous(self.idx, steps)
+        if start < self.idx:
+            self._replace(start, self.idx - start, u'')
+            self.idx = start
     
-    def delete_forward(self):
-        if self.idx < len(self.text):
-            self.text = self.text[:self.idx] + self.text[self.idx+1:]
+    def delete_forward(self, steps=1):
+        end = self.clusters.next(self.idx, steps)
+        if end > self.idx:
+            self._replace(self.idx, end - self.idx, u'')
     
+    def undo(self):
+        """Undo the latest group of edits, return False if there are none."""
+        edit = self.history.undo()
+        if not edit:
+            return False
+        self._apply(edit.pos, len(edit.inserted), edit.removed)
+        self.idx = edit.idx
+        return True
+
+    def redo(self):
+        """Apply again the latest undone edits, return False if there are none."""
+        edit = self.history.redo()
+        if not edit:
+            return False
+        self._apply(edit.pos, len(edit.removed), edit.inserted)
+        self.idx = edit.pos + len(edit.inserted)
+        return True
+
+    def delete(self, start, end):
+        """Delete the text between `start` and `end` and return it."""
+        removed = self._text[start:end]
+        self._replace(start, end - start, u'')
+        if self.idx > end:
+            self.idx -= end - start
+        elif self.idx > start:
+            self.idx = start
+        return removed
+
+    def take_edits(self):
+        """Return the edits (undo.Edit) made since the previous call, and
+        start keeping track of them."""
+        edits, self.edits = self.edits, []
+        return edits or []
+
     def move_cursor_backward(self, steps=1):
         idx = self.idx
-        self.idx = max(0, self.idx - steps)
+        self.idx = self.clusters.previous(self.idx, steps)
         return idx != self.idx
 
     def move_cursor_forward(self, steps=1):
         idx = self.idx
-        self.idx = min(len(self.text), self.idx + steps)
+        self.idx = self.clusters.next(self.idx, steps)
         return idx != self.idx
+
+    def move_cursor_to(self, idx):
+        """Move to the start of the cluster containing `idx`."""
+        old_idx = self.idx
+        self.idx = self.clusters.floor(max(0, min(len(self._text), idx)))
+        return old_idx != self.idx
      
     def move_cursor_home(self):
         idx = self.idx
@@ -271,11 +863,88 @@ class IndexedLine(object):
         self.idx = len(self.text)
         return idx != self.idx
 
+    def move_cursor_up(self, steps=1):
+        return False
+
+    def move_cursor_down(self, steps=1):
+        return False
+
+class MultiLine(IndexedLine):
+    """IndexedLine whose text may contain newlines. It keeps an index of
+    the lines and of the rows they take on the terminal (see
+    lineindex.LineIndex), updated at each edit, so that moving between
+    indexes and screen positions costs O(log n).
+
+    `set_origin` must be called once the position of the first character
+    on the screen is known."""
+
+    multiline = True
+
+    def __init__(self, text=u'', idx=0, width=80):
+        self.index = LineIndex(text, width)
+        self.origin = (1, 1)
+        super(MultiLine, self).__init__(text, idx)
+
+    def _on_edit(self, pos, removed, inserted):
+        super(MultiLine, self)._on_edit(pos, removed, inserted)
+        self.index.update(self._text, pos, removed, inserted)
+
+    def move_cursor_home(self):
+        """Move to the start of the current line."""
+        idx = self.idx
+        self.idx = self.index.get_line(self.idx)[1]
+        return idx != self.idx
+
+    def move_cursor_end(self):
+        """Move to the end of the current line."""
+        idx = self.idx
+        line, start = self.index.get_line(self.idx)
+        self.idx = start + self.index.lengths[line]
+        return idx != self.idx
+
+    def move_cursor_up(self, steps=1):
+        row, col = self.index.get_position(self.idx, end_of_row=True)
+        if not row:
+            return False
+        self.idx = self.clusters.floor(self.index.get_index(max(0, row - steps), col))
+        return True
+
+    def move_cursor_down(self, steps=1):
+        row, col = self.index.get_position(self.idx, end_of_row=True)
+        if row + 1 >= self.index.get_row_count():
+            return False
+        self.idx = self.clusters.floor(self.index.get_index(row + steps, col))
+        return True
+
+    def set_origin(self, x, y, width):
+        """The first character is shown at column `x`, row `y` of a
+        terminal `width` columns wide."""
+        self.origin = (x, y)
+        self.index.set_width(width, offset=x - 1)
+
+    def get_screen_position(self, idx):
+        """Return the column and row (x, y) where `idx` is shown."""
+        row, col = self.index.get_position(idx)
+        return col + 1, self.origin[1] + row
+
+    def get_screen_index(self, x, y):
+        """Return the index closest to the column `x` and row `y`."""
+        row = y - self.origin[1]
+        start = self.clusters.floor(self.index.get_index(row, 0))
+        end = self.index.get_index(row, self.index.width)
+        # the rows are split by characters, the columns inside are cells
+        col = max(0, x - 1 - self.index.get_position(start)[1])
+        return min(end, get_column_index(self._text, start, col))
+
 class VTerm(object):
-    def __init__(self, term, x=0, y=0):
+    def __init__(self, term, x=0, y=0, output=None):
         self.term = term
+        self.output = output or TermWriter(term)
         self.cursor = [x, y]
         self.size = (0, 0) # width, height
+        # rows whose last column was left blank by a wide character that
+        # didn't fit there and has been shown on the next row
+        self.gaps = set()
         self._update_size()
         signal.signal(signal.SIGWINCH, self._update_size)
 
@@ -293,68 +962,251 @@ class VTerm(object):
     def get_size(self):
         return self.size
 
+    def get_offset(self, x, y):
+        """Return how many cells the position at column `x`, row `y` is
+        after the cursor (negative if it is before)."""
+        width, height = self.size
+        # the terminal scrolls when we write past the last row
+        cursor_y = min(self.cursor[1], height) if height else self.cursor[1]
+        return (y - cursor_y) * width + (x - self.cursor[0])
+
+    def _advance(self, text, gaps=None):
+        """Return where the cursor goes after `text` (without newlines),
+        starting from the current position. The indexes of `text` where a
+        wide character is moved to the next row are appended to `gaps`."""
+        width = self.size[0]
+        x, y = self.cursor
+        columns = get_width(text)
+        if x + columns <= width:
+            return x + columns, y
+        if x + columns == width + 1:
+            self.gaps.discard(y)
+            return 1, y + 1
+
+        for i, c in enumerate(text):
+            w = get_width(c)
+            if not w:
+                continue
+            if x + w - 1 > width:
+                # a wide character doesn't fit: the terminal shows it on
+                # the next row, the last column stays blank
+                self.gaps.add(y)
+                if gaps is not None:
+                    gaps.append(i)
+                x, y = 1, y + 1
+            x += w
+            if x > width:
+                self.gaps.discard(y)
+                x, y = 1, y + 1
+        return x, y
+
+    def _retreat(self, text):
+        """Return where the cursor was before `text` (without newlines),
+        ending at the current position."""
+        width = self.size[0]
+        x, y = self.cursor
+        columns = get_width(text)
+        if columns < x:
+            x -= columns
+        else:
+            for c in reversed(text):
+                w = get_width(c)
+                if not w:
+                    continue
+                if x - w < 1:
+                    y -= 1
+                    x = width if y in self.gaps else width + 1
+                x -= w
+        if x == 1 and y - 1 in self.gaps:
+            # before the wide character moved to this row, as in _advance
+            return width, y - 1
+        return x, y
+
     def move_cursor_forward(self, steps=1, update_idx_only=False):
+        """Move the cursor `steps` cells forward, or over `steps` if it is
+        the text shown there (so that the wide characters moved to the next
+        row are accounted for)."""
         if not steps:
             return
 
         width, height = self.size
         x, y = self.cursor
 
-        down_steps = 0
-
-        if x + steps <= width:
-            # stay on the same line
-            self.cursor[0] += steps
+        if isinstance(steps, int):
+            if x + steps <= width:
+                # stay on the same line
+                self.cursor[0] += steps
+            else:
+                # we are going down
+                self.cursor[0] = (x + steps) % width or width
+                self.cursor[1] = y + int((x + steps -1) / float(width))
         else:
-            # we are going down
-            self.cursor[0] = (x + steps) % width or width
-            down_steps = int((x + steps -1) / float(width))
-            self.cursor[1] = y + down_steps
+            self.cursor = list(self._advance(steps))
+        down_steps = self.cursor[1] - y
 
         if down_steps and not update_idx_only:
-            sys.stdout.write(u'\r' + u'\n' * down_steps)
+            self.output.write(b'\r' + b'\n' * down_steps)
             x = 1
 
         # now we are on the right line
         if update_idx_only or x == self.cursor[0]:
             pass
         elif x < self.cursor[0]:
-            sys.stdout.write(self.term.get('cuf1').value * (self.cursor[0] - x))
+            self.output.cap('cuf1', self.cursor[0] - x)
         else:
-            sys.stdout.write(self.term.get('cub1').value * (x - self.cursor[0]))
+            self.output.cap('cub1', x - self.cursor[0])
         
     
     def move_cursor_backward(self, steps=1, update_idx_only=False):
+        """Move the cursor `steps` cells backward, or back over `steps` if
+        it is the text shown there."""
         if not steps:
             return
         
         width = self.size[0]
         x, y = self.cursor
 
-        if steps < x:
-            # stay on the same line
-            self.cursor[0] -= steps
+        if isinstance(steps, int):
+            new_x = (x - steps) % width or width
+            new_y = y - 1 + int((x - steps) / float(width)) if steps >= x else y
         else:
-            # we are going up
-            self.cursor[0] = (x - steps) % width or width
-            self.cursor[1] = y - 1 + int((x - steps) / float(width))
+            new_x, new_y = self._retreat(steps)
+
+        if new_y == y:
+            # stay on the same line
+            self.cursor[0] = new_x
+            if not update_idx_only:
+                self.output.cap('cub1', x - new_x)
+            return
 
+        # we are going up (cub1 doesn't leave the first column)
+        self.cursor = [new_x, new_y]
         if not update_idx_only:
-            sys.stdout.write(self.term.get('cub1').value * steps)
+            self.output.cap('cuu1', y - new_y)
+            self.output.write(b'\r')
+            self.output.cap('cuf1', new_x - 1)
+
+    def move_cursor_to(self, x, y):
+        """Move the cursor to column `x`, row `y`."""
+        if y > self.cursor[1]:
+            # cud1 may be a newline, that brings us to the first column
+            self.output.cap('cud1', y - self.cursor[1])
+            self.output.write(b'\r')
+            self.cursor = [1, y]
+        elif y < self.cursor[1]:
+            self.output.cap('cuu1', self.cursor[1] - y)
+            self.cursor[1] = y
+
+        if x > self.cursor[0]:
+            self.output.cap('cuf1', x - self.cursor[0])
+        elif x < self.cursor[0]:
+            self.output.cap('cub1', self.cursor[0] - x)
+        self.cursor[0] = x
+
+    def flush(self):
+        self.output.flush()
 
     def write(self, text):
-        sys.stdout.write(text)
-        self.move_cursor_forward(steps=len(text), update_idx_only=True)
-        sys.stdout.flush()
+        steps = 0
+        gaps = []
+        start = 0
+        for i, line in enumerate(text.split(u'\n')):
+            if i and not (steps and self.cursor[0] == 1):
+                # the terminal translates the newlines to \r\n; after a
+                # full row the cursor was waiting to wrap there, and the
+                # newline only moves it out of it
+                self.cursor = [1, self.cursor[1] + 1]
+            found = []
+            self.cursor = list(self._advance(line, found))
+            gaps.extend(start + j for j in found)
+            start += len(line) + 1
+            steps = get_width(line)
+
+        if gaps:
+            # the terminal leaves the last column as it was: clear it
+            parts = []
+            start = 0
+            for i in gaps:
+                parts += [text[start:i], u' ']
+                start = i
+            text = u''.join(parts) + text[start:]
+        self.output.write(text)
+
+        if steps and self.cursor[0] == 1:
+            # the text filled the row: the terminal keeps the cursor on the
+            # last column until the next character (pending wrap), where
+            # inserting or moving would act on the wrong row
+            self.output.write(b'\r\n')
+
+    def write_styled(self, styled):
+        """Write a style.StyledText, leaving the default attributes set."""
+        for text, style in styled:
+            self.output.set_style(style)
+            self.write(text)
+        self.output.set_style(DEFAULT)
+
+class NullVTerm(VTerm):
+    """VTerm used when the input doesn't come from a terminal: it keeps
+    track of the cursor, but nothing is shown and the terminal is never
+    queried."""
+
+    def __init__(self, term, x=1, y=1, size=(80, 24)):
+        self.term = term
+        self.output = TermWriter(term, fd=-1)
+        self.cursor = [x, y]
+        self.size = size
+        self.gaps = set()
+
+    def move_cursor_forward(self, steps=1, update_idx_only=False):
+        super(NullVTerm, self).move_cursor_forward(steps, update_idx_only=True)
+
+    def move_cursor_backward(self, steps=1, update_idx_only=False):
+        super(NullVTerm, self).move_cursor_backward(steps, update_idx_only=True)
+
+    def move_cursor_to(self, x, y):
+        self.cursor = [x, y]
+
+    def flush(self):
+        del self.output.buffer[:]
 
 class RichLine(object):
-    def __init__(self, term=None, vterm=None, iline=None):
+    # the shortest time between two batches of print_above
+    log_interval = 0.05
+
+    def __init__(self, term=None, vterm=None, iline=None, mouse=False,
+                 merge_repeats=False, highlighter=None, reader=get_chunk,
+                 observers=(), text_runs=False, synchronized=None,
+                 keymap=None, horizontal_scroll=False, transform=None,
+                 idle=None, keyboard_protocol=False, mouse_motion=False):
+        # when the input is piped there's no terminal to query or draw on
+        self.interactive = sys.stdin.isatty()
+
         if not term:
-            term = terminfo.load_terminfo()
-        
-        if not vterm:
-            row, col = get_cursor_position()
+            # the piped input has no escape sequences to decode, and the
+            # entry of $TERM may not even be readable
+            term = terminfo.load_terminfo() if self.interactive else terminfo.Terminfo('dumb')
+
+        # the terminal features are probed once per session, together
+        # with the cursor position (see probe.py)
+        self.features = None
+        if not vterm and self.interactive:
+            self.features = probe.get_features(cursor=True)
+            row, col = self.features.cursor or (1, 1)
             vterm = VTerm(term, x=col, y=row)
+        elif not vterm:
+            vterm = NullVTerm(term)
+
+        # each frame is sent as one write, that the terminal may show
+        # atomically if it supports synchronized output
+        if synchronized is None and self.features:
+            synchronized = self.features.synchronized_output
+        if synchronized is not None:
+            vterm.output.synchronized = synchronized and self.interactive
+        if self.features and self.features.truecolor is not None:
+            vterm.output.truecolor = self.features.truecolor
+
+        if reader is get_chunk and not self.interactive:
+            reader = get_stream_input()
         
         if not iline:
             iline = IndexedLine()
@@ -362,170 +1214,763 @@ class RichLine(object):
         self.term = term
         self.vterm = vterm
         self.iline = iline
+        self.mouse = mouse and self.interactive
+        self.mouse_motion = mouse_motion
+        # the kitty keyboard protocol, if the terminal supports it
+        self.keyboard = bool(keyboard_protocol and self.interactive and
+                             probe.get_features().keyboard is not None)
+        self.merge_repeats = merge_repeats
+        self.reader = reader
+        self.text_runs = text_runs
+        # instances of observers.AsyncObserver, notified after the rendering
+        self.observers = list(observers)
+        # what each key does (see keymap.py)
+        self.keymap = get_emacs_keymap() if keymap is None else keymap
+        self.chord = None # the Keymap of the chord being typed
+        self.killed = u'' # the text to yank
+        # how the text is shown (see display.py)
+        self.transform = transform
+        # jobs to run while the user isn't typing (an idle.IdleQueue)
+        self.idle = idle
+        # held while drawing, by the input loop and by other threads
+        self.lock = threading.RLock()
+        self._prompt = None # (prompt, row where it starts) while reading
+        self._drawn = None # (text, idx) as shown on the screen
+        self.input = None # the InputBuffer being read
+        self._logs = [] # queued by print_above
+        self._log_lock = threading.Lock()
+        self._log_timer = None
+        self._last_log_flush = 0
+
+        # the callback that updates the terminal
+        self.render = update_vterm
+        if transform:
+            # first, so that nothing shows a masked text in clear
+            self.render = TransformRenderer(transform, iline.text)
+        elif highlighter:
+            self.render = HighlightRenderer(highlighter, iline.text)
+        elif iline.multiline:
+            self.render = render_multiline
+        if horizontal_scroll and not iline.multiline and not transform:
+            self.render = ScrollRenderer()
+        if not self.interactive:
+            self.render = skip_render
     
-    def read(self, cb=None, eot=u'\n', prompt=u''):
-        for el, prev_text, text, prev_idx, idx in self.__iter__(cb, prompt):
-            if el.value in eot:
-                break
+    def read(self, cb=None, eot=u'\n', prompt=u'', timeout=None):
+        """Return the text typed until one of the characters in `eot`.
+        InputTimeout is raised if that takes more than `timeout` seconds."""
+        deadline = None if timeout is None else time.time() + timeout
+        events = 0
+        try:
+            for el, prev_text, text, prev_idx, idx in self.__iter__(cb, prompt, deadline):
+                events += 1
+                if el.value in eot:
+                    break
+            else:
+                if not events and not self.interactive:
+                    # like input(), let the caller know that the input ended
+                    raise EOFError
+        except InputTimeout as e:
+            e.text = self.iline.text
+            raise
         
         return self.iline.text
 
-    def __iter__(self, cb=None, prompt=u''):
+    def __iter__(self, cb=None, prompt=u'', deadline=None):
+        render = self.render
         if cb:
             that_cb = cb
-            cb = lambda f,*args: that_cb(update_vterm, *args)
+            cb = lambda f,*args: that_cb(render, *args)
         else:
-            cb = update_vterm
+            cb = render
 
         prev_text = self.iline.text
         prev_idx = self.iline.idx
+        self.iline.take_edits()
 
+        # where the prompt starts, to draw it again below the lines printed
+        # by print_above
+        self._prompt = (prompt, self.vterm.cursor[1])
+        self._drawn = (prev_text, prev_idx)
         if prompt:
             # we must update the starting cursor postion
-            self.vterm.move_cursor_forward(len(prompt), update_idx_only=True)
+            self.vterm.move_cursor_forward(prompt, update_idx_only=True)
+        self._set_origin()
 
-        
-        for key_event in get_rich_char(prompt, self.term):
-            if isinstance(key_event, PrintableChar):
-                self.iline.insert(key_event.value)
-            elif is_char_backspace(key_event.value):
-                self.iline.delete_backward()
-            elif isinstance(key_event, EscapeSequence) and is_capability_delete(key_event.capability):
-                self.iline.delete_forward()
-            elif is_char_interrupt(key_event.value):
-                raise StopIteration
-
-            yield (key_event, prev_text, self.iline.text, prev_idx, self.iline.idx)
-            
-            cb(None, key_event, self.term, self.vterm, self.iline, prev_text, self.iline.text, prev_idx, self.iline.idx)
+        reader = self.reader
+        if deadline is not None or self.idle is not None:
+            # the reader must accept them (e.g. get_chunk, StreamInput)
+            reader = functools.partial(reader, deadline=deadline, idle=self.idle)
+
+        try:
+            for item in self._iter_events(cb, prompt, reader, prev_text, prev_idx):
+                yield item
+        finally:
+            # the lines still queued go above the prompt
+            self.flush_logs()
+            self._prompt = None
+
+    def _set_origin(self):
+        """The text starts at the cursor position."""
+        if self.iline.multiline:
+            x, y = self.vterm.cursor
+            self.iline.set_origin(x, y, self.vterm.size[0])
+        elif isinstance(self.render, ScrollRenderer):
+            self.render.set_origin(*self.vterm.cursor)
+
+    def _iter_events(self, cb, prompt, reader, prev_text, prev_idx):
+        self.input = InputBuffer(reader(prompt))
+        for key_event in get_rich_char(prompt, self.term, self.mouse,
+                                       self.merge_repeats, reader,
+                                       self.text_runs, self.keyboard,
+                                       self.input, self.mouse_motion):
+            table = self.chord or self.keymap
+            action = table.get(get_key(key_event))
+            if action is None and table is self.keymap and \
+               isinstance(key_event, PrintableChar):
+                action = insert
+
+            if action is interrupt:
+                return
+
+            with self.lock:
+                self.iline.history.latest = None
+                if isinstance(action, Keymap):
+                    # wait for the next key of the chord
+                    self.chord = action
+                else:
+                    self.chord = None
+                    if action:
+                        action(self, key_event)
+
+                # what the key changed, so that nobody has to compare the texts
+                key_event.delta = get_delta(prev_text, self.iline.text, self.iline.take_edits())
+                # the edits of the caller and of the callbacks are undone
+                # with the key
+                self.iline.fold_edits = True
+
+            try:
+                yield (key_event, prev_text, self.iline.text, prev_idx, self.iline.idx)
+
+                with self.lock:
+                    # print_above may have drawn the line again while the caller
+                    # had the key: the frame starts from what is on the screen
+                    drawn_text, drawn_idx = self._drawn
+                    cb(None, key_event, self.term, self.vterm, self.iline, drawn_text, self.iline.text, drawn_idx, self.iline.idx)
+                    self._drawn = (self.iline.text, self.iline.idx)
+            finally:
+                self.iline.fold_edits = False
+
+            for observer in self.observers:
+                observer.put(key_event, prev_text, self.iline.text, prev_idx, self.iline.idx)
             
+            # the edits of the callbacks are part of the next `prev_text`
+            self.iline.take_edits()
             prev_text = self.iline.text
             prev_idx = self.iline.idx
 
+    def is_input_pending(self):
+        """Check whether some input is waiting to be handled, either already
+        read (e.g. the rest of a paste) or still to be read."""
+        if self.input is not None and self.input.pending():
+            return True
+        return self.interactive and is_input_pending()
+
+    def print_above(self, text):
+        """Print `text` above the prompt. It may be called from any thread.
+
+        The lines are queued and written in batches, at most once every
+        `log_interval` seconds: the prompt is cleared, all the queued lines
+        are written and the prompt is drawn again below them, so that a
+        flood of lines doesn't slow down the input."""
+        if not text.endswith(u'\n'):
+            text += u'\n'
+        with self._log_lock:
+            self._logs.append(text)
+            if self._log_timer is None:
+                delay = max(0, self._last_log_flush + self.log_interval - time.time())
+                self._log_timer = threading.Timer(delay, self.flush_logs)
+                self._log_timer.daemon = True
+                self._log_timer.start()
+
+    def flush_logs(self):
+        """Write the lines queued by print_above now."""
+        with self._log_lock:
+            if self._log_timer is not None:
+                self._log_timer.cancel()
+                self._log_timer = None
+            logs, self._logs = self._logs, []
+            self._last_log_flush = time.time()
+        if not logs:
+            return
+
+        text = u''.join(logs)
+        with self.lock:
+            if not self.interactive:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+                return
+
+            vterm = self.vterm
+            if self._prompt is None:
+                vterm.write(text)
+                vterm.flush()
+                return
+
+            prompt, y = self._prompt
+            vterm.move_cursor_to(1, y)
+            vterm.output.cap('clr_eos')
+            vterm.write(text)
+            self._redraw(prompt)
+
+    def _redraw(self, prompt):
+        """Draw the prompt and the text again, from the start of a row."""
+        self._prompt = (prompt, self.vterm.cursor[1])
+        self.vterm.write(prompt)
+        self._set_origin()
+        reset = getattr(self.render, 'reset', None)
+        if reset:
+            reset()
+        text, idx = self.iline.text, self.iline.idx
+        self.render(None, None, self.term, self.vterm, self.iline,
+                    u'', text, 0, idx)
+        self._drawn = (text, idx)
+
 def update_vterm(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
     cb = cb or (lambda f, *args: args)
 
+    edit = None
     if previous != current:
-        
         # detect a common prefix to rewrite as less as possible
-        prefix = os.path.commonprefix([previous, current])
+        edit = get_key_edit(key_event, iline, previous, current, min(prev_idx, next_idx))
+
+    clusters = iline.clusters if current is iline.text else None
+    draw_edit(vterm, previous, current, prev_idx, next_idx, edit, clusters)
+    vterm.flush()
+    return cb(key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+def draw_edit(vterm, previous, current, prev_idx, next_idx, edit, clusters=None):
+    """Show the `edit` (position, removed, inserted) that turned `previous`
+    into `current`, and move the cursor from `prev_idx` to `next_idx`.
+    `edit` is None when only the cursor moved. `clusters` is the
+    ClusterIndex of `current`, if there is one."""
+    if edit:
+        pos, removed, inserted = edit
 
         # move the cursor to the end of the longest common prefix
-        if len(prefix) < prev_idx:
-            vterm.move_cursor_backward(prev_idx - len(prefix))
-        elif len(prefix) > prev_idx:
-            vterm.move_cursor_forward(len(prefix) - prev_idx)
+        if pos < prev_idx:
+            vterm.move_cursor_backward(previous[pos:prev_idx])
+        elif pos > prev_idx:
+            vterm.move_cursor_forward(current[prev_idx:pos])
         
-        # clear text until the end of the screen
-        sys.stdout.write(term.get(u'clr_eos').value)
-        
-        # write the new content
-        vterm.write(current[len(prefix):])
-        
-        # set the cursor at the end of the newly inserted text
-        vterm.move_cursor_backward(len(current) - next_idx)
+        if edit_in_place(vterm, previous, current, pos, removed, inserted):
+            # the cursor is at the end of the inserted text
+            end = pos + inserted
+            if next_idx < end:
+                vterm.move_cursor_backward(current[next_idx:end])
+            elif next_idx > end:
+                vterm.move_cursor_forward(current[end:next_idx])
+        else:
+            # write again the whole cluster: its marks written alone on the
+            # next row (after a full one) wouldn't join its first character
+            start = get_cluster_start(current, pos, clusters)
+            if start < pos:
+                vterm.move_cursor_backward(current[start:pos])
+
+            # clear text until the end of the screen
+            vterm.output.cap('clr_eos')
+            
+            # write the new content
+            vterm.write(current[start:])
+            
+            # set the cursor at the end of the newly inserted text
+            vterm.move_cursor_backward(current[next_idx:])
     
-    elif isinstance(key_event, EscapeSequence):
-        if is_capability_arrow_left(key_event.capability):
-            moved = iline.move_cursor_backward()
-            if moved:
-                vterm.move_cursor_backward()
-        elif is_capability_arrow_right(key_event.capability):
-            moved = iline.move_cursor_forward()
-            if moved:
-                vterm.move_cursor_forward()
-        elif is_capability_home(key_event.capability):
-            moved = iline.move_cursor_home()
-            if moved:
-                vterm.move_cursor_backward(prev_idx)
-        elif is_capability_end(key_event.capability):
-            moved = iline.move_cursor_end()
-            if moved:
-                vterm.move_cursor_forward(len(current)-prev_idx)
+    # only the cursor moved (see keymap.py for the actions)
+    elif next_idx < prev_idx:
+        vterm.move_cursor_backward(current[next_idx:prev_idx])
+    elif next_idx > prev_idx:
+        vterm.move_cursor_forward(current[prev_idx:next_idx])
+
+def get_cluster_start(text, pos, clusters=None):
+    """Return the start of the grapheme cluster containing `text[pos]`, from
+    `clusters` (the ClusterIndex of `text`) if given."""
+    if clusters is not None:
+        return clusters.floor(pos)
+    while not is_boundary(text, pos):
+        pos -= 1
+    return pos
+
+def get_cluster_end(text, pos, clusters=None):
+    """Return the end of the grapheme cluster containing `text[pos]`, or
+    `pos` if a cluster starts there (see get_cluster_start)."""
+    if get_cluster_start(text, pos, clusters) == pos:
+        return pos
+    if clusters is not None:
+        return clusters.next(pos)
+    while not is_boundary(text, pos):
+        pos += 1
+    return pos
+
+def edit_in_place(vterm, previous, current, pos, removed, inserted):
+    """Insert or delete the edited characters on the terminal with the
+    insert/delete character capabilities, moving the rest of the row
+    instead of writing it again. The characters replaced by as wide ones
+    are simply written over. The cursor must be at `pos`.
+    Return False, having written nothing, when it's not possible: the
+    terminal lacks the capabilities, the replaced characters change width
+    or the text after the edit doesn't stay within the row (the characters
+    pushed out of a row are lost, they don't wrap). Only the rest of the
+    row is measured, so it costs O(terminal width)."""
+    output = vterm.output
+
+    overwritten = min(removed, inserted)
+    written = current[pos:pos + overwritten]
+    if overwritten:
+        replaced = previous[pos:pos + overwritten]
+        if u'\n' in written or u'\n' in replaced or not get_width(written) or \
+           get_width(written) != get_width(replaced) or \
+           not is_boundary(current, pos) or \
+           not is_boundary(previous, pos + overwritten) or \
+           not is_boundary(current, pos + overwritten):
+            return False
+        pos += overwritten
+        removed -= overwritten
+        inserted -= overwritten
+    if not (removed or inserted):
+        vterm.write(written)
+        return True
+
+    text = current if inserted else previous
+    end = pos + (inserted or removed)
+    edited = text[pos:end]
+    columns = get_width(edited)
+
+    # a combining character would change the cell before it
+    if not columns or not is_boundary(text, pos) or not is_boundary(text, end):
+        return False
+    if inserted and end == len(current) and u'\n' not in edited:
+        # appended: written as it is, wrapping like any text
+        vterm.write(written + edited)
+        return True
+
+    # the rest of the text must end before the last column of the row, so
+    # that no wide character is moved to the next one (there's no room at
+    # all from the blank column a wide character may leave there)
+    room = vterm.size[0] - vterm.cursor[0] - get_width(written)
+    if len(text) - pos > room:
+        return False
+    tail = text[pos:]
+    if u'\n' in tail or get_width(tail) > room:
+        return False
+
+    if inserted:
+        if output.has('ich'):
+            how = 'ich'
+        elif output.has('smir') and output.has('rmir'):
+            how = 'smir'
+        elif output.has('ich1'):
+            how = 'ich1'
+        else:
+            return False
+    elif output.has('dch'):
+        how = 'dch'
+    elif output.has('dch1'):
+        how = 'dch1'
+    else:
+        return False
+
+    vterm.write(written)
+    if how == 'smir':
+        output.cap('smir')
+        vterm.write(edited)
+        output.cap('rmir')
+    elif how in ('ich', 'dch'):
+        output.param(how, columns)
+    else:
+        output.cap(how, columns)
+    if how in ('ich', 'ich1'):
+        vterm.write(edited)
 
-    sys.stdout.flush()
+    return True
+
+def skip_render(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+    """Callback to use in place of `update_vterm` when nothing is shown."""
+    cb = cb or (lambda f, *args: args)
+    return cb(key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+def get_delta(previous, current, edits):
+    """Return the undo.Edit that turned `previous` into `current` through
+    `edits`, None if there are none."""
+    if len(edits) < 2:
+        return edits[0] if edits else None
+    pos, removed, inserted = get_edit(previous, current)
+    return Edit(pos, previous[pos:pos + removed], current[pos:pos + inserted], edits[0].idx)
+
+def get_key_edit(key_event, iline, previous, current, hint=None):
+    """Like get_edit, but taken from the delta of `key_event` (see
+    RichLine.__iter__) when it describes the change, in O(1)."""
+    delta = getattr(key_event, 'delta', None)
+    # the delta is stale if a callback changed the text afterwards
+    if delta is not None and current is iline.text and not iline.edits and \
+       len(previous) - len(delta.removed) + len(delta.inserted) == len(current):
+        return delta.pos, len(delta.removed), len(delta.inserted)
+    return get_edit(previous, current, hint)
+
+def get_edit(previous, current, hint=None):
+    """Return the edit that turned `previous` into `current` as a tuple
+    (position, removed, inserted), with the number of characters removed
+    and inserted at `position`.
+    An insertion or a deletion inside a run of repeated characters may be
+    at several positions: the one closest to `hint` (e.g. the cursor) is
+    preferred, otherwise the last one."""
+    pos = len(os.path.commonprefix([previous, current]))
+    suffix = len(os.path.commonprefix([previous[pos:][::-1], current[pos:][::-1]]))
+    removed = len(previous) - pos - suffix
+    inserted = len(current) - pos - suffix
+
+    if hint is not None and hint < pos and not (removed and inserted):
+        text = current if inserted else previous
+        end = pos + inserted + removed
+        while pos > hint and text[pos - 1] == text[end - 1]:
+            pos -= 1
+            end -= 1
+
+    return pos, removed, inserted
+
+class HighlightRenderer(object):
+    """Callback to use in place of `update_vterm`, that colours the text
+    according to `highlighter` (see highlight.Highlighter).
+    The text is lexed again only around each edit and only the cells whose
+    contents or styles changed are repainted, setting only the attributes
+    that change from a token to the next."""
+
+    def __init__(self, highlighter, text=u''):
+        self.tokenization = Tokenization(highlighter, text)
+
+    def reset(self):
+        """Forget what is on the screen: the next frame draws everything."""
+        self.tokenization = Tokenization(self.tokenization.highlighter, u'')
+
+    def __call__(self, cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+        if self.tokenization.text == current:
+            # nothing to highlight, but the cursor may move
+            return update_vterm(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+        cb = cb or (lambda f, *args: args)
+
+        old = self.tokenization.text
+        if old is previous:
+            pos, removed, inserted = get_key_edit(key_event, iline, previous, current)
+        else:
+            pos, removed, inserted = get_edit(old, current)
+        start, end = self.tokenization.update(current, pos, removed, inserted)
+        # whole clusters are painted again (see draw_edit)
+        clusters = iline.clusters if current is iline.text else None
+        start = get_cluster_start(current, start, clusters)
+        end = get_cluster_end(current, end, clusters)
+
+        # the text before `pos` didn't change
+        if get_width(old[pos:pos + removed]) == get_width(current[pos:pos + inserted]):
+            if start < prev_idx:
+                vterm.move_cursor_backward(old[start:prev_idx])
+            elif start > prev_idx:
+                vterm.move_cursor_forward(current[prev_idx:start])
+        else:
+            # the rest of the text is shifted: on the terminal too if
+            # possible, then only the damaged range is painted again
+            if pos < prev_idx:
+                vterm.move_cursor_backward(old[pos:prev_idx])
+            elif pos > prev_idx:
+                vterm.move_cursor_forward(current[prev_idx:pos])
+            if edit_in_place(vterm, old, current, pos, removed, inserted):
+                vterm.move_cursor_backward(current[start:pos + inserted])
+            else:
+                end = len(current)
+                vterm.move_cursor_backward(current[start:pos])
+                vterm.output.cap('clr_eos')
+
+        # only the attributes that differ between neighbouring tokens are
+        # written (see TermWriter.set_style)
+        output = vterm.output
+        painted = start
+        for token_start, token_end, style in self.tokenization.iter_tokens(start, end):
+            # the marks of a cluster split by the tokens go with its first
+            # character, in the same write
+            if token_end < end:
+                token_end = get_cluster_start(current, token_end, clusters)
+            if token_end <= painted:
+                continue
+            if style is None or isinstance(style, Style):
+                output.set_style(style or DEFAULT)
+            else:
+                # an escape sequence, setting attributes we don't know
+                output.set_style(DEFAULT)
+                output.write(style)
+                output.forget_style()
+            vterm.write(current[painted:token_end])
+            painted = token_end
+        output.set_style(DEFAULT)
+
+        if next_idx < end:
+            vterm.move_cursor_backward(current[next_idx:end])
+        elif next_idx > end:
+            vterm.move_cursor_forward(current[end:next_idx])
+
+        vterm.flush()
+        return cb(key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+class ScrollRenderer(object):
+    """Callback to use in place of `update_vterm`, that shows the text on a
+    single row, scrolling it horizontally to keep the cursor visible (like
+    the horizontal-scroll-mode of readline). The characters hidden on the
+    left and on the right are replaced by `markers`.
+    Only the visible part of the text is measured and written, so each key
+    press costs O(terminal width) whatever the length of the text."""
+
+    def __init__(self, markers=(u'<', u'>')):
+        self.markers = markers
+        self.origin = (1, 1)
+        self.start = 0      # index of the first character shown
+        self.shown = None   # the row as written the last time
+        self.end = 1        # column after the last character shown
+
+    def set_origin(self, x, y):
+        """The first character is shown at column `x`, row `y`."""
+        self.origin = (x, y)
+        self.shown = None
+
+    def reset(self):
+        """Forget what is on the screen: the next frame draws everything."""
+        self.shown = None
+
+    def _fits(self, text, start, idx, limit):
+        """Check whether text[start:idx] takes at most `limit` columns,
+        looking at `limit` characters at most."""
+        width = 0
+        for i in range(start, idx):
+            width += get_width(text[i])
+            if width > limit:
+                return False
+        return True
+
+    def _scroll(self, iline, columns):
+        text, idx = iline.text, iline.idx
+        start = self.start
+        limit = columns - 2 - (1 if start else 0)
+        # the cursor on the left marker would leave no text before it
+        if (start < idx or not start) and self._fits(text, start, idx, limit):
+            return start
+        if self._fits(text, 0, idx, columns - 2):
+            return 0
+
+        # put the cursor in the middle
+        width = 0
+        start = idx
+        while start > 0 and width < columns // 2:
+            start -= 1
+            width += get_width(text[start])
+        return iline.clusters.floor(start)
+
+    def _get_row(self, text, start, columns):
+        """Return the row showing `text` from `start`, and the index after
+        the last character shown."""
+        left = self.markers[0] if start else u''
+        space = columns - len(left)
+        width = 0
+        end = start
+        while end < len(text):
+            w = get_width(text[end])
+            if width + w > space:
+                break
+            width += w
+            end += 1
+
+        if end < len(text):
+            # make room for the right marker
+            while end > start and width > space - 1:
+                end -= 1
+                width -= get_width(text[end])
+            return left + text[start:end] + self.markers[1], end
+        return left + text[start:end], end
+
+    def __call__(self, cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+        cb = cb or (lambda f, *args: args)
+
+        x, y = self.origin
+        # the last column is left empty, so that the row never wraps
+        columns = max(3, vterm.size[0] - x)
+
+        self.start = self._scroll(iline, columns)
+        row, end = self._get_row(current, self.start, columns)
+
+        if row != self.shown:
+            shown = self.shown or u''
+            # rewrite only what follows the common prefix
+            pos = 0
+            limit = min(len(row), len(shown))
+            while pos < limit and row[pos] == shown[pos]:
+                pos += 1
+            # don't split a character from its combining marks
+            while 0 < pos < len(row) and not get_width(row[pos]):
+                pos -= 1
+            if self.shown is None:
+                pos = 0
+
+            vterm.move_cursor_to(x + get_width(row[:pos]), y)
+            vterm.write(row[pos:])
+            if self.shown is None or get_width(shown) > get_width(row):
+                vterm.output.cap('el')
+            self.shown = row
+            self.end = vterm.cursor[0]
+
+        column = x + (1 if self.start else 0) + \
+                 get_width(current[self.start:max(self.start, next_idx)])
+        vterm.move_cursor_to(column, y)
+        vterm.flush()
+        return cb(key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+class TransformRenderer(object):
+    """Callback to use in place of `update_vterm`, that shows the text
+    through `transform` (see display.DisplayTransform).
+    The transform turns each edit of the text into an edit of the shown
+    text, and only that is written."""
+
+    def __init__(self, transform, text=u''):
+        self.transform = transform
+        transform.reset(text)
+        self.text = text             # the text of the latest frame
+        self.shown = transform.text  # what it looks like
+
+    def __call__(self, cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+        cb = cb or (lambda f, *args: args)
+
+        transform = self.transform
+        shown_prev_idx = transform.to_display(prev_idx)
+        edit = transform.take_changes()
+        if current != self.text:
+            if self.text is previous:
+                buffer_edit = get_key_edit(key_event, iline, previous, current,
+                                           min(prev_idx, next_idx))
+            else:
+                buffer_edit = get_edit(self.text, current, min(prev_idx, next_idx))
+            edit = merge_edits(edit, transform.update(current, *buffer_edit))
+            self.text = current
+
+        draw_edit(vterm, self.shown, transform.text, shown_prev_idx,
+                  transform.to_display(next_idx), edit)
+        self.shown = transform.text
+        vterm.flush()
+        return cb(key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+    def reset(self):
+        """Forget what is on the screen: the next frame draws everything."""
+        self.transform.take_changes()
+        self.transform._changed((0, 0, len(self.transform.text)))
+        self.shown = u''
+
+    def refresh(self, vterm, idx):
+        """Show the changes of the transform made outside of an edit (e.g.
+        Mask.hide), with the cursor at the text index `idx`."""
+        edit = self.transform.take_changes()
+        if edit:
+            shown_idx = self.transform.to_display(idx)
+            draw_edit(vterm, self.shown, self.transform.text, shown_idx, shown_idx, edit)
+            self.shown = self.transform.text
+            vterm.flush()
+
+def render_multiline(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+    """Callback to use in place of `update_vterm` when `iline` is a
+    MultiLine: every position on the screen comes from its line index."""
+    cb = cb or (lambda f, *args: args)
+
+    if iline.index.width != vterm.size[0]:
+        iline.index.set_width(vterm.size[0])
+
+    if previous != current:
+        pos = get_key_edit(key_event, iline, previous, current)[0]
+        if pos and current[pos - 1] != u'\n' and \
+           iline.get_screen_position(pos)[0] == 1:
+            # the row before is full: writing its last character again
+            # leaves the cursor waiting to wrap, as after the first time
+            pos = iline.clusters.floor(pos - 1)
+        vterm.move_cursor_to(*iline.get_screen_position(pos))
+        vterm.output.cap('clr_eos')
+        vterm.write(current[pos:])
+
+    vterm.move_cursor_to(*iline.get_screen_position(iline.idx))
+    vterm.flush()
     return cb(key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
 
 
 class RichPassword(RichLine):
-    def __init__(self, *args):
-        super(RichPassword, self).__init__(*args)
-        self.clear_text = False
+    """RichLine showing an asterisk for each character (see display.Mask)."""
+
+    # how long the latest typed character is shown, in seconds
+    reveal_time = 1.0
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('transform', Mask())
+        super(RichPassword, self).__init__(*args, **kwargs)
+        self.mask = self.transform
+        # show for a moment the latest typed character
+        self.mask.reveal_inserted = self.interactive
         self.timer = None
-        self.replace_event = threading.Event()
-        self.replace_event.set()
-    
-    def read(self, cb=None, eot=u'\n', prompt=u''):
+
+    @property
+    def clear_text(self):
+        return self.mask.clear
+
+    def read(self, cb=None, eot=u'\n', prompt=u'', timeout=None):
         if not cb:
             cb = lambda f, *args: f(None, *args)
 
         inner_cb = lambda f, *args: cb(lambda z,*k: self._on_key_pressed(f, *k), *args)
         
-        pw = super(RichPassword, self).read(inner_cb, eot, prompt)
-        
-        self.replace_previous_char(self.iline.idx)
-        
-        return pw
+        try:
+            return super(RichPassword, self).read(inner_cb, eot, prompt, timeout)
+        finally:
+            if self.timer:
+                self.timer.cancel()
+            self._hide()
     
     def _on_key_pressed(self, cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
-        self.replace_event.wait()
         if self.timer:
             self.timer.cancel()
         
         # when F1 is pressed, toggle the asterisks
         if isinstance(key_event, EscapeSequence) and key_event.capability.capname == 'kf1':
-            self.clear_text = not self.clear_text
-            if not self.clear_text:
-                current = '*' * len(current)
-
-            vterm.move_cursor_backward(prev_idx)
-            vterm.write(current)
-            vterm.move_cursor_backward(len(current) - next_idx)
-            sys.stdout.flush()
-            
-            return cb(None, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
-
-        if not self.clear_text and not is_char_backspace(key_event.value): 
-            self.replace_previous_char(prev_idx)
-        
-        if not self.clear_text and current and previous != current:
-
-            # Transform `current` while keeping the string at the same length (otherwise I should modify 
-            # indexes and cursor in iline and vterm.)
-            if len(current) > len(previous):
-                latest_char = current[prev_idx:prev_idx + 1]
-                current = u'*' * len(current)
-                current = current[:prev_idx] + latest_char + current[prev_idx+1:]
-                # after one second we'll make the last typed character become an asterisk
-                self.timer = threading.Timer(1, self.on_timer_elapsed, [self.replace_event])
-                self.timer.start()
-            else:
-                current = u'*' * len(current)
-
-        return cb(None, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
-
-    def replace_previous_char(self, idx, new_char=u'*'):
-        if not idx:
-            return
-        self.vterm.move_cursor_backward(1)
-        self.vterm.write(u'*')
+            self.mask.set_clear(not self.mask.clear)
+
+        # any key hides the revealed character, the renderer shows it
+        # together with the rest of the frame
+        self.mask.hide()
+        result = cb(None, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+        if self.mask.revealed:
+            # after a while the latest typed character becomes an asterisk
+            self.timer = threading.Timer(self.reveal_time, self.on_timer_elapsed)
+            self.timer.daemon = True
+            self.timer.start()
+
+        return result
+
+    def _hide(self):
+        # the timer runs on another thread, the lock keeps it from drawing
+        # in the middle of a frame
+        with self.lock:
+            self.mask.hide()
+            if isinstance(self.render, TransformRenderer):
+                # the cursor is where the latest frame left it
+                idx = self._drawn[1] if self._drawn else self.iline.idx
+                self.render.refresh(self.vterm, idx)
     
-    def on_timer_elapsed(self, event):
-        event.clear()
-        self.replace_previous_char(self.iline.idx)
-        event.set()
+    def on_timer_elapsed(self):
+        self._hide()
 
 
 if __name__ == '__main__':
-    color_idx = 1
-    def colorful_string(cb, *args):
-        global color_idx
-        sys.stdout.write('\033[1;%dm' % ((color_idx % 8) + 30))
-        color_idx += 1
-
-        res = cb(None, *args)
-        sys.stdout.write('\033[0m')
-        return res
+    from highlight import RegexHighlighter
 
     def up(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
         if isinstance(key_event, PrintableChar):
@@ -533,14 +1978,15 @@ if __name__ == '__main__':
             current = current[:-1] + key_event.value
             iline.text = current
 
-        return colorful_string(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+        return cb(None, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
 
-    richline = RichLine()
+    highlighter = RegexHighlighter([
+        (Style(fg=i + 1, bold=True), pattern)
+        for i, pattern in enumerate((u'[A-Z]+', u'[0-9]+', u'[^A-Z0-9 ]+'))])
+    richline = RichLine(highlighter=highlighter)
     text = richline.read(cb=up, prompt='Write what you want, try home key, arrows, canc, word-wrap,...: ')
     print('\nYou wrote: ' + text)
     
     richpw = RichPassword()
-    pw = richpw.read(cb=colorful_string)
+    pw = richpw.read()
     print('\nPw is: ' + pw)
-    
-
@@ -0,0 +1,141 @@
+"""A terminal session for a sequence of prompts (e.g. a wizard).
+
+The terminal is set up once for all the prompts: the terminfo database is
+loaded, the terminal is probed and put in cbreak, nonblocking mode, and a
+single VTerm tracks the cursor from a prompt to the next one.
+"""
+
+from __future__ import print_function
+
+import sys, signal
+
+import probe, terminfo
+from richinput import RichLine, RichPassword, VTerm, NullVTerm, IndexedLine, \
+                      ScrollRenderer, nonblocking_input, read_chunks, \
+                      get_stream_input
+
+class Session(object):
+    """Hand out prompts sharing the same terminal setup.
+
+    >>> with Session() as session:
+    ...     name = session.read(u'Name: ')
+    ...     password = session.read_password(u'Password: ')
+
+    `options` are given to each RichLine (e.g. mouse=True). Whatever is
+    written on the terminal between prompts should go through `write`,
+    otherwise call `sync` before the next prompt.
+    """
+
+    def __init__(self, term=None, keymap=None, **options):
+        self.term = term
+        self.keymap = keymap
+        self.options = options
+        self.vterm = None
+        self.reader = None
+        self.richline = None # the one reading, if any
+        self.interactive = sys.stdin.isatty()
+        self._terminal_mode = None
+        self._sigwinch_handler = None
+
+    def open(self):
+        if not self.term:
+            # like RichLine, no terminfo for the piped input
+            self.term = terminfo.load_terminfo() if self.interactive else terminfo.Terminfo('dumb')
+
+        if not self.interactive:
+            self.vterm = NullVTerm(self.term)
+            self.reader = get_stream_input()
+            return self
+
+        features = probe.get_features(cursor=True)
+        self._sigwinch_handler = signal.getsignal(signal.SIGWINCH)
+        row, col = features.cursor or (1, 1)
+        self.vterm = VTerm(self.term, x=col, y=row)
+
+        synchronized = self.options.pop('synchronized', None)
+        if synchronized is None:
+            synchronized = features.synchronized_output
+        self.vterm.output.synchronized = synchronized
+        if features.truecolor is not None:
+            self.vterm.output.truecolor = features.truecolor
+
+        self._terminal_mode = nonblocking_input()
+        self._terminal_mode.__enter__()
+        self.reader = read_chunks
+        return self
+
+    def close(self):
+        if self._terminal_mode is not None:
+            self.vterm.flush()
+            self._terminal_mode.__exit__(None, None, None)
+            self._terminal_mode = None
+            signal.signal(signal.SIGWINCH, self._sigwinch_handler)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def sync(self):
+        """Ask the terminal where the cursor is, after something has been
+        written bypassing `write`."""
+        if self.interactive:
+            row, col = probe.get_features(cursor=True).cursor or (1, 1)
+            self.vterm.cursor = [col, row]
+
+    def write(self, text):
+        """Write `text` on the terminal, keeping track of the cursor."""
+        self.vterm.write(text)
+        self.vterm.flush()
+
+    def print_above(self, text):
+        """Print `text` above the prompt being read (see
+        RichLine.print_above), or write it."""
+        richline = self.richline
+        if richline is not None:
+            richline.print_above(text)
+        else:
+            self.write(text if text.endswith(u'\n') else text + u'\n')
+
+    def get_richline(self, iline=None, cls=RichLine, **options):
+        """Return a RichLine using the session terminal."""
+        kwargs = dict(self.options, **options)
+        return cls(term=self.term, vterm=self.vterm, iline=iline,
+                   reader=self.reader, keymap=self.keymap, **kwargs)
+
+    def read(self, prompt=u'', cb=None, eot=u'\n', iline=None, timeout=None,
+             **options):
+        """Like RichLine.read. The cursor is left at the start of the next
+        row."""
+        richline = self.get_richline(iline or IndexedLine(), **options)
+        self.richline = richline
+        try:
+            return richline.read(cb, eot, prompt, timeout)
+        finally:
+            self.richline = None
+            self._end_line(richline)
+
+    def read_password(self, prompt=u'', cb=None, eot=u'\n', timeout=None, **options):
+        """Like RichPassword.read."""
+        richline = self.get_richline(IndexedLine(), cls=RichPassword, **options)
+        self.richline = richline
+        try:
+            return richline.read(cb, eot, prompt, timeout)
+        finally:
+            self.richline = None
+            self._end_line(richline)
+
+    def _end_line(self, richline):
+        iline = richline.iline
+        if richline.transform:
+            shown = richline.transform.text
+            self.vterm.move_cursor_forward(
+                shown[richline.transform.to_display(iline.idx):])
+        elif iline.multiline:
+            self.vterm.move_cursor_to(*iline.get_screen_position(len(iline.text)))
+        elif isinstance(richline.render, ScrollRenderer):
+            self.vterm.move_cursor_to(richline.render.end, richline.render.origin[1])
+        else:
+            self.vterm.move_cursor_forward(iline.text[iline.idx:])
+        self.write(u'\n')
@@ -0,0 +1,155 @@
+"""Text attributes (colours, bold, ...), written as the changes from the
+attributes the terminal is using (see output.TermWriter.set_style).
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+
+import terminfo
+
+class Style(namedtuple('Style', 'fg bg bold dim italic underline reverse')):
+    """The attributes of some text. A colour is None (the default of the
+    terminal), an index in the palette (0-255) or an (r, g, b) tuple."""
+
+    __slots__ = ()
+
+    def __new__(cls, fg=None, bg=None, bold=False, dim=False, italic=False,
+                underline=False, reverse=False):
+        return super(Style, cls).__new__(cls, fg, bg, bold, dim, italic,
+                                         underline, reverse)
+
+DEFAULT = Style()
+
+# (attribute, capability setting it, capability resetting only it)
+ATTRIBUTES = (
+    ('bold', 'bold', None),
+    ('dim', 'dim', None),
+    ('italic', 'sitm', 'ritm'),
+    ('underline', 'smul', 'rmul'),
+    ('reverse', 'rev', None),
+)
+
+class StyledText(object):
+    """Text made of runs with different styles.
+
+    >>> StyledText([(u'error: ', Style(fg=1, bold=True)), (u'not found', DEFAULT)])
+    """
+
+    def __init__(self, runs=()):
+        self.runs = []
+        for text, style in runs:
+            self.append(text, style)
+
+    def append(self, text, style=DEFAULT):
+        if not text:
+            return
+        if self.runs and self.runs[-1][1] == style:
+            self.runs[-1] = (self.runs[-1][0] + text, style)
+        else:
+            self.runs.append((text, style))
+
+    @property
+    def text(self):
+        return u''.join(text for text, style in self.runs)
+
+    def __iter__(self):
+        return iter(self.runs)
+
+    def __len__(self):
+        return sum(len(text) for text, style in self.runs)
+
+# the xterm values of the 16 basic colours
+BASIC_COLOURS = (
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+    (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+    (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+)
+
+# the levels of the 6x6x6 colour cube (16-231) of the 256 colours palette
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+
+def get_rgb(index):
+    """Return the (r, g, b) tuple of the palette `index` (0-255)."""
+    if index < 16:
+        return BASIC_COLOURS[index]
+    if index < 232:
+        index -= 16
+        return tuple(CUBE_LEVELS[i] for i in
+                     (index // 36, index // 6 % 6, index % 6))
+    level = 8 + (index - 232) * 10
+    return (level, level, level)
+
+def get_distance(a, b):
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+def nearest(rgb, colors):
+    """Return the index of the colour nearest to `rgb` in a palette of
+    `colors` colours."""
+    if colors >= 256:
+        # the nearest of the cube and of the grey ramp
+        cube = 16 + sum(min(range(6), key=lambda i: abs(CUBE_LEVELS[i] - c)) * m
+                        for c, m in zip(rgb, (36, 6, 1)))
+        grey = 232 + min(23, max(0, (sum(rgb) // 3 - 3) // 10))
+        candidates = (cube, grey)
+    else:
+        candidates = range(min(colors, 16))
+    return min(candidates, key=lambda i: get_distance(rgb, get_rgb(i)))
+
+def get_colour(output, capname, base, colour):
+    """Return the escape code (bytes) setting the foreground (setaf, 38) or
+    background (setab, 48) `colour`, empty if the terminal has no colours.
+
+    (r, g, b) tuples are written as such only if the terminal supports
+    truecolor (`output.truecolor`); they and the palette indexes are mapped
+    to the nearest of the `output.colors` colours otherwise."""
+    if isinstance(colour, tuple) and output.truecolor:
+        return (u'\x1b[%d;2;%d;%d;%dm' % ((base,) + colour)).encode('ascii')
+    if not output.colors or not output.has(capname):
+        return b''
+    if isinstance(colour, tuple):
+        colour = nearest(colour, output.colors)
+    elif colour >= output.colors:
+        colour = nearest(get_rgb(colour), output.colors)
+    return terminfo.tparm(output.term.get(capname).value, colour).encode('iso-8859-1')
+
+def get_transition(output, old, new):
+    """Return the escape codes (bytes) of the terminal of `output` that turn
+    the attributes `old` into `new`. `old` is None if the current
+    attributes are unknown."""
+    codes = bytearray()
+
+    reset = old is None
+    if not reset:
+        for name, on, off in ATTRIBUTES:
+            if getattr(old, name) and not getattr(new, name) and \
+               not (off and output.has(off)):
+                reset = True
+        if (old.fg is not None and new.fg is None or
+            old.bg is not None and new.bg is None) and not output.has('op'):
+            reset = True
+    if reset:
+        if output.has('sgr0'):
+            codes += output.get('sgr0')
+        old = DEFAULT
+
+    for name, on, off in ATTRIBUTES:
+        if getattr(old, name) and not getattr(new, name):
+            codes += output.get(off)
+
+    if old.fg is not None and new.fg is None or old.bg is not None and new.bg is None:
+        # back to the default colours, both of them
+        codes += output.get('op')
+        old = old._replace(fg=None, bg=None)
+
+    for name, on, off in ATTRIBUTES:
+        if getattr(new, name) and not getattr(old, name) and output.has(on):
+            codes += output.get(on)
+
+    if new.fg is not None and new.fg != old.fg:
+        codes += get_colour(output, 'setaf', 38, new.fg)
+    if new.bg is not None and new.bg != old.bg:
+        codes += get_colour(output, 'setab', 48, new.bg)
+
+    return bytes(codes)
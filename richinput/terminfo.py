@@ -1,6 +1,6 @@
 from __future__ import print_function
 
-import os, sys, termios
+import os, re, sys, termios
 import struct
 import itertools
 from fcntl import ioctl
@@ -9,6 +9,125 @@ from collections import OrderedDict
 
 class TerminfoError(Exception): pass
 
+# modifiers of a key, as encoded by xterm in the parameter 1 + mask
+MOD_SHIFT = 1
+MOD_ALT = 2
+MOD_CTRL = 4
+MOD_META = 8
+
+# the parameters of a terminfo string, e.g. %p1%d
+STR_PARAMS = re.compile('%(%' +
+    r'|[-+*/m&\|cisl^=><AO!~]|p[1-9]|[Pg][a-zA-Z]' +
+    r'|((:?[-+# ])?([0-9]+(\.[0-9]+)?)?[doxXs])' +
+    r"|('c'|\{[0-9]+\})" +
+    r"|(\?.*?;)" +
+')')
+
+# a key sequence with parameters, ESC [ params final or ESC O params final
+KEY_PARAMS = re.compile(u'^\x1b(\\[|O)([0-9]*)(?:;([0-9]+))?([\x40-\x7e])$')
+
+# a printf like format of a terminfo string, e.g. %:-3d
+STR_FORMAT = re.compile(r':?([-+# ]*[0-9]*(\.[0-9]+)?)([doxXs])')
+
+def tparm(value, *params):
+    """Return the string capability `value` with its parameters (%p1, %p2, ...)
+    replaced by `params`, see "Parameterized Strings" in man terminfo(5)."""
+    params = list(params) + [0] * (9 - len(params))
+    stack = []
+    variables = {}
+    out = []
+
+    def pop():
+        return stack.pop() if stack else 0
+
+    def skip(i, stop_at_else):
+        # return the index after the %e or %; closing the current level
+        level = 0
+        while i < len(value):
+            if value[i] != '%':
+                i += 1
+                continue
+            c = value[i + 1:i + 2]
+            i += 2
+            if c == '?':
+                level += 1
+            elif c == ';':
+                if not level:
+                    return i
+                level -= 1
+            elif c == 'e' and stop_at_else and not level:
+                return i
+        return i
+
+    binary = {
+        '+': lambda a, b: a + b, '-': lambda a, b: a - b,
+        '*': lambda a, b: a * b, '/': lambda a, b: a // b if b else 0,
+        'm': lambda a, b: a % b if b else 0, '&': lambda a, b: a & b,
+        '|': lambda a, b: a | b, '^': lambda a, b: a ^ b,
+        '=': lambda a, b: int(a == b), '<': lambda a, b: int(a < b),
+        '>': lambda a, b: int(a > b), 'A': lambda a, b: int(bool(a and b)),
+        'O': lambda a, b: int(bool(a or b)),
+    }
+
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c != '%':
+            out.append(c)
+            i += 1
+            continue
+
+        c = value[i + 1:i + 2]
+        i += 2
+        if c == '%':
+            out.append('%')
+        elif c == 'p':
+            stack.append(params[int(value[i]) - 1])
+            i += 1
+        elif c == 'P':
+            variables[value[i]] = pop()
+            i += 1
+        elif c == 'g':
+            stack.append(variables.get(value[i], 0))
+            i += 1
+        elif c == "'":
+            stack.append(ord(value[i]))
+            i += 2
+        elif c == '{':
+            end = value.index('}', i)
+            stack.append(int(value[i:end]))
+            i = end + 1
+        elif c == 'l':
+            stack.append(len(str(pop())))
+        elif c in binary:
+            b, a = pop(), pop()
+            stack.append(binary[c](a, b))
+        elif c == '!':
+            stack.append(int(not pop()))
+        elif c == '~':
+            stack.append(~pop())
+        elif c == 'i':
+            params[0] += 1
+            params[1] += 1
+        elif c == 't':
+            if not pop():
+                i = skip(i, stop_at_else=True)
+        elif c == 'e':
+            # the end of the "then" part, skip the "else" part
+            i = skip(i, stop_at_else=False)
+        elif c in ('?', ';'):
+            pass
+        elif c == 'c':
+            out.append(chr(pop()))
+        else:
+            match = STR_FORMAT.match(value, i - 1)
+            if not match:
+                raise TerminfoError('Unknown parameter %%%s in %r' % (c, value))
+            out.append(('%' + match.group(1) + match.group(3)) % pop())
+            i = match.end()
+
+    return ''.join(out)
+
 def encode_string_decorator(func):
     if sys.version_info[0] < 3:
         def inner(*args, **kwargs):
@@ -24,6 +143,7 @@ class Capability(object):
         self.tcap_code = tcap_code
         self.description = description
         self.value = value
+        self.modifiers = 0 # a mask of MOD_*, for keys
    
     @encode_string_decorator
     def __repr__(self):
@@ -33,6 +153,14 @@ class Capability(object):
                                           .replace(u'\x9b', u'^[')
                                )
 
+    def with_modifiers(self, value, modifiers):
+        """Return a copy of this capability for the key sequence `value`,
+        that is this key pressed with `modifiers`."""
+        cap = self.__class__(self.variable, self.capname, self.tcap_code,
+                             self.description, value)
+        cap.modifiers = modifiers
+        return cap
+
 class BooleanCapability(Capability): pass
 class NumberCapability(Capability): pass
 class StringCapability(Capability): pass
@@ -41,6 +169,10 @@ class UnknownCapability(Capability):
     def __init__(self, *args):
         super(UnknownCapability, self).__init__('unknown')
 
+def is_key(capability):
+    """Check whether `capability` is the code sent by a key."""
+    return capability.capname.startswith('k')
+
 class Terminfo(object):
     def __init__(self, name, aliases=None):
         self.name = name
@@ -54,6 +186,8 @@ class Terminfo(object):
         self._by_capname = {}
         self._by_tcap_code = {}
         self._by_escape_code = {}
+        self._by_key_params = None
+        self._detected = {}
     
 
     def _reset_index(self):
@@ -65,7 +199,26 @@ class Terminfo(object):
             self._by_tcap_code[c.tcap_code] = c
         
         for k,c in self.strings.items():
-            self._by_escape_code[c.value] = c
+            # the keys come first, the codes are detected in the input
+            if is_key(c) or c.value not in self._by_escape_code:
+                self._by_escape_code[c.value] = c
+
+        self._by_key_params = None
+        self._detected = {}
+
+    def _index_key_params(self):
+        """Index the keys by the (parameter, final character) of their
+        sequence, the parts kept when a modifier is added."""
+        index = {}
+        for k,c in self.strings.items():
+            if not is_key(c) or not c.value or \
+               STR_PARAMS.search(c.value):
+                continue
+            match = KEY_PARAMS.match(c.value)
+            if match and not match.group(3):
+                # ESC O C and ESC [ C become ESC [ 1 ; mod C
+                index.setdefault((match.group(2) or '1', match.group(4)), c)
+        self._by_key_params = index
 
     def get(self, name):
         """Get the escape code associated to name.
@@ -83,29 +236,51 @@ class Terminfo(object):
             raise TerminfoError("'%s' is not a valid terminfo entry" % name)
 
     def detect(self, escape_code):
-        import re
-
-        """
-        str_params = '%(%' + \
-            r'|[-+*/m&\|cisl^=><AO!~]|p[1-9]|[Pg][a-zA-Z]' + \
-            r'|((:?[-+# ])?([0-9]+(\.[0-9]+)?)?[doxXs])' + \
-            r"|('c'|\{[0-9]+\})" + \
-            r"|(\?.*?;)" + \
-        ')'
-        """
-
-        cap = self._by_escape_code.get(escape_code, UnknownCapability())
-        cap.value = escape_code
-
-        """
-        pattern = re.compile(str_params)
-        simplified = pattern.sub('', escape_code)
-        print(repr(simplified))
-        """
-
-        #return self._by_escape_code.get(escape_code)
+        """Return the capability whose escape code is `escape_code`.
+        Keys pressed with modifiers (e.g. Ctrl+Right, ESC [ 1 ; 5 C) are
+        returned as a copy of the capability of the key, whose `modifiers`
+        attribute is a mask of MOD_*. UnknownCapability is returned for
+        anything else."""
+        try:
+            return self._detected[escape_code]
+        except KeyError:
+            pass
+
+        cap = self._by_escape_code.get(escape_code)
+        if not cap or not is_key(cap):
+            # e.g. ESC [ C is cuf1, but also the right arrow of a terminal
+            # whose kcuf1 is ESC O C (not in application mode)
+            cap = self._detect_modified(escape_code) or cap
+        if not cap:
+            cap = UnknownCapability()
+            cap.value = escape_code
+
+        if len(self._detected) > 1024:
+            self._detected.clear()
+        self._detected[escape_code] = cap
         return cap
 
+    def _detect_modified(self, escape_code):
+        match = KEY_PARAMS.match(escape_code)
+        if not match:
+            return None
+
+        introducer, param, modifier, final = match.groups()
+        if introducer == u'O' and param and not modifier:
+            # ESC O 5 C, sent by some older terminals
+            param, modifier = u'1', param
+        if self._by_key_params is None:
+            self._index_key_params()
+
+        cap = self._by_key_params.get((param or u'1', final))
+        if not cap:
+            return None
+
+        modifiers = int(modifier) - 1 if modifier else 0
+        if modifiers < 0 or modifiers > 15:
+            return None
+        return cap.with_modifiers(escape_code, modifiers)
+
     def get_size(self):
         rows, cols, height, width = struct.unpack('HHHH',
             ioctl(sys.stdin.fileno(), 
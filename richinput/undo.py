@@ -0,0 +1,137 @@
+from __future__ import print_function
+
+from collections import deque
+
+class Edit(object):
+    """`removed` replaced by `inserted` at `pos`. The cursor was at `idx`."""
+
+    __slots__ = ('pos', 'removed', 'inserted', 'idx')
+
+    def __init__(self, pos, removed, inserted, idx):
+        self.pos = pos
+        self.removed = removed
+        self.inserted = inserted
+        self.idx = idx
+
+    @property
+    def kind(self):
+        """'insert', 'delete' or 'replace'."""
+        if not self.removed:
+            return 'insert'
+        return 'replace' if self.inserted else 'delete'
+
+    def size(self):
+        return len(self.removed) + len(self.inserted) + 1
+
+    def __repr__(self):
+        return '<Edit %s %d %r %r>' % (self.kind, self.pos, self.removed, self.inserted)
+
+class UndoLog(object):
+    """The edits of a text, to undo and redo them.
+
+    Only the edited characters are stored. Consecutive insertions (typing)
+    and deletions (backspace or canc kept pressed) are grouped in a single
+    step, up to `group` characters. When the log holds more than `limit`
+    characters (counting one more for each step) the oldest steps are
+    forgotten. The edits passed to `fold` join the step of the latest
+    recorded edit (e.g. a callback changing what its key typed).
+    """
+
+    def __init__(self, limit=65536, group=32):
+        self.limit = limit
+        self.group = group
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.size = 0
+        self.closed = True # whether the next edit starts a new step
+        self.latest = None # the step of the latest recorded edit
+
+    def record(self, pos, removed, inserted, idx):
+        """Log that `removed` was replaced by `inserted` at `pos`, with the
+        cursor at `idx`."""
+        self.redo_steps = []
+        if not self.closed and self._extend(pos, removed, inserted):
+            self.size += len(removed) + len(inserted)
+        else:
+            edit = Edit(pos, removed, inserted, idx)
+            self.undo_steps.append(edit)
+            self.size += edit.size()
+        self.latest = self.undo_steps[-1]
+        # a replacement (e.g. a paste over a selection) stands alone
+        self.closed = bool(removed and inserted)
+        self._evict()
+
+    def fold(self, text, pos, removed, inserted, idx):
+        """Like `record`, but the edit of `text` becomes part of the step of
+        the latest recorded edit, if any."""
+        last = self.latest
+        if last is None:
+            return self.record(pos, removed, inserted, idx)
+
+        self.redo_steps = []
+        self.size -= last.size()
+        # `text` has `last.inserted` at `last.pos`: merge the two ranges
+        start = min(last.pos, pos)
+        end = max(last.pos + len(last.inserted), pos + len(removed))
+        last.removed = text[start:last.pos] + last.removed + \
+                       text[last.pos + len(last.inserted):end]
+        last.inserted = text[start:pos] + inserted + text[pos + len(removed):end]
+        last.pos = start
+        if last.removed == last.inserted:
+            # the callback reverted its key
+            self.undo_steps.pop()
+            self.latest = None
+            self.closed = True
+        else:
+            self.size += last.size()
+            self.closed = bool(last.removed and last.inserted)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.limit and len(self.undo_steps) > 1:
+            self.size -= self.undo_steps.popleft().size()
+
+    def _extend(self, pos, removed, inserted):
+        last = self.undo_steps[-1]
+        if len(last.removed) + len(last.inserted) >= self.group or \
+           (removed and inserted):
+            return False
+
+        if inserted and not last.removed and pos == last.pos + len(last.inserted):
+            last.inserted += inserted
+        elif removed and not last.inserted and pos + len(removed) == last.pos:
+            # backspace
+            last.pos = pos
+            last.removed = removed + last.removed
+        elif removed and not last.inserted and pos == last.pos:
+            # canc
+            last.removed += removed
+        else:
+            return False
+        return True
+
+    def close(self):
+        """Make the next edit start a new step."""
+        self.closed = True
+
+    def undo(self):
+        """Return the latest step to undo, as an Edit, or None."""
+        self.closed = True
+        self.latest = None
+        if not self.undo_steps:
+            return None
+        edit = self.undo_steps.pop()
+        self.size -= edit.size()
+        self.redo_steps.append(edit)
+        return edit
+
+    def redo(self):
+        """Return the latest undone step to apply again, or None."""
+        self.closed = True
+        self.latest = None
+        if not self.redo_steps:
+            return None
+        edit = self.redo_steps.pop()
+        self.undo_steps.append(edit)
+        self.size += edit.size()
+        return edit
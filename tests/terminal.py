@@ -0,0 +1,202 @@
+"""A fake terminal for the tests: a terminfo entry with the xterm escape
+codes used by richinput, and a small emulator of the screen.
+
+The emulator follows xterm where it matters to the rendering: a character
+written on the last column leaves the cursor there until the next
+character (pending wrap), and the editing functions act on that column.
+"""
+
+from __future__ import print_function
+
+import os, sys, re, tempfile
+from contextlib import contextmanager
+
+try:
+    from unittest import mock
+except ImportError: # Python 2
+    import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'richinput'))
+
+import terminfo
+from terminfo_index import STRING_CAPABILITIES
+from output import TermWriter
+from grapheme import get_width
+from richinput import VTerm
+
+XTERM = {
+    'cub1': u'\x08', 'cuf1': u'\x1b[C', 'cuu1': u'\x1b[A', 'cud1': u'\n',
+    'cuf': u'\x1b[%p1%dC', 'cub': u'\x1b[%p1%dD', 'hpa': u'\x1b[%i%p1%dG',
+    'cr': u'\r', 'el': u'\x1b[K', 'ed': u'\x1b[J',
+    'ich': u'\x1b[%p1%d@', 'dch': u'\x1b[%p1%dP', 'dch1': u'\x1b[P',
+    'smir': u'\x1b[4h', 'rmir': u'\x1b[4l',
+    'sgr0': u'\x1b(B\x1b[m', 'bold': u'\x1b[1m', 'smul': u'\x1b[4m',
+    'rmul': u'\x1b[24m', 'rev': u'\x1b[7m', 'op': u'\x1b[39;49m',
+    'setaf': u'\x1b[3%p1%dm', 'setab': u'\x1b[4%p1%dm',
+    'kcub1': u'\x1bOD', 'kcuf1': u'\x1bOC', 'kcuu1': u'\x1bOA',
+    'kcud1': u'\x1bOB', 'khome': u'\x1bOH', 'kend': u'\x1bOF',
+    'kdch1': u'\x1b[3~',
+}
+
+def get_terminfo(capabilities=XTERM):
+    term = terminfo.Terminfo('xterm', ['xterm-test'])
+    for entry in STRING_CAPABILITIES:
+        if entry[1] in capabilities:
+            cap = terminfo.StringCapability(*entry, value=capabilities[entry[1]])
+            term.strings[cap.variable] = cap
+    term.numbers['max_colors'] = terminfo.NumberCapability(
+        'max_colors', 'colors', 'Co', '', 8)
+    term._reset_index()
+    return term
+
+CSI = re.compile(u'\x1b\\[([?]?)([0-9;]*)([\x40-\x7e])')
+
+class Screen(object):
+    """The cells of a `width` x `height` terminal, with the cursor at
+    column `x`, row `y` (1-based)."""
+
+    def __init__(self, width, height, x=1, y=1):
+        self.width = width
+        self.height = height
+        self.rows = [[u' '] * width for i in range(height)]
+        self.x, self.y = x - 1, y - 1
+        self.wrap = False # the cursor is past the last column
+        self.insert = False
+
+    @property
+    def cursor(self):
+        return [self.x + 1, self.y + 1]
+
+    @property
+    def lines(self):
+        return [u''.join(row).rstrip() for row in self.rows]
+
+    def feed(self, data):
+        text = data.decode('utf-8')
+        i = 0
+        while i < len(text):
+            c = text[i]
+            if c == u'\x1b':
+                match = CSI.match(text, i)
+                if match:
+                    self._csi(*match.groups())
+                    i = match.end()
+                else:
+                    # ESC ( B and the like
+                    i += 3 if text[i + 1:i + 2] == u'(' else 2
+                continue
+            if c == u'\r':
+                self.x, self.wrap = 0, False
+            elif c == u'\n':
+                # output post processing (onlcr)
+                self.x, self.wrap = 0, False
+                self._linefeed()
+            elif c == u'\x08':
+                self.x, self.wrap = max(0, self.x - 1), False
+            else:
+                self._put(c)
+            i += 1
+
+    def _linefeed(self):
+        if self.y == self.height - 1:
+            self.rows.pop(0)
+            self.rows.append([u' '] * self.width)
+        else:
+            self.y += 1
+
+    def _put(self, c):
+        width = get_width(c)
+        row = self.rows[self.y]
+        if not width:
+            # combining character, on the previous cell
+            x = self.x if self.wrap else max(0, self.x - 1)
+            row[x] += c
+            return
+
+        if self.wrap or self.x + width > self.width:
+            self.x, self.wrap = 0, False
+            self._linefeed()
+            row = self.rows[self.y]
+        if self.insert:
+            row[self.x:self.x] = [u' '] * width
+            del row[self.width:]
+        row[self.x:self.x + width] = [c] + [u''] * (width - 1)
+        if self.x + width >= self.width:
+            self.x, self.wrap = self.width - 1, True
+        else:
+            self.x += width
+
+    def _csi(self, private, params, final):
+        if private:
+            return
+        values = [int(p) if p else 0 for p in params.split(u';')]
+        n = values[0] or 1
+        row = self.rows[self.y]
+        if final in u'ABCDG@PJK':
+            self.wrap = False
+        if final == u'A':
+            self.y = max(0, self.y - n)
+        elif final == u'B':
+            self.y = min(self.height - 1, self.y + n)
+        elif final == u'C':
+            self.x = min(self.width - 1, self.x + n)
+        elif final == u'D':
+            self.x = max(0, self.x - n)
+        elif final == u'G':
+            self.x = min(self.width, n) - 1
+        elif final == u'@':
+            row[self.x:self.x] = [u' '] * n
+            del row[self.width:]
+        elif final == u'P':
+            del row[self.x:self.x + n]
+            row.extend([u' '] * (self.width - len(row)))
+        elif final == u'K':
+            row[self.x:] = [u' '] * (self.width - self.x)
+        elif final == u'J':
+            row[self.x:] = [u' '] * (self.width - self.x)
+            for i in range(self.y + 1, self.height):
+                self.rows[i] = [u' '] * self.width
+        elif final in u'hl' and values[0] == 4:
+            self.insert = final == u'h'
+
+class Terminal(object):
+    """A VTerm writing to a Screen."""
+
+    def __init__(self, width=80, height=24, x=1, y=1):
+        self.term = get_terminfo()
+        self.screen = Screen(width, height, x, y)
+        self.file = tempfile.TemporaryFile()
+        self.vterm = VTerm.__new__(VTerm)
+        self.vterm.term = self.term
+        self.vterm.cursor = [x, y]
+        self.vterm.size = (width, height)
+        self.vterm.gaps = set()
+        self.vterm.output = TermWriter(self.term, fd=self.file.fileno(),
+                                       encoding='utf-8')
+        self.written = b''
+
+    def update(self):
+        """Show on the screen what has been written, and return it."""
+        self.vterm.flush()
+        self.file.seek(len(self.written))
+        data = self.file.read()
+        self.written += data
+        self.screen.feed(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+def keys(*chunks):
+    """A reader for RichLine yielding `chunks`, a key press each."""
+    def reader(prompt=u'', deadline=None, idle=None):
+        for chunk in chunks:
+            yield chunk
+    return reader
+
+@contextmanager
+def interactive():
+    """Make RichLine believe that the standard input is a terminal."""
+    with mock.patch.object(sys.stdin, 'isatty', return_value=True):
+        yield
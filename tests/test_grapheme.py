@@ -0,0 +1,60 @@
+from __future__ import print_function
+
+import random
+import unittest
+
+from terminal import get_width
+
+from grapheme import ClusterIndex, iter_boundaries, get_column_index
+
+CHARACTERS = [u'a', u'b', u'\u0301', u'\u200d', u'\U0001F468', u'\U0001F1EB',
+              u'\U0001F1F7', u'\r', u'\n', u'\u1100', u'\u1161', u'\u11a8',
+              u'\u4e2d']
+
+class TestClusterIndex(unittest.TestCase):
+
+    def check(self, index, text):
+        boundaries = [0] + list(iter_boundaries(text))
+        self.assertEqual([index[i] for i in range(len(index))], boundaries)
+        for idx in range(len(text) + 1):
+            floor = max(b for b in boundaries if b <= idx)
+            self.assertEqual(index.floor(idx), floor)
+
+    def test_random_edits(self):
+        rand = random.Random(0)
+        def random_text(size):
+            return u''.join(rand.choice(CHARACTERS) for i in range(size))
+
+        for trial in range(200):
+            text = random_text(rand.randint(0, 12))
+            index = ClusterIndex(text)
+            for edit in range(10):
+                pos = rand.randint(0, len(text))
+                removed = rand.randint(0, len(text) - pos)
+                inserted = random_text(rand.randint(0, 3))
+                text = text[:pos] + inserted + text[pos + removed:]
+                index.update(text, pos, removed, len(inserted))
+                self.check(index, text)
+
+    def test_typing_keeps_the_tail(self):
+        # the boundaries after the cursor aren't moved by the edits before it
+        text = u'x' * 100
+        index = ClusterIndex(text)
+        for pos in range(50, 70, 2):
+            text = text[:pos] + u'e\u0301' + text[pos:]
+            index.update(text, pos, 0, 2)
+            self.assertEqual(len(index._after), 50)
+        self.check(index, text)
+
+class TestColumnIndex(unittest.TestCase):
+
+    def test_wide_and_zero_width(self):
+        text = u'a\u4e2de\u0301b'
+        self.assertEqual(get_width(text), 5)
+        self.assertEqual([get_column_index(text, 0, col) for col in range(6)],
+                         [0, 1, 1, 2, 4, 5])
+        self.assertEqual(get_column_index(text, 5, -2), 2)
+        self.assertEqual(get_column_index(text, 5, -4), 1)
+
+if __name__ == '__main__':
+    unittest.main()
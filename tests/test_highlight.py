@@ -0,0 +1,124 @@
+from __future__ import print_function
+
+import random
+import unittest
+
+from terminal import Terminal, keys, interactive
+
+import richinput
+from highlight import RegexHighlighter, Tokenization
+from style import Style
+
+NUMBER = Style(fg=1)
+KEYWORD = Style(fg=4, bold=True)
+
+def get_highlighter():
+    return RegexHighlighter([(NUMBER, r'\d+'), (KEYWORD, r'\bif\b')])
+
+class TestTokenization(unittest.TestCase):
+
+    def setUp(self):
+        self.highlighter = get_highlighter()
+
+    def edit(self, text, pos, removed, inserted):
+        """Apply the edit to a Tokenization of `text`, check its tokens and
+        return the damage range."""
+        tokenization = Tokenization(self.highlighter, text)
+        new_text = text[:pos] + inserted + text[pos + removed:]
+        damage = tokenization.update(new_text, pos, removed, len(inserted))
+        self.assertEqual(tokenization.tokens,
+                         list(self.highlighter.lex(new_text, 0)))
+        return damage
+
+    def test_typing_inside_a_token(self):
+        self.assertEqual(self.edit(u'x 12 if y', 3, 0, u'3'), (3, 5))
+
+    def test_restyling_before_the_edit(self):
+        # 'if' stops being a keyword
+        self.assertEqual(self.edit(u'x if y', 4, 0, u'f'), (2, 7))
+
+    def test_restyling_after_the_edit(self):
+        # 'if' becomes a keyword again
+        self.assertEqual(self.edit(u'x aif y', 2, 1, u''), (2, 6))
+
+    def test_the_tail_only_moves(self):
+        text = u'if 1 ' * 100
+        start, end = self.edit(text, 0, 0, u'a')
+        self.assertEqual(start, 0)
+        self.assertLess(end, 10)
+
+    def test_typing_keeps_the_tail(self):
+        # the tokens after the cursor aren't moved by the edits before it
+        text = u'if 1 ' * 100
+        tokenization = Tokenization(self.highlighter, text)
+        for pos in range(250, 260):
+            text = text[:pos] + u'x' + text[pos:]
+            tokenization.update(text, pos, 0, 1)
+            self.assertGreater(len(tokenization._after), 140)
+        self.assertEqual(tokenization.tokens,
+                         list(self.highlighter.lex(text, 0)))
+
+    def test_deleting(self):
+        self.assertEqual(self.edit(u'12 34 if', 1, 3, u''), (1, 2))
+
+    def test_random_edits(self):
+        rand = random.Random(0)
+        def random_text(size):
+            return u''.join(rand.choice(u'if 12') for i in range(size))
+
+        for trial in range(100):
+            text = random_text(rand.randint(0, 12))
+            tokenization = Tokenization(self.highlighter, text)
+            for edit in range(10):
+                pos = rand.randint(0, len(text))
+                removed = rand.randint(0, len(text) - pos)
+                inserted = random_text(rand.randint(0, 3))
+                old = Tokenization(self.highlighter, text)
+                new_text = text[:pos] + inserted + text[pos + removed:]
+                start, end = tokenization.update(new_text, pos, removed, len(inserted))
+                self.assertEqual(tokenization.tokens,
+                                 list(self.highlighter.lex(new_text, 0)))
+
+                # the styles outside of the damage range didn't change
+                delta = len(inserted) - removed
+                new = list(tokenization.iter_tokens(0, len(new_text)))
+                for i in list(range(start)) + list(range(end, len(new_text))):
+                    j = i if i < start else i - delta
+                    self.assertEqual(new_text[i], text[j])
+                    self.assertEqual(get_style(new, i), get_style(old.tokens, j))
+                text = new_text
+
+    def test_iter_tokens(self):
+        tokenization = Tokenization(self.highlighter, u'x 12 if')
+        tokenization.update(u'x 12 if 3', 7, 0, 2)
+        self.assertEqual(list(tokenization.iter_tokens(3, 9)),
+                         [(3, 4, NUMBER), (4, 5, None), (5, 7, KEYWORD),
+                          (7, 8, None), (8, 9, NUMBER)])
+
+def get_style(tokens, i):
+    for start, end, style in tokens:
+        if start <= i < end:
+            return style
+
+class TestHighlightRenderer(unittest.TestCase):
+
+    def test_typing_before_a_long_text(self):
+        # the rest of the row is shifted, not written again
+        terminal = Terminal(width=1000, height=5)
+        chunks = [u'if 1 ' * 160, u'\x1bOH', u'a', u'b']
+        written = []
+        with interactive():
+            richline = richinput.RichLine(term=terminal.term, vterm=terminal.vterm,
+                                          reader=keys(*chunks), synchronized=False,
+                                          highlighter=get_highlighter())
+            terminal.vterm.output.write(u'> ')
+            for event in richline.__iter__(prompt=u'> '):
+                written.append(terminal.update())
+        terminal.update()
+        self.assertEqual(terminal.screen.lines[0][:10], u'> abif 1 i')
+        self.assertEqual(terminal.screen.cursor, terminal.vterm.cursor)
+        self.assertLess(len(written[-1]), 40)
+        terminal.close()
+
+if __name__ == '__main__':
+    unittest.main()
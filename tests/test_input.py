@@ -0,0 +1,185 @@
+from __future__ import print_function
+
+import io, os, sys
+import unittest
+
+from terminal import Terminal, get_terminfo, keys, interactive, mock
+
+import richinput, terminfo
+from session import Session
+
+class TestCoalescing(unittest.TestCase):
+
+    def read(self, chunks, **options):
+        """Return the events of `chunks`, and for each one how many chunks
+        had been read when it was yielded."""
+        read = [0]
+        def reader(prompt=u''):
+            for chunk in chunks:
+                read[0] += 1
+                yield chunk
+
+        events = []
+        for event in richinput.get_rich_char(term=get_terminfo(), reader=reader,
+                                             **options):
+            events.append((get_name(event), event.count, read[0]))
+        return events
+
+    def test_repeated_keys_are_merged(self):
+        events = self.read([u'\x1bOD\x1bOD\x1bOD', u'a'], merge_repeats=True)
+        self.assertEqual(events, [(u'kcub1', 3, 1), (u'a', 1, 2)])
+
+    def test_incomplete_sequence_isnt_waited_for(self):
+        # the keys already decoded are yielded before the rest of the
+        # sequence arrives
+        events = self.read([u'\x1bOD\x1bOD\x1b', u'OD'], merge_repeats=True)
+        self.assertEqual(events, [(u'kcub1', 2, 1), (u'kcub1', 1, 2)])
+
+    def test_interrupted_sequence(self):
+        events = self.read([u'\x08\x08\x1b[1;\x1b', u'OD'], merge_repeats=True)
+        self.assertEqual(events, [(u'\x08', 2, 1), (u'kcub1', 1, 2)])
+
+    def test_incomplete_mouse_report(self):
+        events = self.read([u'\x1b[<64;1;1M\x1b[<64;1;1M\x1b[<64', u';1;1M'],
+                           mouse=True)
+        self.assertEqual(events, [(u'mouse', 2, 1), (u'mouse', 1, 2)])
+
+class TestKeyReport(unittest.TestCase):
+    """The keys reported by the kitty keyboard protocol (CSI code ; mods u)
+    are decoded as their legacy encoding where there is one."""
+
+    def decode(self, sequence):
+        return richinput.decode_key_report(sequence, get_terminfo())
+
+    def check(self, sequence, cls, value, modifiers=None):
+        event = self.decode(sequence)
+        self.assertIsInstance(event, cls)
+        self.assertEqual(event.value, value)
+        if modifiers is not None:
+            self.assertEqual(event.capability.modifiers, modifiers)
+
+    def test_escape(self):
+        self.check(u'\x1b[27u', richinput.ControlKey, u'\x1b')
+
+    def test_ctrl_letter(self):
+        self.check(u'\x1b[97;5u', richinput.ControlKey, u'\x01')
+
+    def test_alt_letter(self):
+        self.check(u'\x1b[97;3u', richinput.EscapeSequence, u'\x1ba',
+                   terminfo.MOD_ALT)
+
+    def test_shift(self):
+        self.check(u'\x1b[97;2u', richinput.PrintableChar, u'A')
+        # the shifted key given by the terminal, on its keyboard layout
+        self.check(u'\x1b[49:33;2u', richinput.PrintableChar, u'!')
+
+    def test_lock_keys_are_ignored(self):
+        # Ctrl with caps lock, and with caps lock and num lock
+        self.check(u'\x1b[97;69u', richinput.ControlKey, u'\x01')
+        self.check(u'\x1b[97;197u', richinput.ControlKey, u'\x01')
+
+    def test_other_modifiers(self):
+        self.check(u'\x1b[13;5u', richinput.EscapeSequence, u'\x1b[13;5u',
+                   terminfo.MOD_CTRL)
+        self.check(u'\x1b[97;9u', richinput.EscapeSequence, u'\x1b[97;9u',
+                   terminfo.MOD_META)
+
+    def test_private_use_keys(self):
+        # keypad 0, a modifier key
+        self.assertIsNone(self.decode(u'\x1b[57399u'))
+        self.assertIsNone(self.decode(u'\x1b[57441;2u'))
+
+    def test_not_a_code_point(self):
+        self.assertIsNone(self.decode(u'\x1b[1114112u'))
+        self.assertIsNone(self.decode(u'\x1b[99999999999999999999u'))
+
+    def test_pattern(self):
+        match = richinput.KEY_REPORT.match(u'\x1b[97:65:98;6:1;106u')
+        self.assertEqual(match.groups(), (u'97', u'65', u'6'))
+        self.assertIsNone(richinput.KEY_REPORT.match(u'\x1b[Au'))
+        self.assertIsNone(richinput.KEY_REPORT.match(u'\x1b[97;5~'))
+
+class TestMouseTracking(unittest.TestCase):
+    """The motions with a button pressed (mode 1002) are reported only if
+    asked for."""
+
+    def get_modes(self, **options):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            for event in richinput.get_rich_char(term=get_terminfo(),
+                                                 reader=keys(u'a'), mouse=True,
+                                                 **options):
+                pass
+        return stdout.getvalue()
+
+    def test_clicks(self):
+        self.assertEqual(self.get_modes(),
+                         u'\x1b[?1000h\x1b[?1006h\x1b[?1006l\x1b[?1000l')
+
+    def test_motion(self):
+        self.assertEqual(self.get_modes(mouse_motion=True),
+                         u'\x1b[?1000h\x1b[?1002h\x1b[?1006h'
+                         u'\x1b[?1006l\x1b[?1002l\x1b[?1000l')
+
+    def test_richline(self):
+        terminal = Terminal()
+        with interactive(), \
+             mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            richinput.RichLine(term=terminal.term, vterm=terminal.vterm,
+                               reader=keys(u'a', u'\n'), synchronized=False,
+                               mouse=True, mouse_motion=True).read()
+        self.assertIn(u'\x1b[?1002h', stdout.getvalue())
+        terminal.close()
+
+    def test_session(self):
+        terminal = Terminal()
+        session = Session(term=terminal.term, mouse=True, mouse_motion=True,
+                          synchronized=False)
+        # as if opened on the terminal
+        session.vterm = terminal.vterm
+        session.reader = keys(u'a', u'\n')
+        with interactive(), \
+             mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            self.assertEqual(session.read(), u'a')
+        self.assertIn(u'\x1b[?1002h', stdout.getvalue())
+        terminal.close()
+
+class TestPipedInput(unittest.TestCase):
+    """Without a terminal $TERM isn't looked up: its entry may be missing or
+    in a format that can't be read."""
+
+    def setUp(self):
+        fd, write_fd = os.pipe()
+        self.reader = richinput.StreamInput(fd)
+        os.write(write_fd, b'first\nsecond\n')
+        os.close(write_fd)
+        self.piped = mock.patch.object(sys.stdin, 'isatty', return_value=False)
+        self.piped.start()
+
+    def tearDown(self):
+        self.piped.stop()
+        os.close(self.reader.fd)
+
+    def test_richline(self):
+        for name, line in ((u'xterm', u'first'), (u'no-such-terminal', u'second')):
+            with mock.patch.dict(os.environ, TERM=name):
+                richline = richinput.RichLine(reader=self.reader)
+                self.assertEqual(richline.term.name, u'dumb')
+                self.assertEqual(richline.read(), line)
+
+    def test_session(self):
+        with mock.patch.dict(os.environ, TERM=u'no-such-terminal'), \
+             mock.patch('session.get_stream_input', return_value=self.reader):
+            with Session() as session:
+                self.assertEqual(session.term.name, u'dumb')
+                self.assertEqual(session.read(), u'first')
+                self.assertEqual(session.read(), u'second')
+                self.assertRaises(EOFError, session.read)
+
+def get_name(event):
+    capability = getattr(event, 'capability', None)
+    if hasattr(event, 'is_click'):
+        return u'mouse'
+    return capability.capname if capability else event.value
+
+if __name__ == '__main__':
+    unittest.main()
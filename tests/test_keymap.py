@@ -0,0 +1,33 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import Terminal, keys, interactive
+
+import richinput
+
+class TestRepeatedKeys(unittest.TestCase):
+    """A key kept pressed comes as one event with a count (merge_repeats),
+    that the actions repeat."""
+
+    def read(self, chunks):
+        terminal = Terminal()
+        with interactive():
+            richline = richinput.RichLine(term=terminal.term, vterm=terminal.vterm,
+                                          reader=keys(*chunks), synchronized=False,
+                                          merge_repeats=True)
+            for event in richline.__iter__():
+                pass
+        terminal.close()
+        return richline.iline.text
+
+    def test_yank(self):
+        # C-w, then C-y three times
+        self.assertEqual(self.read([u'a', u'b', u'\x17', u'\x19\x19\x19']), u'ababab')
+
+    def test_undo(self):
+        # two C-_
+        self.assertEqual(self.read([u'a', u'\x17', u'b', u'\x1f\x1f']), u'a')
+
+if __name__ == '__main__':
+    unittest.main()
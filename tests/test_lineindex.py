@@ -0,0 +1,86 @@
+from __future__ import print_function
+
+import random
+import unittest
+
+import terminal # richinput on sys.path
+
+from lineindex import FenwickTree, LineIndex
+
+class TestFenwickTree(unittest.TestCase):
+
+    def test_prefix_and_find(self):
+        tree = FenwickTree([3, 0, 2, 5])
+        self.assertEqual([tree.prefix(i) for i in range(5)], [0, 3, 3, 5, 10])
+        self.assertEqual(tree.find(2), (0, 0))
+        self.assertEqual(tree.find(3), (2, 3))
+        self.assertEqual(tree.find(10), (4, 10))
+        tree.set(1, 4)
+        self.assertEqual(tree.prefix(2), 7)
+        self.assertEqual(tree.find(6), (1, 3))
+
+class TestLineIndex(unittest.TestCase):
+
+    def test_rows(self):
+        # '> ' then 'ab', 'cdefgh' on two rows and 'i'
+        index = LineIndex(u'ab\ncdefgh\ni', width=5, offset=2)
+        self.assertEqual(index.get_row_count(), 4)
+        self.assertEqual(index.get_position(0), (0, 2))
+        self.assertEqual(index.get_position(8), (2, 0))
+        self.assertEqual(index.get_position(11), (3, 1))
+        self.assertEqual(index.get_index(1, 3), 6)
+        self.assertEqual(index.get_index(2, 4), 9)
+        self.assertEqual(index.get_index(5, 0), 11)
+
+    def test_line_filling_the_row(self):
+        # an interior line that fills its row takes one row, its end is
+        # shown at the start of the next line
+        index = LineIndex(u'abc\nde', width=5, offset=2)
+        self.assertEqual(index.get_row_count(), 2)
+        self.assertEqual(index.get_position(3), (1, 0))
+        self.assertEqual(index.get_position(3, end_of_row=True), (0, 5))
+        self.assertEqual(index.get_position(4), (1, 0))
+
+    def test_last_line_filling_the_row(self):
+        # the cursor goes to the next row after it
+        index = LineIndex(u'de\nabcde', width=5)
+        self.assertEqual(index.get_row_count(), 3)
+        self.assertEqual(index.get_position(8), (2, 0))
+
+    def test_rows_change_when_a_line_stops_being_the_last(self):
+        text = u'abcde'
+        index = LineIndex(text, width=5)
+        self.assertEqual(index.get_row_count(), 2)
+        index.update(text + u'\n', 5, 0, 1)
+        self.assertEqual(index.get_row_count(), 2)
+        index.update(text, 5, 1, 0)
+        self.assertEqual(index.get_row_count(), 2)
+        self.assertEqual(index.get_position(5), (1, 0))
+
+    def test_set_width(self):
+        index = LineIndex(u'abcdef\ngh', width=10, offset=2)
+        self.assertEqual(index.get_row_count(), 2)
+        index.set_width(4, offset=0)
+        self.assertEqual(index.get_row_count(), 3)
+        self.assertEqual(index.get_position(7), (2, 0))
+
+    def test_random_edits(self):
+        rand = random.Random(0)
+        text = u''
+        index = LineIndex(text, width=4, offset=1)
+        for edit in range(500):
+            pos = rand.randint(0, len(text))
+            removed = rand.randint(0, min(3, len(text) - pos))
+            inserted = u''.join(rand.choice(u'ab\n') for i in range(rand.randint(0, 3)))
+            text = text[:pos] + inserted + text[pos + removed:]
+            index.update(text, pos, removed, len(inserted))
+
+            expected = LineIndex(text, width=4, offset=1)
+            self.assertEqual(index.lengths, expected.lengths)
+            self.assertEqual(index.get_row_count(), expected.get_row_count())
+            for idx in range(len(text) + 1):
+                self.assertEqual(index.get_position(idx),
+                                 expected.get_position(idx))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import Terminal, keys, interactive
+
+import richinput
+from highlight import RegexHighlighter
+from session import Session
+from style import Style
+
+PASSWORD = u'hunter2'
+
+class TestPassword(unittest.TestCase):
+    """Whatever the options, a password is never written in clear: at most
+    the latest typed character is shown for a moment."""
+
+    def setUp(self):
+        self.terminal = Terminal(width=40, height=10)
+        self.highlighter = RegexHighlighter([(Style(bold=True), u'[a-z]+')])
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def check_hidden(self, password):
+        self.assertEqual(password, PASSWORD)
+        self.terminal.update()
+        written = self.terminal.written.decode('utf-8')
+        for i in range(len(PASSWORD) - 1):
+            self.assertNotIn(PASSWORD[i:i + 2], written)
+        self.assertEqual(self.terminal.screen.lines[0], u'*' * len(PASSWORD))
+
+    def test_read(self):
+        with interactive():
+            richpw = richinput.RichPassword(
+                term=self.terminal.term, vterm=self.terminal.vterm,
+                reader=keys(*(PASSWORD + u'\n')), synchronized=False)
+            self.check_hidden(richpw.read())
+
+    def test_highlighter(self):
+        with interactive():
+            richpw = richinput.RichPassword(
+                term=self.terminal.term, vterm=self.terminal.vterm,
+                reader=keys(*(PASSWORD + u'\n')), synchronized=False,
+                highlighter=self.highlighter)
+            self.check_hidden(richpw.read())
+
+    def test_session_options(self):
+        with interactive():
+            session = Session(term=self.terminal.term, highlighter=self.highlighter,
+                              horizontal_scroll=True, synchronized=False)
+            session.vterm = self.terminal.vterm
+            session.reader = keys(*(PASSWORD + u'\n'))
+            self.check_hidden(session.read_password())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import Terminal, keys, interactive, mock
+
+import richinput
+from picker import Picker, FuzzyMatcher
+
+CANDIDATES = [u'apple', u'banana', u'cherry', u'grape', u'pear']
+
+class RecordingMatcher(FuzzyMatcher):
+    """Remember whether each update was stale when it started."""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingMatcher, self).__init__(*args, **kwargs)
+        self.stale = []
+
+    def update(self, query, is_stale=lambda: False):
+        self.stale.append((query, is_stale()))
+        return super(RecordingMatcher, self).update(query, is_stale)
+
+class TestPicker(unittest.TestCase):
+
+    def setUp(self):
+        self.terminal = Terminal(width=40, height=20)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def get_picker(self, chunks, matcher=None):
+        richline = richinput.RichLine(term=self.terminal.term, vterm=self.terminal.vterm,
+                                      reader=keys(*chunks), synchronized=False)
+        return Picker(CANDIDATES, height=3, matcher=matcher, richline=richline)
+
+    def test_keys_already_read_stop_the_scan(self):
+        matcher = RecordingMatcher(CANDIDATES)
+        with interactive(), mock.patch('richinput.is_input_pending', return_value=False):
+            picker = self.get_picker([u'ape', u'\n'], matcher)
+            self.assertEqual(picker.pick(), u'grape')
+        self.assertEqual(matcher.stale[:3], [(u'a', True), (u'ap', True), (u'ape', False)])
+
+    def test_the_matcher_is_closed(self):
+        with interactive(), mock.patch('richinput.is_input_pending', return_value=False), \
+             mock.patch.object(FuzzyMatcher, 'close') as close:
+            picker = self.get_picker([u'pe', u'\n'])
+            self.assertEqual(picker.pick(), u'pear')
+        self.assertEqual(close.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
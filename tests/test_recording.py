@@ -0,0 +1,42 @@
+from __future__ import print_function
+
+import io, unittest
+
+from terminal import Terminal, keys, interactive, mock
+
+import richinput
+from idle import IdleQueue
+from recording import Recorder, Replayer, load_recording, INPUT
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.terminal = Terminal(width=40, height=10)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def get_richline(self, reader, **options):
+        return richinput.RichLine(term=self.terminal.term, vterm=self.terminal.vterm,
+                                  reader=reader, synchronized=False, **options)
+
+    def test_record_with_timeout_and_idle(self):
+        f = io.BytesIO()
+        with interactive(), \
+             mock.patch('recording.get_terminal_size', return_value=(40, 10)):
+            recorder = Recorder(f, reader=keys(u'ab', u'c', u'\n'))
+            richline = self.get_richline(recorder, idle=IdleQueue())
+            self.assertEqual(richline.read(timeout=5), u'abc')
+
+        f.seek(0)
+        chunks = [value for kind, seconds, value in load_recording(f) if kind == INPUT]
+        self.assertEqual(chunks, [u'ab', u'c', u'\n'])
+
+    def test_replay_with_timeout(self):
+        records = [(INPUT, 0.0, u'ab'), (INPUT, 0.0, u'\n')]
+        with interactive():
+            richline = self.get_richline(Replayer(records).reader)
+            self.assertEqual(richline.read(timeout=5), u'ab')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import Terminal, keys, interactive
+
+import richinput
+from display import Grouping
+from highlight import RegexHighlighter
+from style import Style
+
+LEFT = u'\x1bOD'
+
+def type_keys(terminal, chunks, prompt=u'', **options):
+    """Read `chunks` with a RichLine on `terminal`, updating the screen at
+    each key. Return the RichLine."""
+    with interactive():
+        richline = richinput.RichLine(term=terminal.term, vterm=terminal.vterm,
+                                      reader=keys(*chunks), synchronized=False,
+                                      **options)
+        # the reader shows the prompt, outside of the VTerm
+        terminal.vterm.output.write(prompt)
+        for event in richline.__iter__(prompt=prompt):
+            terminal.update()
+    terminal.update()
+    return richline
+
+class TestRowEdges(unittest.TestCase):
+    """The text wraps on narrow terminals, and the edits must not lose the
+    cursor when they cross the end of a row."""
+
+    def setUp(self):
+        self.terminal = None
+
+    def tearDown(self):
+        if self.terminal:
+            self.terminal.close()
+
+    def check(self, width, chunks, lines, prompt=u''):
+        self.terminal = Terminal(width=width, height=10)
+        richline = type_keys(self.terminal, chunks, prompt)
+        screen = self.terminal.screen
+        self.assertEqual(screen.lines[:len(lines)], lines)
+        self.assertEqual(screen.cursor, self.terminal.vterm.cursor)
+        return richline
+
+    def test_typing_past_the_first_row(self):
+        self.check(7, u'abcdefghijklmnopq', [u'abcdefg', u'hijklmn', u'opq'])
+
+    def test_typing_after_a_prompt(self):
+        text = u'abcdefghijklmnopqrstuvwxyz'
+        self.check(20, text, [u'>>> abcdefghijklmnop', u'qrstuvwxyz'],
+                   prompt=u'>>> ')
+
+    def test_insert_across_the_row_edge(self):
+        chunks = list(u'ab x ycc') + [LEFT, u'Z']
+        self.check(7, chunks, [u'ab x yc', u'Zc'])
+
+    def test_insert_before_a_full_row(self):
+        chunks = list(u'abcdefgh') + [LEFT] * 6 + [u'Z']
+        self.check(7, chunks, [u'abZcdef', u'gh'])
+
+    def test_delete_across_the_row_edge(self):
+        chunks = list(u'abcdefghij') + [LEFT] * 4 + [u'\x7f']
+        self.check(7, chunks, [u'abcdegh', u'ij'])
+
+    def test_backspace_at_the_start_of_a_row(self):
+        chunks = list(u'abcdefgh') + [u'\x7f', u'\x7f', u'X']
+        self.check(7, chunks, [u'abcdefX'])
+
+    def test_moving_back_to_the_previous_row(self):
+        chunks = list(u'abcdefghi') + [LEFT] * 3 + [u'Z']
+        self.check(7, chunks, [u'abcdefZ', u'ghi'])
+
+class TestWideCharacters(unittest.TestCase):
+    """A wide character that doesn't fit at the end of a row is shown on
+    the next one, leaving the last column blank."""
+
+    def setUp(self):
+        self.terminal = Terminal(width=5, height=10)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def check(self, chunks, lines):
+        richline = type_keys(self.terminal, chunks, prompt=u'> ')
+        screen = self.terminal.screen
+        self.assertEqual(screen.lines[:len(lines)], lines)
+        self.assertEqual(screen.cursor, self.terminal.vterm.cursor)
+        return richline
+
+    def test_typing_past_the_row_edge(self):
+        self.check([u'a', u'b', u'\u4e2d', u'c'], [u'> ab', u'\u4e2dc'])
+        self.assertEqual(self.terminal.screen.cursor, [4, 2])
+
+    def test_moving_back_over_the_row_edge(self):
+        chunks = [u'a', u'b', u'\u4e2d', u'c'] + [LEFT] * 3 + [u'Z']
+        self.check(chunks, [u'> aZb', u'\u4e2dc'])
+
+    def test_filling_the_blank_column(self):
+        chunks = [u'a', u'b', u'\u4e2d', u'c', LEFT, LEFT, u'Z']
+        self.check(chunks, [u'> abZ', u'\u4e2dc'])
+
+    def test_editing_at_the_start(self):
+        HOME = u'\x1bOH'
+        chunks = [u'\u4e2d', u'\u4e2d', u'\u6587', HOME, u'\u4e2d', u'\x7f',
+                  HOME, u'b']
+        self.check(chunks, [u'> b\u4e2d', u'\u4e2d\u6587'])
+
+    def test_deleting_before_the_row_edge(self):
+        # the wide character fits again at the end of the first row
+        chunks = [u'a', u'b', u'\u4e2d', u'c', LEFT, LEFT, u'\x7f']
+        self.check(chunks, [u'> a\u4e2d', u'c'])
+
+class TestCombiningMarks(unittest.TestCase):
+    """A combining mark typed after a character filling the row is written
+    together with it, or it would start the next row alone."""
+
+    def setUp(self):
+        self.terminal = Terminal(width=5, height=10)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def check(self, chunks, lines, **options):
+        type_keys(self.terminal, chunks, prompt=u'> ', **options)
+        screen = self.terminal.screen
+        self.assertEqual(screen.lines[:len(lines)], lines)
+        self.assertEqual(screen.cursor, self.terminal.vterm.cursor)
+
+    def test_mark_after_a_full_row(self):
+        self.check([u'b', u'b', u'e', u'\u0301'], [u'> bbe\u0301', u''])
+
+    def test_mark_after_a_full_row_highlighted(self):
+        # the mark is in a token of its own
+        highlighter = RegexHighlighter([(Style(bold=True), u'e')])
+        self.check([u'b', u'b', u'e', u'\u0301', u'x'], [u'> bbe\u0301', u'x'],
+                   highlighter=highlighter)
+
+class TestHorizontalScroll(unittest.TestCase):
+
+    def setUp(self):
+        self.terminal = Terminal(width=20, height=5)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def check(self, chunks, line):
+        richline = type_keys(self.terminal, chunks, prompt=u'> ',
+                             horizontal_scroll=True)
+        self.assertEqual(self.terminal.screen.lines[0], line)
+        self.assertEqual(self.terminal.screen.cursor, self.terminal.vterm.cursor)
+        return richline
+
+    def test_typing_past_the_width(self):
+        self.check(u'abcdefghijklmnopqrstuvwxyz0123', u'> <wxyz0123')
+
+    def test_deleting_back_to_the_left_marker(self):
+        # some text stays visible before the cursor
+        chunks = list(u'abcdefghijklmnopqrstuvwxyz0123') + [u'\x7f'] * 8
+        self.check(chunks, u'> <opqrstuv')
+
+    def test_moving_back_to_the_left_marker(self):
+        chunks = list(u'abcdefghijklmnopqrstuvwxyz0123') + [LEFT] * 8
+        richline = self.check(chunks, u'> <opqrstuvwxyz0123')
+        self.assertEqual(self.terminal.screen.cursor, [12, 1])
+
+UP, DOWN, END = u'\x1bOA', u'\x1bOB', u'\x1bOF'
+
+class TestMultiLine(unittest.TestCase):
+
+    def setUp(self):
+        self.terminal = Terminal(width=5, height=10)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def check(self, chunks, lines):
+        richline = type_keys(self.terminal, chunks, prompt=u'> ',
+                             iline=richinput.MultiLine())
+        screen = self.terminal.screen
+        self.assertEqual(screen.lines[:len(lines) + 1], lines + [u''])
+        self.assertEqual(screen.cursor, self.terminal.vterm.cursor)
+        self.assertEqual(screen.cursor,
+                         list(richline.iline.get_screen_position(richline.iline.idx)))
+        return richline
+
+    def test_lines(self):
+        self.check(list(u'ab\ncdefgh\ni'), [u'> ab', u'cdefg', u'h', u'i'])
+
+    def test_line_filling_the_row(self):
+        # the newline after a full row doesn't add a row
+        richline = self.check([u'a', u'b', u'\n', u'd', UP, END, u'c', DOWN, u'e'],
+                              [u'> abc', u'de'])
+        self.assertEqual(richline.iline.text, u'abc\nde')
+
+    def test_newline_after_a_full_row(self):
+        self.check(list(u'abc\nd') + [UP, END, u'\n'], [u'> abc', u'', u'd'])
+
+    def test_deleting_a_line(self):
+        self.check(list(u'ab\ncd\nef') + [UP, END] + [u'\x7f'] * 3,
+                   [u'> ab', u'ef'])
+
+def click(x, y):
+    """The SGR report of a left click at column `x`, row `y`."""
+    return u'\x1b[<0;%d;%dM' % (x, y)
+
+class TestMouseClick(unittest.TestCase):
+    """A click moves the cursor on the cluster shown in the clicked cell."""
+
+    def setUp(self):
+        self.terminal = Terminal(width=20, height=5)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def click(self, text, x, y=1, **options):
+        richline = type_keys(self.terminal, list(text) + [click(x, y)],
+                             prompt=u'> ', mouse=True, **options)
+        self.assertEqual(self.terminal.screen.cursor, self.terminal.vterm.cursor)
+        return richline.iline.idx
+
+    def test_plain_text(self):
+        self.assertEqual(self.click(u'abcdef', 5), 2)
+
+    def test_wide_characters(self):
+        # a at column 3, the ideographs at 4-5 and 6-7, b at 8
+        self.assertEqual(self.click(u'a\u4e2d\u6587b', 6), 2)
+        self.assertEqual(self.terminal.screen.cursor, [6, 1])
+
+    def test_second_half_of_a_wide_character(self):
+        self.assertEqual(self.click(u'a\u4e2d\u6587b', 5), 1)
+
+    def test_zero_width_characters(self):
+        # e with a combining acute accent takes column 4
+        self.assertEqual(self.click(u'xe\u0301yz', 3), 0)
+
+    def test_transform(self):
+        # shown as 'abcd efgh', f at column 9
+        self.assertEqual(self.click(u'abcdefgh', 9, transform=Grouping()), 5)
+
+    def test_multiline(self):
+        text = [u'ab', u'\n', u'\u4e2d\u6587x']
+        self.assertEqual(self.click(text, 5, 2, iline=richinput.MultiLine()), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import Terminal
+
+from style import Style, DEFAULT, get_transition
+
+# setaf of xterm-256color
+SETAF_256 = (u'\x1b[%?%p1%{8}%<%t3%p1%d%e%p1%{16}%<%t9%p1%{8}%-%d'
+             u'%e38;5;%p1%d%;m')
+
+class TestColours(unittest.TestCase):
+    """The colours are mapped to what the terminal supports (8 colours and
+    no truecolor for the test entry)."""
+
+    def setUp(self):
+        self.terminal = Terminal()
+        self.output = self.terminal.vterm.output
+        self.output.truecolor = False
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def transition(self, new):
+        return get_transition(self.output, DEFAULT, new)
+
+    def test_palette_index(self):
+        self.assertEqual(self.transition(Style(fg=4)), b'\x1b[34m')
+
+    def test_index_out_of_the_palette(self):
+        self.assertEqual(self.transition(Style(fg=200)), b'\x1b[35m')
+        self.assertEqual(self.transition(Style(bg=9)), b'\x1b[41m')
+
+    def test_rgb_without_truecolor(self):
+        self.assertEqual(self.transition(Style(fg=(0, 10, 230))), b'\x1b[34m')
+
+    def test_rgb_with_truecolor(self):
+        self.output.truecolor = True
+        self.assertEqual(self.transition(Style(fg=(0, 10, 230))),
+                         b'\x1b[38;2;0;10;230m')
+
+    def test_256_colours(self):
+        self.output._colors = 256
+        self.output.term.get('setaf').value = SETAF_256
+        self.assertEqual(self.transition(Style(fg=(255, 0, 0))),
+                         b'\x1b[38;5;196m')
+        self.assertEqual(self.transition(Style(fg=(128, 128, 128))),
+                         b'\x1b[38;5;244m')
+
+    def test_no_colours(self):
+        self.output._colors = 0
+        self.assertEqual(self.transition(Style(fg=3, bold=True)), b'\x1b[1m')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import get_terminfo, XTERM
+
+import terminfo
+from terminfo import MOD_SHIFT, MOD_ALT, MOD_CTRL
+
+# the keys of the test entry, plus F1 and F5
+KEYS = dict(XTERM, kf1=u'\x1bOP', kf5=u'\x1b[15~')
+
+class TestModifiedKeys(unittest.TestCase):
+    """A key pressed with modifiers is sent as its sequence with the
+    modifiers as a parameter (ESC [ 1 ; mods C for ESC O C)."""
+
+    def setUp(self):
+        self.term = get_terminfo(KEYS)
+
+    def check(self, sequence, capname, modifiers):
+        cap = self.term.detect(sequence)
+        self.assertEqual(cap.capname, capname)
+        self.assertEqual(cap.modifiers, modifiers)
+        self.assertEqual(cap.value, sequence)
+
+    def test_arrow(self):
+        self.check(u'\x1b[1;5C', 'kcuf1', MOD_CTRL)
+        self.check(u'\x1b[1;4D', 'kcub1', MOD_SHIFT | MOD_ALT)
+
+    def test_tilde_key(self):
+        self.check(u'\x1b[3;5~', 'kdch1', MOD_CTRL)
+        self.check(u'\x1b[15;2~', 'kf5', MOD_SHIFT)
+
+    def test_ss3_key(self):
+        # sent by some older terminals
+        self.check(u'\x1bO5P', 'kf1', MOD_CTRL)
+
+    def test_unmodified_csi_key(self):
+        # the right arrow out of the application mode, also the value of cuf1
+        self.check(u'\x1b[C', 'kcuf1', 0)
+        self.check(u'\x1b[1;1C', 'kcuf1', 0)
+
+    def test_modifiers_out_of_range(self):
+        self.check(u'\x1b[1;16C', 'kcuf1', 15)
+        for sequence in (u'\x1b[1;0C', u'\x1b[1;17C', u'\x1b[1;99999C'):
+            self.assertIsInstance(self.term.detect(sequence),
+                                  terminfo.UnknownCapability)
+
+    def test_unknown_key(self):
+        self.assertIsInstance(self.term.detect(u'\x1b[9;5~'),
+                              terminfo.UnknownCapability)
+
+class TestKeyParamsIndex(unittest.TestCase):
+
+    def test_index(self):
+        term = get_terminfo(KEYS)
+        term._index_key_params()
+        index = dict((key, cap.capname) for key, cap in term._by_key_params.items())
+        self.assertEqual(index[(u'1', u'C')], 'kcuf1')
+        self.assertEqual(index[(u'1', u'P')], 'kf1')
+        self.assertEqual(index[(u'3', u'~')], 'kdch1')
+        self.assertEqual(index[(u'15', u'~')], 'kf5')
+        # only the keys, and no parametrized capabilities
+        self.assertTrue(all(name.startswith('k') for name in index.values()))
+
+    def test_reset(self):
+        term = get_terminfo(KEYS)
+        term.detect(u'\x1b[1;5C')
+        self.assertIsNotNone(term._by_key_params)
+        term._reset_index()
+        self.assertIsNone(term._by_key_params)
+
+class TestDetectMemo(unittest.TestCase):
+
+    def test_same_capability(self):
+        term = get_terminfo(KEYS)
+        cap = term.detect(u'\x1b[1;5C')
+        self.assertIs(term.detect(u'\x1b[1;5C'), cap)
+        # a copy: the capability of the key is left unmodified
+        self.assertIsNot(cap, term.get('kcuf1'))
+        self.assertEqual(term.get('kcuf1').modifiers, 0)
+
+    def test_unknown_sequences(self):
+        term = get_terminfo(KEYS)
+        cap = term.detect(u'\x1b[99x')
+        self.assertIs(term.detect(u'\x1b[99x'), cap)
+        self.assertEqual(cap.value, u'\x1b[99x')
+
+    def test_reset(self):
+        term = get_terminfo(KEYS)
+        cap = term.detect(u'\x1b[1;5C')
+        term._reset_index()
+        self.assertIsNot(term.detect(u'\x1b[1;5C'), cap)
+
+    def test_bounded(self):
+        term = get_terminfo(KEYS)
+        for i in range(2000):
+            term.detect(u'\x1b[%dx' % i)
+        self.assertLessEqual(len(term._detected), 1025)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from __future__ import print_function
+
+import time, threading, unittest
+
+from terminal import Terminal, keys, interactive
+
+import richinput
+
+class TestDrawingFromThreads(unittest.TestCase):
+
+    def setUp(self):
+        self.terminal = Terminal(width=40, height=10)
+
+    def tearDown(self):
+        self.terminal.close()
+
+    def test_reveal_timer_during_a_callback(self):
+        # the timer hiding the typed character fires while a callback is
+        # drawing the next key
+        def slow(render, *args):
+            time.sleep(0.1)
+            return render(None, *args)
+
+        with interactive():
+            richpw = richinput.RichPassword(
+                term=self.terminal.term, vterm=self.terminal.vterm,
+                reader=keys(u'a', u'b', u'c', u'\n'), synchronized=False)
+            richpw.reveal_time = 0.05
+            thread = threading.Thread(target=richpw.read, kwargs={'cb': slow})
+            thread.daemon = True
+            thread.start()
+            thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.terminal.update()
+        self.assertEqual(self.terminal.screen.lines[0], u'***')
+        self.assertEqual(self.terminal.screen.cursor, self.terminal.vterm.cursor)
+
+    def test_print_above_while_the_caller_has_a_key(self):
+        with interactive():
+            richline = richinput.RichLine(
+                term=self.terminal.term, vterm=self.terminal.vterm,
+                reader=keys(u'abc', u'\x1bOD', u'd'), synchronized=False)
+            self.terminal.vterm.output.write(u'> ')
+            for event in richline.__iter__(prompt=u'> '):
+                if event[0].value == u'\x1bOD':
+                    # the drawing lock isn't held by the loop body
+                    thread = threading.Thread(target=richline.flush_logs)
+                    richline.print_above(u'log')
+                    thread.start()
+                    thread.join(5)
+                    self.assertFalse(thread.is_alive())
+
+        self.terminal.update()
+        self.assertEqual(self.terminal.screen.lines[:2], [u'log', u'> abdc'])
+        self.assertEqual(self.terminal.screen.cursor, [6, 2])
+        self.assertEqual(self.terminal.vterm.cursor, [6, 2])
+
+if __name__ == '__main__':
+    unittest.main()
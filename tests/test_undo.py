@@ -0,0 +1,106 @@
+from __future__ import print_function
+
+import unittest
+
+from terminal import Terminal, keys, interactive
+
+import richinput
+from undo import UndoLog
+
+class TestUndoLog(unittest.TestCase):
+
+    def test_typing_is_grouped(self):
+        log = UndoLog(group=3)
+        for pos, char in enumerate(u'abcd'):
+            log.record(pos, u'', char, pos)
+        edit = log.undo()
+        self.assertEqual((edit.pos, edit.inserted), (3, u'd'))
+        edit = log.undo()
+        self.assertEqual((edit.pos, edit.inserted, edit.idx), (0, u'abc', 0))
+        self.assertIsNone(log.undo())
+
+    def test_backspace_and_canc_are_grouped(self):
+        log = UndoLog()
+        log.record(3, u'd', u'', 4)
+        log.record(2, u'c', u'', 3)
+        log.record(2, u'e', u'', 2)
+        edit = log.undo()
+        self.assertEqual((edit.pos, edit.removed, edit.idx), (2, u'cde', 4))
+
+    def test_replacement_stands_alone(self):
+        log = UndoLog()
+        log.record(0, u'', u'a', 0)
+        log.record(0, u'a', u'b', 1)
+        log.record(1, u'', u'c', 1)
+        self.assertEqual([edit.kind for edit in log.undo_steps],
+                         ['insert', 'replace', 'insert'])
+
+    def test_oldest_steps_are_forgotten(self):
+        log = UndoLog(limit=10)
+        log.record(0, u'', u'abc', 0)
+        log.close()
+        log.record(3, u'', u'def', 3)
+        log.close()
+        log.record(6, u'', u'ghi', 6)
+        self.assertEqual([edit.inserted for edit in log.undo_steps],
+                         [u'def', u'ghi'])
+        self.assertEqual(log.size, 8)
+
+    def test_redo(self):
+        log = UndoLog()
+        log.record(0, u'', u'a', 0)
+        log.close()
+        log.record(1, u'', u'b', 1)
+        self.assertEqual(log.undo().inserted, u'b')
+        self.assertEqual(log.undo().inserted, u'a')
+        self.assertEqual(log.redo().inserted, u'a')
+        # a new edit drops what could be redone
+        log.record(1, u'', u'c', 1)
+        self.assertIsNone(log.redo())
+        self.assertEqual(log.undo().inserted, u'c')
+
+    def test_fold(self):
+        log = UndoLog()
+        log.record(2, u'', u'c', 2)
+        # 'abc' -> 'aBC'
+        log.fold(u'abc', 1, u'bc', u'BC', 3)
+        edit = log.undo()
+        self.assertEqual((edit.pos, edit.removed, edit.inserted), (1, u'b', u'BC'))
+
+    def test_fold_reverting_the_step(self):
+        log = UndoLog()
+        log.record(0, u'', u'a', 0)
+        log.close()
+        log.record(1, u'', u'b', 1)
+        log.fold(u'ab', 1, u'b', u'', 2)
+        self.assertEqual(log.undo().inserted, u'a')
+        self.assertIsNone(log.undo())
+
+    def test_fold_without_a_recorded_step(self):
+        log = UndoLog()
+        log.record(0, u'', u'a', 0)
+        log.undo()
+        log.fold(u'', 0, u'', u'b', 0)
+        self.assertEqual(log.undo().inserted, u'b')
+
+class TestCallbackEdits(unittest.TestCase):
+
+    def test_undo_what_a_callback_changed(self):
+        # the callback of the README, its edits are undone with the key
+        def up(cb, key_event, term, vterm, iline, previous, current, prev_idx, next_idx):
+            if isinstance(key_event, richinput.PrintableChar):
+                key_event.value = key_event.value.upper()
+                current = current[:-1] + key_event.value
+                iline.text = current
+            return cb(None, key_event, term, vterm, iline, previous, current, prev_idx, next_idx)
+
+        terminal = Terminal()
+        with interactive():
+            richline = richinput.RichLine(term=terminal.term, vterm=terminal.vterm,
+                                          reader=keys(u'a', u'b', u'c', u'\x1f', u'\n'),
+                                          synchronized=False)
+            self.assertEqual(richline.read(cb=up), u'')
+        terminal.close()
+
+if __name__ == '__main__':
+    unittest.main()